@@ -0,0 +1,44 @@
+"""
+Background work for uploaded documents (parsing, translation pipelines).
+
+Work runs on a small per-process thread pool and is submitted when the
+current transaction commits, so it never sees rows that were rolled back
+and the request that started it is not held up. It keeps the trace
+context of the code that submitted it, so its spans share the request ID.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from utils.tracing import in_current_context
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.DOCUMENT_BACKGROUND_WORKERS, thread_name_prefix='documents'
+            )
+    return _executor
+
+
+def _run_in_thread(fn, args):
+    # Runs in a worker thread: give it a clean DB connection and close it after
+    close_old_connections()
+    try:
+        fn(*args)
+    finally:
+        close_old_connections()
+
+
+def submit_on_commit(fn, *args):
+    """Run fn(*args) on the background pool after the current transaction commits"""
+    run = in_current_context(_run_in_thread)
+    transaction.on_commit(lambda: _get_executor().submit(run, fn, args))
@@ -0,0 +1,247 @@
+"""
+On-disk assembly of chunked uploads.
+
+Each chunk is streamed through an incremental gzip decoder into its own
+part file (written under a temporary name, then renamed into place), so
+chunks may arrive out of order, in parallel, or again after a retry. The
+part files themselves are the record of what has been received: it
+survives restarts and is shared by every worker on the host, so an
+interrupted upload resumes by sending only the missing indices.
+
+When the last part lands, one request wins an exclusive marker file and
+concatenates the parts into the final file in a single sequential pass,
+with os.sendfile doing the copy in the kernel where available.
+
+Uploads that stop arriving leave their parts behind; sweep_stale_parts()
+removes those that have received nothing for a while (see the
+sweep_uploads management command).
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import zlib
+
+GZIP_MAGIC = b"\x1f\x8b"
+READ_SIZE = 64 * 1024
+
+ASSEMBLY_MARKER = ".assembling"
+PART_SUFFIX = ".part"
+
+
+class ChunkError(ValueError):
+    """A chunk was malformed or inconsistent with its upload"""
+
+
+class ChunkTooLarge(ChunkError):
+    """A chunk decompressed to more than the bytes it was allowed"""
+
+
+def job_dir(root, job_id):
+    return os.path.join(root, str(job_id))
+
+
+def parts_dir(root, job_id, file_name):
+    # Hashed, so any file name maps to a safe directory name
+    key = hashlib.sha256(file_name.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(job_dir(root, job_id), ".parts", key)
+
+
+def part_path(directory, index):
+    return os.path.join(directory, f"{index:06d}{PART_SUFFIX}")
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def part_size(directory, index):
+    """Size of a stored part, 0 if it hasn't arrived"""
+    return _file_size(part_path(directory, index))
+
+
+def job_bytes(root, job_id):
+    """
+    Bytes a job holds on disk: assembled files, received parts and parts
+    being written
+    """
+    total = 0
+    for directory, _, names in os.walk(job_dir(root, job_id)):
+        total += sum(_file_size(os.path.join(directory, name)) for name in names)
+    return total
+
+
+def _decoded(source, first):
+    """
+    Yield the decompressed contents of source, READ_SIZE at a time
+
+    Output is bounded per step, so a small compressed chunk can't expand
+    into memory all at once.
+    """
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = first
+    while data:
+        while data:
+            yield decoder.decompress(data, READ_SIZE)
+            data = decoder.unconsumed_tail
+        if decoder.eof:
+            break
+        data = source.read(READ_SIZE)
+    yield decoder.flush()
+    if not decoder.eof:
+        raise ChunkError("Truncated gzip stream")
+
+
+def _raw(source, first):
+    data = first
+    while data:
+        yield data
+        data = source.read(READ_SIZE)
+
+
+def write_chunk(directory, index, source, expected_size=None, max_bytes=None):
+    """
+    Stream one chunk, gzip-compressed or not, to its part file
+
+    Args:
+        directory (str): parts_dir() of the file being uploaded
+        index (int): Chunk index
+        source: File-like object with the chunk body
+        expected_size (int): Decompressed size the client reported, if any
+        max_bytes (int): Largest decompressed chunk accepted
+
+    Returns:
+        int: Decompressed bytes written
+
+    Raises:
+        ChunkError: Bad gzip data, or the size is wrong
+        ChunkTooLarge: More than max_bytes after decompression
+    """
+    os.makedirs(directory, exist_ok=True)
+    first = source.read(READ_SIZE)
+    pieces = _decoded(source, first) if first[:2] == GZIP_MAGIC else _raw(source, first)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for piece in pieces:
+                written += len(piece)
+                if max_bytes is not None and written > max_bytes:
+                    raise ChunkTooLarge(f"Chunk {index} is larger than {max_bytes} bytes")
+                f.write(piece)
+        if expected_size is not None and written != expected_size:
+            raise ChunkError(f"Chunk {index} is {written} bytes, expected {expected_size}")
+        # Retries of a chunk simply replace the earlier copy
+        os.replace(tmp_path, part_path(directory, index))
+    except zlib.error as e:
+        _remove(tmp_path)
+        raise ChunkError(f"Chunk {index} is not valid gzip: {e}") from e
+    except BaseException:
+        _remove(tmp_path)
+        raise
+    return written
+
+
+def received_chunks(directory):
+    """
+    Returns:
+        list: Sorted indices of the chunks stored so far
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-len(PART_SUFFIX)]) for name in names if name.endswith(PART_SUFFIX))
+
+
+def _copy(source, target):
+    offset = 0
+    try:
+        while True:
+            sent = os.sendfile(target.fileno(), source.fileno(), offset, 1 << 30)
+            if sent == 0:
+                return
+            offset += sent
+    except (AttributeError, OSError):
+        # No sendfile, or not between these files: copy in user space
+        source.seek(offset)
+        shutil.copyfileobj(source, target, READ_SIZE * 16)
+
+
+def assemble(directory, total_chunks, output_path):
+    """
+    Concatenate parts 1..total_chunks into output_path and remove them
+
+    Safe to call from several requests at once: only one assembles.
+
+    Returns:
+        bool: True if this call assembled the file
+    """
+    try:
+        fd = os.open(os.path.join(directory, ASSEMBLY_MARKER), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.close(fd)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    try:
+        with open(tmp_path, "wb") as target:
+            for index in range(1, total_chunks + 1):
+                with open(part_path(directory, index), "rb") as source:
+                    target.flush()  # sendfile writes past Python's buffer
+                    _copy(source, target)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        _remove(tmp_path)
+        _remove(os.path.join(directory, ASSEMBLY_MARKER))
+        raise
+    shutil.rmtree(directory, ignore_errors=True)
+    return True
+
+
+def sweep_stale_parts(root, max_age):
+    """
+    Delete the parts of uploads that have received no chunk for max_age
+    seconds, including any whose assembly died midway
+
+    A directory's mtime changes whenever a part is renamed into it, so it
+    is the time of the last chunk.
+
+    Returns:
+        int: Part directories removed
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        jobs = os.listdir(root)
+    except FileNotFoundError:
+        return 0
+    for job in jobs:
+        uploads = os.path.join(root, job, ".parts")
+        try:
+            names = os.listdir(uploads)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for name in names:
+            directory = os.path.join(uploads, name)
+            try:
+                if os.stat(directory).st_mtime >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue  # assembled meanwhile
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
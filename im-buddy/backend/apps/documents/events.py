@@ -0,0 +1,111 @@
+"""
+Server-sent events for upload jobs.
+
+GET /api/upload/<jobId>/events streams one "status" event per change to
+the job's state (see jobs.py), each with the state version as its id, and
+ends after the job completes or fails. A comment line goes out every
+JOB_EVENTS_HEARTBEAT seconds of silence so proxies keep the connection
+open. Streams are closed after JOB_EVENTS_MAX_DURATION; EventSource then
+reconnects with Last-Event-ID and picks up from that version.
+
+Under ASGI the view streams async_event_stream(): Django only streams an
+async iterator as it is produced there (a sync generator would be
+collected in full before the first byte is sent), and waiting holds no
+thread. Under WSGI, event_stream() holds a thread per open stream, so
+serve with threaded workers rather than a small pool of sync workers.
+"""
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer
+
+from .jobs import FINAL_STATUSES, get_job_state, job_registry
+
+# Reconnect delay EventSource should use, in milliseconds
+RETRY_MS = 3000
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets DRF negotiate text/event-stream; only error responses are
+    rendered by it, events themselves are streamed by the view
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f'event: error\ndata: {json.dumps(data)}\n\n'.encode('utf-8')
+
+
+def format_event(state):
+    payload = {key: value for key, value in state.items() if key != 'user_id'}
+    return f"id: {state['version']}\nevent: status\ndata: {json.dumps(payload)}\n\n"
+
+
+def _catch_up(state, last_version):
+    """
+    Messages that open a stream: the retry delay and, unless the client
+    already has it, the current state
+
+    Returns:
+        tuple: (messages, version the client has after them)
+    """
+    messages = [f'retry: {RETRY_MS}\n\n']
+    if last_version > state['version']:
+        # From before the job's row was recreated; versions started over
+        last_version = 0
+    if last_version == 0 or state['version'] > last_version:
+        messages.append(format_event(state))
+        last_version = state['version']
+    return messages, last_version
+
+
+def event_stream(job, last_version=0):
+    """
+    Yield SSE messages for a job's state changes after last_version
+
+    Args:
+        job (UploadJob): Job to follow (ownership already checked)
+        last_version (int): Last-Event-ID from a reconnecting client, or 0
+    """
+    state = get_job_state(job)
+    messages, last_version = _catch_up(state, last_version)
+    yield from messages
+
+    deadline = time.monotonic() + settings.JOB_EVENTS_MAX_DURATION
+    while state['status'] not in FINAL_STATUSES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        changed = job_registry.wait(job.job_id, last_version, min(settings.JOB_EVENTS_HEARTBEAT, remaining))
+        if changed is None:
+            yield ': keep-alive\n\n'
+            continue
+        state = changed
+        last_version = state['version']
+        yield format_event(state)
+
+
+async def async_event_stream(job, last_version=0):
+    """event_stream() for ASGI: each message is sent as soon as it is yielded"""
+    state = await sync_to_async(get_job_state)(job)
+    messages, last_version = _catch_up(state, last_version)
+    for message in messages:
+        yield message
+
+    deadline = time.monotonic() + settings.JOB_EVENTS_MAX_DURATION
+    while state['status'] not in FINAL_STATUSES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        changed = await job_registry.await_change(
+            job.job_id, last_version, min(settings.JOB_EVENTS_HEARTBEAT, remaining)
+        )
+        if changed is None:
+            yield ': keep-alive\n\n'
+            continue
+        state = changed
+        last_version = state['version']
+        yield format_event(state)
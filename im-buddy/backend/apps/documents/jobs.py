@@ -0,0 +1,186 @@
+"""
+Live status of upload jobs, for the event stream and the polling fallback.
+
+Each job's state - overall status plus the status and progress of every
+stage in STAGES - is stored on its UploadJob row, with a version number
+that grows with every change. publish() is called where work happens
+(chunk receipt, parsing, pipeline stages) and updates the row under a
+row lock; readers either fetch the current state or wait for a version
+newer than the one they have.
+
+The row is the only source of truth, so every worker process sees the
+same versions, and a version is never reused (a restart or a cache flush
+can't make an old ETag or Last-Event-ID look current again).
+
+- Within a process, waiters are woken by publish() - threads through a
+  threading.Condition, async streams through an asyncio.Event - so
+  events are pushed the moment they happen.
+- Across workers, waiters re-read the version every
+  JOB_EVENTS_POLL_INTERVAL; one single-row query.
+"""
+import asyncio
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .models import UploadJob
+
+STAGES = ('upload', 'parse', 'detect_language', 'extract_fields', 'glossary', 'translate', 'quality_check', 'render',
+          'input_extraction', 'phase2')
+
+STAGE_PENDING = 'pending'
+STAGE_RUNNING = 'running'
+STAGE_DONE = 'done'
+STAGE_FAILED = 'failed'
+
+FINAL_STATUSES = ('complete', 'error')
+
+STATE_FIELDS = ('job_id', 'user_id', 'status', 'state_version', 'stages', 'updated_at')
+
+
+def _pending_stage():
+    return {'status': STAGE_PENDING, 'progress': 0.0, 'detail': None}
+
+
+def job_state(job):
+    """
+    The state dict of a job
+
+    Args:
+        job (UploadJob or dict): Row, or its STATE_FIELDS values
+    """
+    values = job if isinstance(job, dict) else {field: getattr(job, field) for field in STATE_FIELDS}
+    stored = values['stages'] or {}
+    return {
+        'job_id': str(values['job_id']),
+        'user_id': values['user_id'],
+        'status': values['status'],
+        'version': values['state_version'],
+        'stages': {stage: stored.get(stage) or _pending_stage() for stage in STAGES},
+        'updated_at': values['updated_at'].timestamp(),
+    }
+
+
+class JobRegistry:
+    """Versioned job states on UploadJob rows, with in-process change notification"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # Bumped by every publish() in this process, so a waiter can tell
+        # whether it missed a notification between reading and waiting
+        self._generation = 0
+        self._async_waiters = set()
+
+    def get(self, job_id):
+        """
+        Returns:
+            dict: The job's state, or None if there is no such job
+        """
+        values = UploadJob.objects.filter(job_id=job_id).values(*STATE_FIELDS).first()
+        return job_state(values) if values else None
+
+    def publish(self, job, status=None, stage=None, stage_status=None, progress=None, detail=None):
+        """
+        Record a change to a job and wake anyone waiting on it
+
+        Args:
+            job (UploadJob): Job that changed
+            status (str): New overall status
+            stage (str): One of STAGES, if a stage changed
+            stage_status (str): New status of that stage
+            progress (float): Stage progress, 0 to 1
+            detail: Anything JSON-serializable describing the stage
+
+        Returns:
+            dict: The new state
+        """
+        with transaction.atomic():
+            row = UploadJob.objects.select_for_update().only(*STATE_FIELDS).get(pk=job.pk)
+            update_fields = ['state_version', 'stages', 'updated_at']
+            if status is not None:
+                row.status = status
+                update_fields.append('status')
+            if stage is not None:
+                row.stages = dict(row.stages or {})
+                entry = row.stages.setdefault(stage, _pending_stage())
+                if stage_status is not None:
+                    entry['status'] = stage_status
+                    if stage_status == STAGE_DONE:
+                        entry['progress'] = 1.0
+                if progress is not None:
+                    entry['progress'] = round(progress, 3)
+                if detail is not None:
+                    entry['detail'] = detail
+            row.state_version += 1
+            row.save(update_fields=update_fields)
+        self._notify()
+        return job_state(row)
+
+    def _notify(self):
+        with self._lock:
+            self._generation += 1
+            self._changed.notify_all()
+            for loop, event in list(self._async_waiters):
+                try:
+                    loop.call_soon_threadsafe(event.set)
+                except RuntimeError:
+                    pass  # loop already closed
+
+    def wait(self, job_id, after_version, timeout):
+        """
+        Wait for a state newer than after_version
+
+        Returns:
+            dict: The newer state, or None if none arrived within timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                generation = self._generation
+            state = self.get(job_id)
+            if state is not None and state['version'] > after_version:
+                return state
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with self._lock:
+                # Woken early by a publish() in this process; the poll
+                # interval bounds how late we see other workers' changes
+                if self._generation == generation:
+                    self._changed.wait(min(remaining, settings.JOB_EVENTS_POLL_INTERVAL))
+
+    async def await_change(self, job_id, after_version, timeout):
+        """wait() for async code: holds no thread while waiting"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            waiter = (loop, asyncio.Event())
+            # Registered before reading, so a publish() in between still wakes us
+            with self._lock:
+                self._async_waiters.add(waiter)
+            try:
+                state = await sync_to_async(self.get)(job_id)
+                if state is not None and state['version'] > after_version:
+                    return state
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), min(remaining, settings.JOB_EVENTS_POLL_INTERVAL))
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                with self._lock:
+                    self._async_waiters.discard(waiter)
+
+
+job_registry = JobRegistry()
+
+
+def get_job_state(job):
+    """Current state of a job, read from its row"""
+    return job_registry.get(job.job_id) or job_state(job)
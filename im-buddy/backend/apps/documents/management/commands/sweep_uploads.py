@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.documents.chunks import sweep_stale_parts
+from apps.documents.parsing import claim_stuck_parse, parse_document, stuck_parses
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the parts of uploads that stopped arriving, and parse again "
+        "documents whose parse was lost (e.g. in a restart). Run it from cron "
+        "or after deploys."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=settings.UPLOAD_PARTS_MAX_AGE,
+                            help='Delete parts of uploads without a chunk for this many seconds')
+        parser.add_argument('--skip-reparse', action='store_true',
+                            help='Only delete stale parts')
+
+    def handle(self, *args, **options):
+        removed = sweep_stale_parts(settings.UPLOAD_DIR, options['max_age'])
+        self.stdout.write(f"Removed {removed} stale upload(s)")
+        if options['skip_reparse']:
+            return
+
+        reparsed = 0
+        for document_id in stuck_parses().values_list('pk', flat=True):
+            # Another worker may have claimed it since the query
+            if claim_stuck_parse(document_id):
+                document = parse_document(document_id)
+                self.stdout.write(f"Parsed {document.file_name}: {document.status}")
+                reparsed += 1
+        self.stdout.write(f"Parsed {reparsed} stuck document(s)")
@@ -0,0 +1,110 @@
+from django.contrib.auth.models import User
+from django.db import models
+
+
+class UploadJob(models.Model):
+    """
+    One upload session from the frontend: every file sent with the same
+    jobId, received in chunks and then parsed.
+    """
+    STATUS_RECEIVING = 'receiving'
+    STATUS_PROCESSING = 'processing'
+    STATUS_COMPLETE = 'complete'
+    STATUS_ERROR = 'error'
+    STATUS_CHOICES = [
+        (STATUS_RECEIVING, 'Receiving'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_ERROR, 'Error'),
+    ]
+
+    job_id = models.UUIDField(unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_jobs')
+    total_files = models.PositiveIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_RECEIVING)
+    # Live state for the event stream and polling (see jobs.py): bumped on
+    # every change, and the status of each pipeline stage that has started
+    state_version = models.PositiveIntegerField(default=0)
+    stages = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload job {self.job_id} ({self.status})"
+
+
+class UploadedDocument(models.Model):
+    STATUS_RECEIVING = 'receiving'
+    STATUS_PARSING = 'parsing'
+    STATUS_PARSED = 'parsed'
+    STATUS_TRANSLATING = 'translating'
+    STATUS_TRANSLATED = 'translated'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RECEIVING, 'Receiving'),
+        (STATUS_PARSING, 'Parsing'),
+        (STATUS_PARSED, 'Parsed'),
+        (STATUS_TRANSLATING, 'Translating'),
+        (STATUS_TRANSLATED, 'Translated'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job = models.ForeignKey(UploadJob, on_delete=models.CASCADE, related_name='documents')
+    file_name = models.CharField(max_length=255)
+    total_chunks = models.PositiveIntegerField()
+    size = models.BigIntegerField(null=True, blank=True)
+    path = models.CharField(max_length=500, blank=True)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=STATUS_RECEIVING)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last status change; include it in update_fields when saving a status
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'file_name'], name='unique_uploaded_document'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
+
+
+class PipelineStageResult(models.Model):
+    """
+    Output of one pipeline stage for a document, or of one part of a stage
+    that was fanned out (part is empty for the stage as a whole). Completed
+    rows are reused when the pipeline is run again with the same run_key,
+    so a retry only redoes what failed.
+    """
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    document = models.ForeignKey(UploadedDocument, on_delete=models.CASCADE, related_name='stage_results')
+    run_key = models.CharField(max_length=64)
+    stage = models.CharField(max_length=40)
+    part = models.CharField(max_length=40, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    output = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    duration_ms = models.FloatField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['document', 'run_key', 'stage', 'part'], name='unique_pipeline_stage_result'
+            ),
+        ]
+
+    def __str__(self):
+        part = f" [{self.part}]" if self.part else ""
+        return f"{self.stage}{part} for document {self.document_id} ({self.status})"
@@ -0,0 +1,129 @@
+"""
+Parsing of uploaded documents once their last chunk has been assembled.
+
+Parsing runs in the background (see background.py), so the upload
+response is not held up by PyMuPDF. Structures come from the shared PDF
+cache, so the same official form uploaded by different users is parsed
+once.
+
+Background work does not survive a restart. A document left in "parsing"
+for longer than UPLOAD_PARSE_TIMEOUT is parsed again: the next time its
+upload is polled or a late chunk arrives (reschedule_if_stuck), or by the
+sweep_uploads management command.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from utils.field_detection import detect_fields
+from utils.pdf_cache import get_pdf_cache
+from utils.tracing import traced
+from .background import submit_on_commit
+from .jobs import STAGE_DONE, STAGE_FAILED, STAGE_RUNNING, job_registry
+from .models import UploadedDocument, UploadJob
+
+FINISHED_STATUSES = (UploadedDocument.STATUS_PARSED, UploadedDocument.STATUS_TRANSLATED)
+
+
+def schedule_parse(document_id):
+    """Parse a document in the background after the current transaction commits"""
+    submit_on_commit(parse_document, document_id)
+
+
+def stuck_parses():
+    """Documents that have been parsing for longer than UPLOAD_PARSE_TIMEOUT"""
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_PARSE_TIMEOUT)
+    return UploadedDocument.objects.filter(status=UploadedDocument.STATUS_PARSING, updated_at__lt=cutoff)
+
+
+def claim_stuck_parse(document_id):
+    """
+    Take over a stuck parse; the conditional update lets only one caller
+    (in any worker) win it
+
+    Returns:
+        bool: True if the caller should parse the document
+    """
+    return bool(stuck_parses().filter(pk=document_id).update(updated_at=timezone.now()))
+
+
+def reschedule_if_stuck(document):
+    """
+    Schedule a parse of a document whose parse was lost (e.g. its worker
+    restarted)
+
+    Returns:
+        bool: True if a parse was scheduled
+    """
+    if document.status != UploadedDocument.STATUS_PARSING or not claim_stuck_parse(document.pk):
+        return False
+    print(f"Rescheduling stuck parse of uploaded document {document.pk}")
+    schedule_parse(document.pk)
+    return True
+
+
+@traced("document.parse")
+def parse_document(document_id):
+    """
+    Extract an assembled document's structure and fields, and record the result
+    """
+    document = UploadedDocument.objects.select_related('job').get(pk=document_id)
+    job = document.job
+    job_registry.publish(job, stage='parse', stage_status=STAGE_RUNNING, detail={'file': document.file_name})
+    stage = 'parse'
+    try:
+        # workers=None: only documents of hundreds of pages are extracted in parallel
+        cache_key, structure = get_pdf_cache().get_or_extract(document.path, workers=None)
+        job_registry.publish(job, stage='parse', stage_status=STAGE_DONE, detail={'pages': len(structure)})
+        stage = 'extract_fields'
+        job_registry.publish(job, stage=stage, stage_status=STAGE_RUNNING)
+        detection = detect_fields(document.path, structure)
+    except Exception as e:
+        print(f"Error parsing uploaded document {document.path}: {e}")
+        document.status = UploadedDocument.STATUS_FAILED
+        document.error = str(e)
+        job_registry.publish(job, stage=stage, stage_status=STAGE_FAILED, detail={'error': str(e)})
+    else:
+        job_registry.publish(job, stage='extract_fields', stage_status=STAGE_DONE, detail={
+            'fields': detection['metadata']['total_fields'],
+            'residue_chars': detection['metadata']['residue_chars'],
+        })
+        document.status = UploadedDocument.STATUS_PARSED
+        document.result = {
+            'pages': len(structure),
+            'cache_key': cache_key,
+            'fields': detection['fields'],
+            'residue': detection['residue'],
+            'metadata': detection['metadata'],
+        }
+    document.save(update_fields=['status', 'result', 'error', 'updated_at'])
+    update_job_status(document.job_id)
+    return document
+
+
+def update_job_status(job_pk):
+    """
+    Derive a job's status from its documents
+
+    A job is complete once every file it announced (total_files) is
+    parsed (or translated, if translation was requested), and failed as
+    soon as any file fails.
+    """
+    with transaction.atomic():
+        job = UploadJob.objects.select_for_update().get(pk=job_pk)
+        statuses = list(job.documents.values_list('status', flat=True))
+        if UploadedDocument.STATUS_FAILED in statuses:
+            job.status = UploadJob.STATUS_ERROR
+        elif (statuses and all(status in FINISHED_STATUSES for status in statuses)
+                and len(statuses) >= (job.total_files or 0)):
+            job.status = UploadJob.STATUS_COMPLETE
+        elif any(status != UploadedDocument.STATUS_RECEIVING for status in statuses):
+            job.status = UploadJob.STATUS_PROCESSING
+        else:
+            job.status = UploadJob.STATUS_RECEIVING
+        job.save(update_fields=['status', 'updated_at'])
+    # Always a new version: the documents behind the job's response changed
+    job_registry.publish(job, status=job.status)
+    return job
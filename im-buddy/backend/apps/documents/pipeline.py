@@ -0,0 +1,293 @@
+"""
+A small dependency-graph runner for per-document processing stages.
+
+A Pipeline is a list of Stages, each naming the stages whose outputs it
+needs. Every stage whose dependencies are done is started at once, so
+independent stages run concurrently; a stage with a split() function is
+fanned out into parts that run in parallel and are merged when all have
+finished.
+
+Each stage - and each part of a fanned-out stage - is recorded as a
+PipelineStageResult with its output, error, attempt count and duration.
+Running the pipeline again for the same document and parameters reuses
+every completed row, so a failed stage is retried without redoing the
+stages (or the parts) that already succeeded.
+
+Stage functions run on worker threads and only see the context they are
+given; all database access stays on the thread that called run(). They
+run in the caller's trace context, so their spans (LLM calls, PDF work)
+nest under a pipeline.stage span.
+"""
+import hashlib
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+from django.utils import timezone
+
+from utils.tracing import in_current_context, start_span
+from .models import PipelineStageResult
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_SKIPPED = 'skipped'
+
+_PENDING = object()  # part output not in yet
+
+
+@dataclass
+class Stage:
+    """
+    One node of a pipeline graph
+
+    run(context) returns the stage's output, or for a fanned-out stage
+    run(context, part_input) returns one part's output. split(context)
+    returns [(part key, part input), ...] and merge(context, outputs)
+    combines the part outputs, given in split order. Outputs are stored
+    as JSON.
+    """
+    name: str
+    run: Callable
+    depends_on: Tuple[str, ...] = ()
+    split: Optional[Callable] = None
+    merge: Optional[Callable] = None
+
+
+def run_key(params):
+    """
+    Key under which a run's results are stored; runs with different
+    parameters (e.g. target language) don't share results
+    """
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Pipeline:
+    """
+    Args:
+        stages (list): Stages, in any order
+    """
+
+    def __init__(self, stages):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            missing = [name for name in stage.depends_on if name not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages {missing}")
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a dependency cycle through {name}")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def run(self, document, params, inputs=None, max_workers=4, on_event=None):
+        """
+        Run every stage not already completed for this document and params
+
+        Args:
+            document (UploadedDocument): Document the results belong to
+            params (dict): JSON-serializable run parameters, part of the
+                results' key and passed to stages as context['params']
+            inputs (dict): Extra data for stages (context['inputs']), not
+                part of the key
+            max_workers (int): Stage calls running at once
+            on_event (callable): (stage, status, progress, detail) for
+                each stage start, part completion, success or failure
+
+        Returns:
+            dict: status ('done' or 'failed'), outputs by stage, stage
+            statuses, timings_ms by stage and errors by stage
+        """
+        run = _Run(self, document, params, inputs or {}, on_event)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline') as executor:
+            run.execute(executor)
+        return run.summary()
+
+
+class _Run:
+    """State of one Pipeline.run() call"""
+
+    def __init__(self, pipeline, document, params, inputs, on_event):
+        self.pipeline = pipeline
+        self.document = document
+        self.key = run_key(params)
+        self.context = {'params': params, 'inputs': inputs, 'outputs': {}}
+        self.on_event = on_event or (lambda *args: None)
+
+        self.rows = {
+            (row.stage, row.part): row
+            for row in PipelineStageResult.objects.filter(document=document, run_key=self.key)
+        }
+        self.statuses = {}
+        self.timings = {}
+        self.errors = {}
+        self.started = {}
+        self.futures = {}
+        self.parts = {}  # stage -> {part key: output, or _PENDING}
+
+        for name in pipeline.order:
+            row = self.rows.get((name, ''))
+            if row is not None and row.status == PipelineStageResult.STATUS_DONE:
+                self.context['outputs'][name] = row.output
+                self.statuses[name] = STATUS_DONE
+                self.timings[name] = row.duration_ms
+
+    def _row(self, stage, part=''):
+        row = self.rows.get((stage, part))
+        if row is None:
+            row, _ = PipelineStageResult.objects.get_or_create(
+                document=self.document, run_key=self.key, stage=stage, part=part
+            )
+            self.rows[(stage, part)] = row
+        return row
+
+    def _begin(self, stage, part=''):
+        row = self._row(stage, part)
+        row.status = PipelineStageResult.STATUS_RUNNING
+        row.attempts += 1
+        row.error = ''
+        row.started_at = timezone.now()
+        row.save(update_fields=['status', 'attempts', 'error', 'started_at'])
+        return row
+
+    def _finish(self, row, output=None, error=None, duration_ms=None):
+        row.status = PipelineStageResult.STATUS_FAILED if error else PipelineStageResult.STATUS_DONE
+        row.output = None if error else output
+        row.error = str(error or '')
+        row.duration_ms = duration_ms
+        row.finished_at = timezone.now()
+        row.save(update_fields=['status', 'output', 'error', 'duration_ms', 'finished_at'])
+
+    def _ready(self):
+        for name in self.pipeline.order:
+            if name in self.statuses or name in self.started:
+                continue
+            dependencies = [self.statuses.get(dependency) for dependency in self.pipeline.stages[name].depends_on]
+            if any(status in (STATUS_FAILED, STATUS_SKIPPED) for status in dependencies):
+                self.statuses[name] = STATUS_SKIPPED
+            elif all(status == STATUS_DONE for status in dependencies):
+                yield self.pipeline.stages[name]
+
+    def _start(self, executor, stage):
+        self.started[stage.name] = time.perf_counter()
+        self.on_event(stage.name, 'running', 0.0, None)
+        if stage.split is None:
+            self._submit(executor, stage, '', None)
+            return
+
+        try:
+            parts = stage.split(self.context)
+        except Exception as e:
+            self._fail(stage.name, self._begin(stage.name), e)
+            return
+        self._begin(stage.name)
+        self.parts[stage.name] = {}
+        for part, part_input in parts:
+            row = self.rows.get((stage.name, part))
+            if row is not None and row.status == PipelineStageResult.STATUS_DONE:
+                self.parts[stage.name][part] = row.output
+            else:
+                self.parts[stage.name][part] = _PENDING
+                self._submit(executor, stage, part, part_input)
+        self._maybe_merge(stage)
+
+    def _submit(self, executor, stage, part, part_input):
+        row = self._begin(stage.name, part)
+        attributes = {'pipeline.stage': stage.name, 'pipeline.part': part, 'document.id': self.document.pk}
+        args = (self.context,) if stage.split is None else (self.context, part_input)
+        future = executor.submit(in_current_context(_timed), attributes, stage.run, *args)
+        self.futures[future] = (stage, part, row)
+
+    def _fail(self, name, row, error, duration_ms=None):
+        print(f"Pipeline stage {name} failed for document {self.document.pk}: {error}")
+        self._finish(row, error=error, duration_ms=duration_ms)
+        if name not in self.statuses:
+            self.statuses[name] = STATUS_FAILED
+            self.errors[name] = str(error)
+            self.timings[name] = (time.perf_counter() - self.started[name]) * 1000
+            self.on_event(name, STATUS_FAILED, None, {'error': str(error)})
+
+    def _complete(self, stage, output):
+        duration_ms = (time.perf_counter() - self.started[stage.name]) * 1000
+        self._finish(self._row(stage.name), output=output, duration_ms=duration_ms)
+        self.context['outputs'][stage.name] = output
+        self.statuses[stage.name] = STATUS_DONE
+        self.timings[stage.name] = duration_ms
+        self.on_event(stage.name, STATUS_DONE, 1.0, None)
+
+    def _maybe_merge(self, stage):
+        if stage.name in self.statuses:
+            return  # a part already failed
+        outputs = self.parts[stage.name]
+        pending = sum(output is _PENDING for output in outputs.values())
+        if pending:
+            self.on_event(stage.name, 'running', 1 - pending / len(outputs), None)
+            return
+        try:
+            merged = stage.merge(self.context, list(outputs.values())) if stage.merge else list(outputs.values())
+        except Exception as e:
+            self._fail(stage.name, self._row(stage.name), e)
+            return
+        self._complete(stage, merged)
+
+    def execute(self, executor):
+        while True:
+            for stage in list(self._ready()):
+                self._start(executor, stage)
+            if not self.futures:
+                break
+
+            done, _ = wait(self.futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, part, row = self.futures.pop(future)
+                output, error, duration_ms = future.result()
+                if error is not None:
+                    self._fail(stage.name, row, error, duration_ms)
+                    if part:
+                        # Whole stage failed too; its parts that succeeded are kept
+                        self._finish(self._row(stage.name), error=error)
+                elif part:
+                    self._finish(row, output=output, duration_ms=duration_ms)
+                    self.parts[stage.name][part] = output
+                    self._maybe_merge(stage)
+                else:
+                    self._complete(stage, output)
+
+    def summary(self):
+        failed = any(status != STATUS_DONE for status in self.statuses.values())
+        return {
+            'status': STATUS_FAILED if failed else STATUS_DONE,
+            'outputs': self.context['outputs'],
+            'statuses': self.statuses,
+            'timings_ms': self.timings,
+            'errors': self.errors,
+        }
+
+
+def _timed(attributes, fn, *args):
+    # Runs on a worker thread; exceptions are returned, not raised, so the
+    # coordinating thread records them
+    started = time.perf_counter()
+    with start_span('pipeline.stage', attributes) as span:
+        try:
+            output = fn(*args)
+        except Exception as e:
+            span.record_exception(e)
+            return None, e, (time.perf_counter() - started) * 1000
+    return output, None, (time.perf_counter() - started) * 1000
@@ -0,0 +1,24 @@
+from rest_framework import serializers
+from .models import PipelineStageResult, UploadedDocument, UploadJob
+
+
+class PipelineStageResultSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PipelineStageResult
+        fields = ['stage', 'part', 'status', 'attempts', 'duration_ms', 'error', 'finished_at']
+
+
+class UploadedDocumentSerializer(serializers.ModelSerializer):
+    stage_results = PipelineStageResultSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = UploadedDocument
+        fields = ['file_name', 'status', 'size', 'result', 'error', 'stage_results']
+
+
+class UploadJobSerializer(serializers.ModelSerializer):
+    documents = UploadedDocumentSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = UploadJob
+        fields = ['job_id', 'status', 'total_files', 'documents', 'created_at', 'updated_at']
@@ -0,0 +1,423 @@
+"""
+The document pipelines: ImmigrationFormPrompts phases as graphs.
+
+translation_pipeline, for a blank form the user wants to read:
+
+    detect_language ─┐
+                     ├─> glossary ─> translate (one phase-1 call per chunk) ─> quality_check (per chunk)
+    extract_fields ──┘
+
+filled_form_pipeline, for a form the user has filled in, in their language:
+
+    input_extraction ─> phase2
+
+The second pipeline needs user inputs, which a blank upload doesn't
+have, so it is started separately (POST /api/upload/<jobId>/inputs).
+
+Language detection and field extraction only need the parsed document, so
+they run concurrently. Field extraction starts from the locally detected
+fields and only sends the unresolved residue to the LLM; its result is
+kept in the PDF cache, so the same form uploaded again skips that call.
+The form is then
+cut into chunks that fit the phase-1 token budget (see utils.chunking);
+its recurring terms are translated once, and every chunk is translated
+with that glossary, several at a time. A failed chunk is retried on its
+own, and the chunk replies are stitched back into one translation.
+
+A document is claimed for either pipeline (status "translating") with a
+conditional update, so two requests can't start two pipelines for it. If
+its worker dies, a document is left translating; once neither it nor its
+stage results have changed for TRANSLATION_STALE_AFTER, it can be claimed
+again. Any error while translating marks the document failed.
+"""
+import hashlib
+import json
+import re
+from datetime import timedelta
+
+import fitz  # PyMuPDF
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from services.prompt_service import request_prompt
+from utils.chunking import build_glossary, chunk_form, stitch_translations
+from utils.field_detection import residue_text
+from utils.pdf_cache import get_pdf_cache
+from utils.prompt_config import PromptConfig
+from utils.prompts import static_prefix
+from utils.tracing import traced
+from .background import submit_on_commit
+from .jobs import STAGE_DONE, STAGE_FAILED, STAGE_RUNNING, job_registry
+from .models import PipelineStageResult, UploadedDocument
+from .parsing import update_job_status
+from .pipeline import STATUS_DONE, Pipeline, Stage
+
+# Characters of the document sent for language detection
+LANGUAGE_SAMPLE_CHARS = 2000
+
+PRIMARY_LANGUAGE = re.compile(r"Primary Language:\s*\[?([^\]\n]+?)\]?\s*$", re.IGNORECASE | re.MULTILINE)
+CONFIDENCE = re.compile(r"Confidence:\s*\[?(\w+)", re.IGNORECASE)
+
+
+def _json_from_response(text, opening, closing):
+    """The outermost JSON array or object in an LLM reply, or None"""
+    start, end = text.find(opening), text.rfind(closing)
+    if start == -1 or end <= start:
+        return None
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+
+def _page_texts(context):
+    return [
+        (page['page_number'], '\n'.join(span['text'] for span in page['text_blocks']).strip())
+        for page in context['inputs']['structure']
+    ]
+
+
+def detect_language(context):
+    sample = '\n'.join(text for _, text in _page_texts(context))[:LANGUAGE_SAMPLE_CHARS]
+    reply = request_prompt('language_detection', text_sample=sample)
+    language = PRIMARY_LANGUAGE.search(reply)
+    confidence = CONFIDENCE.search(reply)
+    return {
+        'language': language.group(1).strip() if language else None,
+        'confidence': confidence.group(1) if confidence else None,
+    }
+
+
+def fields_cache_variant(fields, residue):
+    """
+    PDF cache variant of an extract_fields result: changes with the residue
+    prompt's instructions and model settings, and with the local detection
+    """
+    digest = hashlib.sha256(static_prefix('field_residue').encode('utf-8'))
+    digest.update(json.dumps(PromptConfig.get_settings('field_residue'), sort_keys=True).encode('utf-8'))
+    digest.update(json.dumps([fields, residue], sort_keys=True, default=str).encode('utf-8'))
+    return f'residue-{digest.hexdigest()[:16]}'
+
+
+def extract_fields(context):
+    detection = context['inputs']['detection']
+    fields = list(detection['fields'])
+    residue = residue_text(detection)
+    if not residue:
+        return {'fields': fields, 'llm_fields': 0}
+
+    cache, cache_key = get_pdf_cache(), context['inputs'].get('cache_key')
+    variant = fields_cache_variant(fields, residue)
+    if cache_key:
+        cached = cache.get_fields(cache_key, variant)
+        if cached is not None:
+            return dict(cached, cached=True)
+
+    reply = request_prompt('field_residue', residue_text=residue, detected_fields=fields)
+    parsed = _json_from_response(reply, '[', ']')
+    llm_fields = [field for field in parsed or [] if isinstance(field, dict)]
+    for number, field in enumerate(llm_fields, start=1):
+        field.setdefault('field_id', f'llm_field_{number}')
+        field['source'] = 'llm'
+    result = {'fields': fields + llm_fields, 'llm_fields': len(llm_fields)}
+    # An unparseable reply isn't cached, so the next upload asks again
+    if cache_key and parsed is not None:
+        cache.set_fields(cache_key, result, variant)
+    return result
+
+
+def translate_glossary(context):
+    terms = build_glossary(context['inputs']['structure'], context['outputs']['extract_fields']['fields'])
+    if not terms:
+        return {}
+    reply = request_prompt(
+        'glossary',
+        terms=terms,
+        target_language=context['params']['target_language'],
+        original_language=context['outputs']['detect_language']['language'],
+    )
+    glossary = _json_from_response(reply, '{', '}') or {}
+    # Only keep terms that were asked for, so a chatty reply can't add any
+    return {term: str(glossary[term]) for term in terms if glossary.get(term)}
+
+
+def split_chunks(context):
+    chunks = chunk_form(
+        context['inputs']['structure'],
+        context['outputs']['extract_fields']['fields'],
+        budget=settings.TRANSLATION_CHUNK_TOKENS,
+    )
+    return [(chunk['key'], dict(chunk, index=index, count=len(chunks))) for index, chunk in enumerate(chunks, 1)]
+
+
+def translate_chunk(context, chunk):
+    pages = chunk['pages']
+    metadata = {'total_pages': len(context['inputs']['structure']), 'title': context['params']['title']}
+    if chunk['count'] > 1:
+        page_range = f'page {pages[0]}' if len(pages) == 1 else f'pages {pages[0]}-{pages[-1]}'
+        metadata['chunk'] = f"part {chunk['index']} of {chunk['count']} ({page_range})"
+    translated = request_prompt(
+        'phase1',
+        form_content=chunk['text'],
+        form_fields=chunk['fields'],
+        form_metadata=metadata,
+        target_language=context['params']['target_language'],
+        original_language=context['outputs']['detect_language']['language'],
+        glossary=context['outputs']['glossary'],
+    )
+    return {'chunk': chunk['key'], 'pages': pages, 'original': chunk['text'], 'translated': translated}
+
+
+def merge_chunks(context, chunks):
+    stitched = stitch_translations(chunk['translated'] for chunk in chunks)
+    return dict(stitched, chunks=chunks)
+
+
+def split_translated_chunks(context):
+    return [(chunk['chunk'], chunk) for chunk in context['outputs']['translate']['chunks']]
+
+
+def check_chunk(context, chunk):
+    reply = request_prompt(
+        'quality_check',
+        original_text=chunk['original'],
+        translated_text=chunk['translated'],
+        source_language=context['outputs']['detect_language']['language'] or 'the source language',
+        target_language=context['params']['target_language'],
+    )
+    assessment = _json_from_response(reply, '{', '}') or {'reviewer_notes': reply}
+    return {'chunk': chunk['chunk'], 'pages': chunk['pages'], 'assessment': assessment}
+
+
+def merge_checks(context, checks):
+    return {'chunks': checks}
+
+
+def widget_values(pdf_path):
+    """Values typed into a PDF's form widgets, by field name; unset ones left out"""
+    with fitz.open(pdf_path) as doc:
+        return {
+            widget.field_name: widget.field_value
+            for page in doc for widget in page.widgets()
+            if widget.field_value not in (None, '', 'Off', False)
+        }
+
+
+def filled_form_content(context):
+    pages = '\n\n'.join(f'[Page {number}]\n{text}' for number, text in _page_texts(context))
+    values = widget_values(context['inputs']['path'])
+    if not values:
+        return pages
+    return pages + '\n\n[Form fields]\n' + '\n'.join(f'{name}: {value}' for name, value in values.items())
+
+
+def extract_inputs(context):
+    reply = request_prompt(
+        'input_extraction',
+        original_fields=context['inputs']['detection']['fields'],
+        filled_form_content=filled_form_content(context),
+        user_language=context['params']['user_language'],
+    )
+    inputs = _json_from_response(reply, '{', '}')
+    if not isinstance(inputs, dict):
+        raise ValueError('The input extraction reply has no JSON object')
+    return inputs
+
+
+def reverse_translate(context):
+    reply = request_prompt(
+        'phase2',
+        original_form_structure={'fields': context['inputs']['detection']['fields']},
+        user_inputs=context['outputs']['input_extraction'],
+        user_language=context['params']['user_language'],
+        target_country=context['params']['target_country'],
+    )
+    return {'text': reply}
+
+
+translation_pipeline = Pipeline([
+    Stage('detect_language', detect_language),
+    Stage('extract_fields', extract_fields),
+    Stage('glossary', translate_glossary, depends_on=('detect_language', 'extract_fields')),
+    Stage('translate', translate_chunk, depends_on=('glossary',), split=split_chunks, merge=merge_chunks),
+    Stage('quality_check', check_chunk, depends_on=('translate',),
+          split=split_translated_chunks, merge=merge_checks),
+])
+
+filled_form_pipeline = Pipeline([
+    Stage('input_extraction', extract_inputs),
+    Stage('phase2', reverse_translate, depends_on=('input_extraction',)),
+])
+
+
+# Statuses from which a document may be (re)translated
+TRANSLATABLE_STATUSES = (
+    UploadedDocument.STATUS_PARSED, UploadedDocument.STATUS_TRANSLATED, UploadedDocument.STATUS_FAILED,
+)
+
+
+def claim_translation(document):
+    """
+    Mark a parsed document as translating, unless a translation is running
+
+    A translating document counts as abandoned once neither it nor any of
+    its stage results has changed for TRANSLATION_STALE_AFTER seconds.
+
+    Returns:
+        bool: True if the caller claimed the document and should schedule it
+    """
+    if not document.result or 'fields' not in document.result:
+        return False  # parsing failed; nothing to translate
+    cutoff = timezone.now() - timedelta(seconds=settings.TRANSLATION_STALE_AFTER)
+    recent_activity = PipelineStageResult.objects.filter(document=OuterRef('pk')).filter(
+        Q(started_at__gte=cutoff) | Q(finished_at__gte=cutoff)
+    )
+    abandoned = Q(status=UploadedDocument.STATUS_TRANSLATING, updated_at__lt=cutoff) & ~Exists(recent_activity)
+    claimed = UploadedDocument.objects.filter(pk=document.pk).filter(
+        Q(status__in=TRANSLATABLE_STATUSES) | abandoned
+    ).update(status=UploadedDocument.STATUS_TRANSLATING, updated_at=timezone.now())
+    return bool(claimed)
+
+
+def schedule_translation(document_id, target_language):
+    """Run the translation pipeline in the background after the current transaction commits"""
+    submit_on_commit(translate_document, document_id, target_language)
+
+
+def schedule_input_extraction(document_id, user_language, target_country=None):
+    """Run the filled-form pipeline in the background after the current transaction commits"""
+    submit_on_commit(extract_user_inputs, document_id, user_language, target_country)
+
+
+def _failing_on_error(run, document, *args):
+    # The document ends up translated or failed, never left translating
+    try:
+        return run(document, *args)
+    except Exception as e:
+        print(f"Error processing uploaded document {document.path}: {e}")
+        document.status = UploadedDocument.STATUS_FAILED
+        document.error = str(e)
+        document.save(update_fields=['status', 'error', 'updated_at'])
+        update_job_status(document.job_id)
+        return None
+
+
+def _run_pipeline(pipeline, document, params):
+    """
+    Run a pipeline over a document's cached structure, publishing stage
+    progress on its job
+
+    Returns:
+        dict: Pipeline summary (see Pipeline.run)
+    """
+    job = document.job
+
+    def on_event(stage, status, progress, detail):
+        # The job's status channel knows these stages by name
+        stage_status = {STATUS_DONE: STAGE_DONE, 'running': STAGE_RUNNING}.get(status, STAGE_FAILED)
+        job_registry.publish(job, stage=stage, stage_status=stage_status, progress=progress, detail=detail)
+
+    # workers=None: only documents of hundreds of pages are extracted in parallel
+    cache_key, structure = get_pdf_cache().get_or_extract(document.path, workers=None)
+    return pipeline.run(
+        document,
+        params=params,
+        inputs={'structure': structure, 'detection': document.result, 'cache_key': cache_key,
+                'path': document.path},
+        max_workers=settings.PIPELINE_CONCURRENCY,
+        on_event=on_event,
+    )
+
+
+def _save_outcome(document, summary, result_key, outcome):
+    """Store outcome as result[result_key] and mark the document translated or failed"""
+    document.result = dict(document.result or {}, **{result_key: outcome})
+    if summary['status'] == STATUS_DONE:
+        document.status = UploadedDocument.STATUS_TRANSLATED
+        document.error = ''
+    else:
+        document.status = UploadedDocument.STATUS_FAILED
+        document.error = '; '.join(f'{stage}: {error}' for stage, error in summary['errors'].items())
+    document.save(update_fields=['result', 'status', 'error', 'updated_at'])
+    update_job_status(document.job_id)
+
+
+@traced("document.translate")
+def translate_document(document_id, target_language):
+    """
+    Run the translation pipeline for a parsed document
+
+    Stages completed by an earlier run for the same target language are
+    reused, so calling this again after a failure resumes where it stopped.
+    Whatever goes wrong, the document ends up translated or failed, never
+    left translating.
+
+    Args:
+        document_id (int): UploadedDocument primary key
+        target_language (str): PromptConfig language name
+
+    Returns:
+        dict: Pipeline summary (see Pipeline.run), or None if the document
+        could not be loaded or translated
+    """
+    document = UploadedDocument.objects.select_related('job').get(pk=document_id)
+    return _failing_on_error(_translate_document, document, target_language)
+
+
+def _translate_document(document, target_language):
+    summary = _run_pipeline(
+        translation_pipeline, document, {'target_language': target_language, 'title': document.file_name}
+    )
+    outputs = summary['outputs']
+    translated = outputs.get('translate') or {}
+    _save_outcome(document, summary, 'translation', {
+        'target_language': target_language,
+        'status': summary['status'],
+        'source_language': (outputs.get('detect_language') or {}).get('language'),
+        'text': translated.get('text'),
+        'field_mapping': translated.get('field_mapping'),
+        'notes': translated.get('notes'),
+        'chunks': translated.get('chunks'),
+        'glossary': outputs.get('glossary'),
+        'quality': (outputs.get('quality_check') or {}).get('chunks'),
+        'fields': (outputs.get('extract_fields') or {}).get('fields'),
+        'timings_ms': summary['timings_ms'],
+        'errors': summary['errors'],
+    })
+    return summary
+
+
+@traced("document.extract_inputs")
+def extract_user_inputs(document_id, user_language, target_country=None):
+    """
+    Run the filled-form pipeline: read the user's answers from a filled-in
+    form and translate them back into the form's language
+
+    Args:
+        document_id (int): UploadedDocument primary key of the filled form
+        user_language (str): PromptConfig name of the language it was filled in
+        target_country (str): Country the form is submitted to, if known
+
+    Returns:
+        dict: Pipeline summary (see Pipeline.run), or None on an error
+    """
+    document = UploadedDocument.objects.select_related('job').get(pk=document_id)
+    return _failing_on_error(_extract_user_inputs, document, user_language, target_country)
+
+
+def _extract_user_inputs(document, user_language, target_country):
+    summary = _run_pipeline(
+        filled_form_pipeline, document, {'user_language': user_language, 'target_country': target_country}
+    )
+    outputs = summary['outputs']
+    _save_outcome(document, summary, 'user_inputs', {
+        'user_language': user_language,
+        'target_country': target_country,
+        'status': summary['status'],
+        'extracted': outputs.get('input_extraction'),
+        'reverse_translation': (outputs.get('phase2') or {}).get('text'),
+        'timings_ms': summary['timings_ms'],
+        'errors': summary['errors'],
+    })
+    return summary
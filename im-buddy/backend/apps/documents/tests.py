@@ -0,0 +1,1316 @@
+import gzip
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+import fitz  # PyMuPDF
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from rest_framework.test import APIClient
+
+from apps.visa_info.models import Language
+from utils.chunking import build_glossary, chunk_form, stitch_translations
+from utils.field_detection import detect_fields, residue_text
+from services.llama_common import make_api_request
+from utils.pdf_cache import PDFCache, get_pdf_cache
+from utils.pdf_extraction import choose_worker_count, extract_pdf_structure
+from utils.pdf_overlay import overlay_translations
+from utils.pdf_render import PDFRenderer, RenderQueueFull, get_pdf_renderer, render_stats
+from utils.pdf_spans import SpanTable
+from utils.prompt_encoding import encode_payload
+from utils.prompts import ImmigrationFormPrompts, static_prefix
+from utils.tokens import estimate_tokens
+from utils.tracing import _tracer_from_settings, in_current_context, start_span, tracer
+from .jobs import STAGE_DONE, STAGE_RUNNING, JobRegistry, job_registry
+from .chunks import parts_dir, sweep_stale_parts
+from .models import PipelineStageResult, UploadedDocument, UploadJob
+from .parsing import parse_document
+from .pipeline import STATUS_DONE, STATUS_FAILED, STATUS_SKIPPED, Pipeline, Stage
+from .stages import extract_user_inputs, translate_document
+
+
+class UploadTestMixin:
+
+    def setUp(self):
+        cache.clear()
+        self.upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_dir, ignore_errors=True)
+        settings_override = override_settings(UPLOAD_DIR=self.upload_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(username='applicant', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.job_id = str(uuid.uuid4())
+
+    def post_chunk(self, data, index, total, file_name='form.pdf', compress=True, **metadata):
+        body = gzip.compress(data) if compress else data
+        metadata = {
+            'jobId': self.job_id,
+            'chunkIndex': index,
+            'totalChunks': total,
+            'fileName': file_name,
+            'originalSize': len(data),
+            'compressedSize': len(body),
+            **metadata,
+        }
+        return self.client.post('/api/upload-chunk', {
+            'chunk': SimpleUploadedFile('blob', body),
+            'metadata': json.dumps(metadata),
+        }, format='multipart')
+
+
+class UploadTestCase(UploadTestMixin, TestCase):
+    pass
+
+
+class UploadChunkTests(UploadTestCase):
+
+    def test_out_of_order_chunks_assemble_the_original_file(self):
+        parts = [os.urandom(1000), b'second' * 500, b'third']
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(self.post_chunk(parts[2], 3, 3).data['missing'], [1, 2])
+            self.assertEqual(self.post_chunk(parts[0], 1, 3, compress=False).data['missing'], [2])
+            response = self.post_chunk(parts[1], 2, 3)
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertTrue(response.data['complete'])
+        self.assertEqual(len(callbacks), 1)  # parsing scheduled once
+        document = UploadedDocument.objects.get()
+        self.assertEqual(document.status, UploadedDocument.STATUS_PARSING)
+        with open(document.path, 'rb') as f:
+            self.assertEqual(f.read(), b''.join(parts))
+        self.assertEqual(os.listdir(os.path.join(self.upload_dir, self.job_id, '.parts')), [])
+
+    def test_retried_chunk_is_idempotent_and_progress_reports_missing(self):
+        self.post_chunk(b'first', 1, 3)
+        self.post_chunk(b'first', 1, 3)
+
+        response = self.client.get('/api/upload-chunk', {'jobId': self.job_id, 'fileName': 'form.pdf'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['received'], response.data['missing']), (1, [2, 3]))
+
+    def test_size_mismatch_is_rejected_and_not_recorded(self):
+        response = self.post_chunk(b'only part', 1, 2, originalSize=5)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expected 5', response.data['error'])
+        progress = self.client.get('/api/upload-chunk', {'jobId': self.job_id, 'fileName': 'form.pdf'})
+        self.assertEqual(progress.data['missing'], [1, 2])
+
+    def test_corrupt_gzip_is_rejected(self):
+        body = gzip.compress(b'x' * 1000)[:-20]
+        response = self.post_chunk(body, 1, 1, compress=False, originalSize=1000)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadedDocument.objects.exclude(status=UploadedDocument.STATUS_RECEIVING).exists())
+
+    @override_settings(UPLOAD_MAX_CHUNK_BYTES=1024)
+    def test_chunk_expanding_past_limit_is_rejected(self):
+        response = self.post_chunk(b'\0' * 100000, 1, 1)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('larger than 1024', response.data['error'])
+
+    @override_settings(UPLOAD_MAX_JOB_BYTES=2000)
+    def test_job_past_its_total_size_is_refused(self):
+        self.assertEqual(self.post_chunk(b'a' * 1500, 1, 2, file_name='a.pdf').status_code, 200)
+
+        response = self.post_chunk(b'b' * 1000, 1, 1, file_name='b.pdf')
+
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('2000 bytes', response.data['error'])
+        # A retry replaces its earlier copy, so it still fits
+        self.assertEqual(self.post_chunk(b'a' * 1500, 1, 2, file_name='a.pdf').status_code, 200)
+        self.assertEqual(self.post_chunk(b'a' * 400, 2, 2, file_name='a.pdf').status_code, 200)
+        self.assertEqual(self.post_chunk(b'c' * 200, 1, 1, file_name='c.pdf').status_code, 413)
+
+    def test_stale_parts_are_swept(self):
+        self.post_chunk(b'first', 1, 2, file_name='stale.pdf')
+        self.post_chunk(b'first', 1, 2, file_name='fresh.pdf')
+        stale = parts_dir(self.upload_dir, self.job_id, 'stale.pdf')
+        os.utime(stale, (time.time() - 7200,) * 2)
+
+        self.assertEqual(sweep_stale_parts(self.upload_dir, 3600), 1)
+
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(parts_dir(self.upload_dir, self.job_id, 'fresh.pdf')))
+        progress = self.client.get('/api/upload-chunk', {'jobId': self.job_id, 'fileName': 'stale.pdf'})
+        self.assertEqual(progress.data['missing'], [1, 2])  # the client starts over
+
+    def test_other_users_cannot_write_to_a_job(self):
+        self.post_chunk(b'first', 1, 2)
+        self.client.force_authenticate(User.objects.create_user(username='other', password='secret'))
+
+        self.assertEqual(self.post_chunk(b'second', 2, 2).status_code, 404)
+        self.assertEqual(self.client.get(f'/api/upload/{self.job_id}').status_code, 404)
+
+    def test_path_components_are_stripped_from_file_names(self):
+        self.post_chunk(b'data', 1, 1, file_name='../../etc/passwd')
+
+        document = UploadedDocument.objects.get()
+        self.assertEqual(document.file_name, 'passwd')
+        self.assertTrue(document.path.startswith(os.path.join(self.upload_dir, self.job_id)))
+
+    def test_session_upload_sends_the_csrf_cookie_back(self):
+        self.client = APIClient(enforce_csrf_checks=True, HTTP_ORIGIN='http://localhost:5173')
+        self.client.login(username='applicant', password='secret')
+        self.assertEqual(self.post_chunk(b'data', 1, 1).status_code, 403)
+
+        # The frontend's resume check hands out the token before the first POST
+        self.client.get('/api/upload-chunk', {'jobId': self.job_id, 'fileName': 'form.pdf'})
+        self.client.defaults['HTTP_X_CSRFTOKEN'] = self.client.cookies['csrftoken'].value
+        response = self.post_chunk(b'data', 1, 1)
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertTrue(response.data['complete'])
+
+
+class PDFUploadTestCase(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache = PDFCache(directory=os.path.join(self.upload_dir, 'cache'))
+        for module in ('parsing', 'stages'):
+            patcher = mock.patch(f'apps.documents.{module}.get_pdf_cache', return_value=cache)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_pdf(self):
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((50, 90), 'Family Name: ____________________', fontsize=10)
+        page.insert_text((50, 120), 'Date of Birth: ____________________', fontsize=10)
+        data = doc.tobytes()
+        doc.close()
+        return data
+
+
+class ParseDocumentTests(PDFUploadTestCase):
+
+    def test_assembled_pdf_is_parsed_and_job_completes(self):
+        data = self.make_pdf()
+        middle = len(data) // 2
+        self.post_chunk(data[:middle], 1, 2, totalFiles=1)
+        self.post_chunk(data[middle:], 2, 2, totalFiles=1)
+
+        parse_document(UploadedDocument.objects.get().pk)
+
+        response = self.client.get(f'/api/upload/{self.job_id}')
+        self.assertEqual(response.json()['status'], UploadJob.STATUS_COMPLETE)
+        self.assertEqual(response.json()['stages']['extract_fields']['detail']['fields'], 2)
+        result = response.json()['documents'][0]['result']
+        self.assertEqual(result['pages'], 1)
+        self.assertEqual(
+            [(field['field_label'], field['field_type']) for field in result['fields']],
+            [('Family Name', 'text'), ('Date of Birth', 'date')],
+        )
+
+    def test_job_waits_for_every_announced_file(self):
+        self.post_chunk(self.make_pdf(), 1, 1, file_name='a.pdf', totalFiles=2)
+
+        parse_document(UploadedDocument.objects.get().pk)
+
+        self.assertEqual(UploadJob.objects.get().status, UploadJob.STATUS_PROCESSING)
+
+    def upload_stuck_document(self, age):
+        self.post_chunk(self.make_pdf(), 1, 1, totalFiles=1)
+        document = UploadedDocument.objects.get()
+        self.assertEqual(document.status, UploadedDocument.STATUS_PARSING)
+        UploadedDocument.objects.update(updated_at=timezone.now() - timedelta(seconds=age))
+        return document
+
+    @override_settings(UPLOAD_PARSE_TIMEOUT=600)
+    def test_lost_parse_is_rescheduled_once_when_polled(self):
+        document = self.upload_stuck_document(age=900)
+
+        with mock.patch('apps.documents.parsing.schedule_parse') as schedule:
+            self.post_chunk(self.make_pdf(), 1, 1, totalFiles=1)  # late retry
+            self.client.get('/api/upload-chunk', {'jobId': self.job_id, 'fileName': 'form.pdf'})
+
+        schedule.assert_called_once_with(document.pk)
+
+    @override_settings(UPLOAD_PARSE_TIMEOUT=600)
+    def test_parse_in_progress_is_not_rescheduled(self):
+        self.upload_stuck_document(age=60)
+
+        with mock.patch('apps.documents.parsing.schedule_parse') as schedule:
+            self.client.get('/api/upload-chunk', {'jobId': self.job_id, 'fileName': 'form.pdf'})
+
+        schedule.assert_not_called()
+
+    @override_settings(UPLOAD_PARSE_TIMEOUT=600)
+    def test_sweep_command_parses_stuck_documents(self):
+        self.upload_stuck_document(age=900)
+        output = io.StringIO()
+
+        call_command('sweep_uploads', stdout=output)
+
+        self.assertEqual(UploadedDocument.objects.get().status, UploadedDocument.STATUS_PARSED)
+        self.assertIn('Parsed 1 stuck document(s)', output.getvalue())
+
+    def test_unreadable_file_fails_the_job(self):
+        self.post_chunk(b'not a pdf', 1, 1)
+
+        document = parse_document(UploadedDocument.objects.get().pk)
+
+        self.assertEqual(document.status, UploadedDocument.STATUS_FAILED)
+        self.assertTrue(document.error)
+        self.assertEqual(UploadJob.objects.get().status, UploadJob.STATUS_ERROR)
+
+
+
+@override_settings(JOB_EVENTS_HEARTBEAT=0.05, JOB_EVENTS_POLL_INTERVAL=0.01, JOB_EVENTS_MAX_DURATION=5)
+class JobEventsTests(UploadTestMixin, TransactionTestCase):
+    # Committed rows, so job states published from other threads are seen
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('apps.documents.views.schedule_parse')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.post_chunk(b'first', 1, 2)
+        self.job = UploadJob.objects.get()
+
+    def read_events(self, **headers):
+        response = self.client.get(f'/api/upload/{self.job_id}/events', HTTP_ACCEPT='text/event-stream', **headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = []
+        for message in b''.join(response.streaming_content).decode().split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in message.splitlines() if not line.startswith(':'))
+            if fields.get('event') == 'status':
+                events.append((int(fields['id']), json.loads(fields['data'])))
+        return events
+
+    def test_stream_pushes_changes_until_the_job_completes(self):
+        def work():
+            time.sleep(0.1)
+            job_registry.publish(self.job, stage='parse', stage_status=STAGE_RUNNING)
+            time.sleep(0.1)
+            job_registry.publish(self.job, stage='parse', stage_status=STAGE_DONE, status=UploadJob.STATUS_COMPLETE)
+
+        worker = threading.Thread(target=work)
+        worker.start()
+        events = self.read_events()
+        worker.join()
+
+        self.assertEqual([state['stages']['upload']['progress'] for _, state in events][0], 0.5)
+        self.assertEqual(
+            [(state['stages']['parse']['status'], state['status']) for _, state in events[1:]],
+            [(STAGE_RUNNING, 'receiving'), (STAGE_DONE, 'complete')],
+        )
+        self.assertEqual([version for version, _ in events], sorted(version for version, _ in events))
+        self.assertNotIn('user_id', events[0][1])
+
+    def publish_later(self, published):
+        def work():
+            for stage_status, job_status in ((STAGE_RUNNING, None), (STAGE_DONE, UploadJob.STATUS_COMPLETE)):
+                time.sleep(0.2)
+                job_registry.publish(self.job, stage='parse', stage_status=stage_status, status=job_status)
+                published.append(time.monotonic())
+
+        worker = threading.Thread(target=work)
+        worker.start()
+        self.addCleanup(worker.join)
+
+    def test_asgi_stream_sends_each_event_as_it_happens(self):
+        published = []
+
+        async def read_stream():
+            client = AsyncClient()
+            await sync_to_async(client.force_login)(self.user)
+            response = await client.get(f'/api/upload/{self.job_id}/events', HTTP_ACCEPT='text/event-stream')
+            self.assertTrue(response.is_async)
+            self.publish_later(published)
+            received = []
+            async for chunk in response.streaming_content:
+                if b'event: status' in chunk:
+                    received.append((time.monotonic(), json.loads(chunk.decode().split('data: ', 1)[1])))
+            return received
+
+        received = async_to_sync(read_stream)()
+
+        self.assertEqual([state['status'] for _, state in received], ['receiving', 'receiving', 'complete'])
+        # The running event arrived before the job completed, not all at the end
+        self.assertLess(received[1][0], published[1])
+
+    def test_workers_share_versions_through_the_job_row(self):
+        other_worker = JobRegistry()
+        seen = other_worker.get(self.job_id)['version']
+        published = []
+        self.publish_later(published)
+
+        changed = other_worker.wait(self.job_id, seen, timeout=5)
+
+        self.assertEqual(changed['stages']['parse']['status'], STAGE_RUNNING)
+        cache.clear()  # versions don't live in the cache
+        self.assertGreater(job_registry.get(self.job_id)['version'], seen)
+
+    def test_reconnect_resumes_after_last_event_id(self):
+        seen = job_registry.get(self.job_id)['version']
+        job_registry.publish(self.job, status=UploadJob.STATUS_COMPLETE)
+
+        events = self.read_events(HTTP_LAST_EVENT_ID=str(seen))
+
+        self.assertEqual([version for version, _ in events], [seen + 1])
+
+    def test_other_users_cannot_follow_a_job(self):
+        self.client.force_authenticate(User.objects.create_user(username='other', password='secret'))
+
+        response = self.client.get(f'/api/upload/{self.job_id}/events', HTTP_ACCEPT='text/event-stream')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_polling_fallback_is_cached_by_state_version(self):
+        first = self.client.get(f'/api/upload/{self.job_id}')
+        self.assertEqual(first.json()['stages']['upload']['status'], STAGE_RUNNING)
+
+        with self.assertNumQueries(1):  # the version, checked against the job's row
+            unchanged = self.client.get(f'/api/upload/{self.job_id}', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+
+        self.post_chunk(b'second', 2, 2)
+        changed = self.client.get(f'/api/upload/{self.job_id}', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['status'], UploadJob.STATUS_PROCESSING)
+        self.assertEqual(changed.json()['stages']['upload']['status'], STAGE_DONE)
+
+
+class PipelineTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post_chunk(b'data', 1, 1)
+        self.document = UploadedDocument.objects.get()
+
+    def test_independent_stages_run_concurrently(self):
+        both_started = threading.Barrier(2, timeout=5)
+
+        def independent(context):
+            both_started.wait()  # times out unless the other stage is running too
+            return threading.current_thread().name
+
+        pipeline = Pipeline([
+            Stage('a', independent),
+            Stage('b', independent),
+            Stage('c', lambda context: sorted(context['outputs']), depends_on=('a', 'b')),
+        ])
+        summary = pipeline.run(self.document, params={}, max_workers=2)
+
+        self.assertEqual(summary['status'], STATUS_DONE)
+        self.assertNotEqual(summary['outputs']['a'], summary['outputs']['b'])
+        self.assertEqual(summary['outputs']['c'], ['a', 'b'])
+        self.assertEqual(set(summary['timings_ms']), {'a', 'b', 'c'})
+
+    def test_rerun_retries_only_the_failed_parts(self):
+        calls = []
+        flaky = {'fail': True}
+
+        def run_part(context, part):
+            calls.append(part)
+            if part == 2 and flaky['fail']:
+                raise RuntimeError('timed out')
+            return part * 10
+
+        pipeline = Pipeline([
+            Stage('pages', run_part, split=lambda context: [(f'page-{n}', n) for n in (1, 2, 3)],
+                  merge=lambda context, outputs: sum(outputs)),
+            Stage('total', lambda context: context['outputs']['pages'], depends_on=('pages',)),
+        ])
+        first = pipeline.run(self.document, params={'language': 'es'})
+
+        self.assertEqual(first['status'], STATUS_FAILED)
+        self.assertEqual(first['statuses'], {'pages': STATUS_FAILED, 'total': STATUS_SKIPPED})
+        self.assertIn('timed out', first['errors']['pages'])
+
+        calls.clear()
+        flaky['fail'] = False
+        second = pipeline.run(self.document, params={'language': 'es'})
+
+        self.assertEqual(second['status'], STATUS_DONE)
+        self.assertEqual(calls, [2])
+        self.assertEqual(second['outputs']['total'], 60)
+        attempts = dict(
+            PipelineStageResult.objects.filter(stage='pages').exclude(part='').values_list('part', 'attempts')
+        )
+        self.assertEqual(attempts, {'page-1': 1, 'page-2': 2, 'page-3': 1})
+
+        calls.clear()
+        pipeline.run(self.document, params={'language': 'fr'})
+        self.assertEqual(sorted(calls), [1, 2, 3])
+
+
+class TranslateDocumentTests(PDFUploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Language.objects.create(code='es', name='Spanish')
+        self.post_chunk(self.make_pdf(), 1, 1, totalFiles=1)
+        self.document = UploadedDocument.objects.get()
+        parse_document(self.document.pk)
+
+    def fake_prompt(self, phase, **context):
+        replies = {
+            'language_detection': 'Primary Language: English\nConfidence: High',
+            'field_residue': '[]',
+            'glossary': '{"Family Name": "Apellido", "Unasked": "x"}',
+            'phase1': 'Apellido: ____\n\nFIELD MAPPING TABLE:\nFamily Name → Apellido (family_name)\n',
+            'quality_check': '{"quality_score": 9}',
+        }
+        return replies[phase]
+
+    def test_endpoint_schedules_parsed_documents(self):
+        with mock.patch('apps.documents.views.schedule_translation') as schedule:
+            response = self.client.post(f'/api/upload/{self.job_id}/translate', {'target_language': 'es'})
+
+        self.assertEqual(response.status_code, 202)
+        schedule.assert_called_once_with(self.document.pk, 'Spanish')
+        self.assertEqual(UploadedDocument.objects.get().status, UploadedDocument.STATUS_TRANSLATING)
+        self.assertEqual(UploadJob.objects.get().status, UploadJob.STATUS_PROCESSING)
+
+        unknown = self.client.post(f'/api/upload/{self.job_id}/translate', {'target_language': 'xx'})
+        self.assertEqual(unknown.status_code, 404)
+
+    def test_document_being_translated_is_not_claimed_twice(self):
+        with mock.patch('apps.documents.views.schedule_translation') as schedule:
+            first = self.client.post(f'/api/upload/{self.job_id}/translate', {'target_language': 'es'})
+            second = self.client.post(f'/api/upload/{self.job_id}/translate', {'target_language': 'es'})
+
+        self.assertEqual((first.status_code, second.status_code), (202, 409))
+        schedule.assert_called_once()
+
+    @override_settings(TRANSLATION_STALE_AFTER=600)
+    def test_abandoned_translation_can_be_claimed_again(self):
+        long_ago = timezone.now() - timedelta(seconds=900)
+        UploadedDocument.objects.update(status=UploadedDocument.STATUS_TRANSLATING, updated_at=long_ago)
+        row = PipelineStageResult.objects.create(
+            document=self.document, run_key='k', stage='translate', started_at=timezone.now()
+        )
+
+        with mock.patch('apps.documents.views.schedule_translation') as schedule:
+            running = self.client.post(f'/api/upload/{self.job_id}/translate', {'target_language': 'es'})
+            PipelineStageResult.objects.filter(pk=row.pk).update(started_at=long_ago)
+            abandoned = self.client.post(f'/api/upload/{self.job_id}/translate', {'target_language': 'es'})
+
+        self.assertEqual((running.status_code, abandoned.status_code), (409, 202))
+        schedule.assert_called_once_with(self.document.pk, 'Spanish')
+        self.assertGreater(UploadedDocument.objects.get().updated_at, long_ago)
+
+    def test_unexpected_error_fails_the_document(self):
+        UploadedDocument.objects.update(status=UploadedDocument.STATUS_TRANSLATING)
+
+        with mock.patch('apps.documents.stages.translation_pipeline.run', side_effect=RuntimeError('worker lost')), \
+                mock.patch('builtins.print'):
+            self.assertIsNone(translate_document(self.document.pk, 'Spanish'))
+
+        document = UploadedDocument.objects.get()
+        self.assertEqual((document.status, document.error), (UploadedDocument.STATUS_FAILED, 'worker lost'))
+        self.assertEqual(UploadJob.objects.get().status, UploadJob.STATUS_ERROR)
+
+    def test_document_is_translated_page_by_page(self):
+        with mock.patch('apps.documents.stages.request_prompt', side_effect=self.fake_prompt) as prompt:
+            summary = translate_document(self.document.pk, 'Spanish')
+
+        self.assertEqual(summary['status'], STATUS_DONE)
+        self.assertCountEqual(
+            [call.args[0] for call in prompt.call_args_list],
+            ['language_detection', 'glossary', 'phase1', 'quality_check'],
+        )
+        phase1 = next(call.kwargs for call in prompt.call_args_list if call.args[0] == 'phase1')
+        self.assertEqual(phase1['glossary'], {'Family Name': 'Apellido'})
+        self.assertNotIn('chunk', phase1['form_metadata'])
+
+        document = UploadedDocument.objects.get()
+        self.assertEqual(document.status, UploadedDocument.STATUS_TRANSLATED)
+        translation = document.result['translation']
+        self.assertEqual(translation['source_language'], 'English')
+        self.assertEqual(translation['text'], 'Apellido: ____')
+        self.assertEqual(translation['field_mapping'][0]['field_name'], 'family_name')
+        self.assertEqual(translation['quality'][0]['assessment'], {'quality_score': 9})
+        self.assertEqual(UploadJob.objects.get().status, UploadJob.STATUS_COMPLETE)
+
+        response = self.client.get(f'/api/upload/{self.job_id}')
+        stages = {result['stage'] for result in response.json()['documents'][0]['stage_results']}
+        self.assertEqual(stages, {'detect_language', 'extract_fields', 'glossary', 'translate', 'quality_check'})
+
+    def test_same_form_uploaded_again_reuses_the_llm_fields(self):
+        def fake_prompt(phase, **context):
+            if phase == 'field_residue':
+                return '[{"field_label": "Mother\'s maiden name", "field_type": "text"}]'
+            return self.fake_prompt(phase, **context)
+
+        with open(self.document.path, 'rb') as f:
+            data = f.read()
+        self.job_id = str(uuid.uuid4())
+        self.post_chunk(data, 1, 1, totalFiles=1)
+        second = UploadedDocument.objects.get(job__job_id=self.job_id)
+        parse_document(second.pk)
+
+        with mock.patch('apps.documents.stages.residue_text', return_value="Mother's maiden name"), \
+                mock.patch('apps.documents.stages.request_prompt', side_effect=fake_prompt) as prompt:
+            translate_document(self.document.pk, 'Spanish')
+            translate_document(second.pk, 'Spanish')
+
+        phases = [call.args[0] for call in prompt.call_args_list]
+        self.assertEqual(phases.count('field_residue'), 1)
+        for document in UploadedDocument.objects.all():
+            fields = document.result['translation']['fields']
+            self.assertEqual(fields[-1]['field_label'], "Mother's maiden name")
+
+
+    def test_filled_form_inputs_are_extracted_and_translated_back(self):
+        doc = fitz.open(self.document.path)
+        widget = fitz.Widget()
+        widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+        widget.field_name = 'family_name'
+        widget.field_value = 'García'
+        widget.rect = fitz.Rect(130, 80, 300, 95)
+        doc[0].add_widget(widget)
+        doc.saveIncr()
+        doc.close()
+
+        def fake_prompt(phase, **context):
+            return {
+                'input_extraction': 'Extracted:\n{"family_name": "García"}',
+                'phase2': 'Family Name: García',
+            }[phase]
+
+        with mock.patch('apps.documents.stages.request_prompt', side_effect=fake_prompt) as prompt:
+            summary = extract_user_inputs(self.document.pk, 'Spanish', 'Canada')
+
+        self.assertEqual(summary['status'], STATUS_DONE)
+        extraction, phase2 = (call.kwargs for call in prompt.call_args_list)
+        self.assertIn('family_name: García', extraction['filled_form_content'])
+        self.assertEqual(extraction['user_language'], 'Spanish')
+        self.assertEqual(phase2['user_inputs'], {'family_name': 'García'})
+        self.assertEqual(phase2['target_country'], 'Canada')
+
+        document = UploadedDocument.objects.get()
+        self.assertEqual(document.status, UploadedDocument.STATUS_TRANSLATED)
+        self.assertEqual(document.result['user_inputs']['reverse_translation'], 'Family Name: García')
+        self.assertEqual(UploadJob.objects.get().status, UploadJob.STATUS_COMPLETE)
+
+    def test_unreadable_extraction_reply_fails_phase2(self):
+        with mock.patch('apps.documents.stages.request_prompt', return_value='No fields found') as prompt, \
+                mock.patch('builtins.print'):
+            summary = extract_user_inputs(self.document.pk, 'Spanish')
+
+        self.assertNotEqual(summary['status'], STATUS_DONE)
+        self.assertEqual([call.args[0] for call in prompt.call_args_list], ['input_extraction'])
+        document = UploadedDocument.objects.get()
+        self.assertEqual(document.status, UploadedDocument.STATUS_FAILED)
+        self.assertIn('input_extraction', document.error)
+
+    def test_inputs_endpoint_schedules_parsed_documents(self):
+        with mock.patch('apps.documents.views.schedule_input_extraction') as schedule:
+            missing = self.client.post(f'/api/upload/{self.job_id}/inputs', {})
+            response = self.client.post(
+                f'/api/upload/{self.job_id}/inputs', {'user_language': 'es', 'target_country': 'Canada'}
+            )
+            again = self.client.post(f'/api/upload/{self.job_id}/inputs', {'user_language': 'es'})
+
+        self.assertEqual((missing.status_code, response.status_code, again.status_code), (400, 202, 409))
+        schedule.assert_called_once_with(self.document.pk, 'Spanish', 'Canada')
+        self.assertEqual(UploadedDocument.objects.get().status, UploadedDocument.STATUS_TRANSLATING)
+
+
+class SpanTableTests(SimpleTestCase):
+    spans = [
+        {'text': 'Family Name:', 'bbox': (50.0, 80.5, 120.25, 92.0), 'font': 'Helvetica', 'size': 10.0, 'flags': 0},
+        {'text': 'Nom de famille', 'bbox': (130.0, 80.5, 210.0, 92.0), 'font': 'Helvetica-Bold', 'size': 10.5,
+         'flags': 16},
+        {'text': '', 'bbox': (0.0, 0.0, 0.0, 0.0), 'font': 'Helvetica', 'size': 8.0, 'flags': 4},
+        {'text': '申请人', 'bbox': (50.0, 100.0, 80.0, 112.0), 'font': 'Helvetica', 'size': 12.0, 'flags': 0},
+    ]
+
+    def test_spans_round_trip_through_the_table(self):
+        table = SpanTable.from_spans(self.spans)
+
+        self.assertEqual(table.to_dicts(), self.spans)
+        self.assertEqual(table.fonts, ['Helvetica', 'Helvetica-Bold'])
+
+    def test_pickled_table_keeps_its_spans_and_accepts_more(self):
+        table = pickle.loads(pickle.dumps(SpanTable.from_spans(self.spans)))
+        table.append('Date of Birth', (50.0, 120.0, 110.0, 132.0), 'Helvetica-Bold', 10.0, 0)
+
+        self.assertEqual(table.to_dicts()[:4], self.spans)
+        self.assertEqual(table[-1]['text'], 'Date of Birth')
+        self.assertEqual(table.fonts, ['Helvetica', 'Helvetica-Bold'])
+
+    def test_indexing_works_like_a_list_of_dicts(self):
+        table = SpanTable()
+        for span in self.spans:
+            table.append(span['text'], span['bbox'], span['font'], span['size'], span['flags'])
+
+        # Read before freeze()
+        self.assertEqual(table[1]['text'], 'Nom de famille')
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table[-1]['text'], '申请人')
+        self.assertEqual([span['text'] for span in table[1:3]], ['Nom de famille', ''])
+        self.assertEqual(dict(table[0]), self.spans[0])
+        self.assertEqual(table[1].get('flags'), 16)
+        with self.assertRaises(IndexError):
+            table[4]
+        with self.assertRaises(KeyError):
+            table[0]['color']
+
+    def test_compact_extraction_matches_the_dict_form(self):
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((50, 90), 'Family Name: ____________________', fontsize=10)
+        page.insert_text((50, 120), 'Date of Birth', fontsize=12)
+        path = os.path.join(tempfile.mkdtemp(), 'form.pdf')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        doc.save(path)
+        doc.close()
+
+        plain = extract_pdf_structure(path)
+        compact = extract_pdf_structure(path, compact=True)
+
+        self.assertIsInstance(compact[0]['text_blocks'], SpanTable)
+        self.assertEqual([span['text'] for span in compact[0]['text_blocks']],
+                         [span['text'] for span in plain[0]['text_blocks']])
+        for dict_span, table_span in zip(plain[0]['text_blocks'], compact[0]['text_blocks']):
+            for expected, value in zip(dict_span['bbox'], table_span['bbox']):
+                self.assertAlmostEqual(expected, value, places=3)
+        self.assertGreater(compact[0]['memory_bytes'], 0)
+
+    def test_short_documents_are_extracted_serially(self):
+        self.assertEqual(choose_worker_count(16, cpu_count=8), 1)
+        self.assertEqual(choose_worker_count(150, cpu_count=8), 1)
+        self.assertEqual(choose_worker_count(300, cpu_count=2), 1)
+        self.assertEqual(choose_worker_count(1000, cpu_count=2), 2)
+        self.assertGreater(choose_worker_count(1000, cpu_count=8), 2)
+
+
+class PDFCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.cache = PDFCache(directory=os.path.join(self.directory, 'cache'), max_bytes=1024 * 1024)
+
+    def test_shared_cache_is_configured_from_settings(self):
+        directory = os.path.join(self.directory, 'shared')
+        with override_settings(PDF_CACHE_DIR=directory, PDF_CACHE_MAX_BYTES=4096), \
+                mock.patch('utils.pdf_cache._pdf_cache', None):
+            cache = get_pdf_cache()
+
+            self.assertIs(get_pdf_cache(), cache)
+        self.assertEqual((cache.directory, cache.max_bytes), (directory, 4096))
+
+    def make_pdf_file(self, text):
+        doc = fitz.open()
+        doc.new_page().insert_text((50, 90), text, fontsize=10)
+        path = os.path.join(self.directory, f'{uuid.uuid4().hex}.pdf')
+        doc.save(path)
+        doc.close()
+        return path
+
+    def test_miss_extracts_and_stores_then_hits(self):
+        path = self.make_pdf_file('Family Name: ____')
+        extract = mock.Mock(wraps=extract_pdf_structure)
+
+        key, first = self.cache.get_or_extract(path, extract_fn=extract)
+        again_key, second = self.cache.get_or_extract(path, extract_fn=extract)
+
+        extract.assert_called_once()
+        self.assertEqual(key, again_key)
+        self.assertEqual(first, second)
+        stats = self.cache.stats.snapshot()
+        self.assertEqual((stats['hits'], stats['misses'], stats['stores']), (1, 1, 1))
+
+    def test_same_bytes_at_another_path_hit(self):
+        path = self.make_pdf_file('Family Name: ____')
+        copy = os.path.join(self.directory, 'copy.pdf')
+        shutil.copy(path, copy)
+        extract = mock.Mock(wraps=extract_pdf_structure)
+
+        self.cache.get_or_extract(path, extract_fn=extract)
+        self.cache.get_or_extract(copy, extract_fn=extract)
+
+        extract.assert_called_once()
+
+    def test_workers_share_an_entry_but_other_options_do_not(self):
+        path = self.make_pdf_file('Family Name: ____')
+        extract = mock.Mock(return_value=[{'page': 1}])
+
+        self.cache.get_or_extract(path, extract_fn=extract, workers=1)
+        self.cache.get_or_extract(path, extract_fn=extract, workers=4)
+        self.cache.get_or_extract(path, extract_fn=extract, compact=True)
+
+        self.assertEqual(extract.call_count, 2)
+
+    def test_parser_version_bump_invalidates_entries(self):
+        path = self.make_pdf_file('Family Name: ____')
+        extract = mock.Mock(return_value=[{'page': 1}])
+        self.cache.get_or_extract(path, extract_fn=extract)
+
+        bumped = PDFCache(directory=self.cache.directory, parser_version='next')
+        key, _ = bumped.get_or_extract(path, extract_fn=extract)
+
+        self.assertEqual(extract.call_count, 2)
+        self.assertTrue(key.endswith('-vnext'))
+        self.assertEqual(bumped.stats.snapshot()['misses'], 1)
+
+    def test_fields_are_cached_per_variant(self):
+        key = self.cache.key(b'%PDF-1.7 form')
+        self.cache.set_fields(key, {'fields': [1]}, 'prompt-a')
+
+        self.assertEqual(self.cache.get_fields(key, 'prompt-a'), {'fields': [1]})
+        self.assertIsNone(self.cache.get_fields(key, 'prompt-b'))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        payload = os.urandom(4096)  # incompressible
+        cache = PDFCache(directory=self.cache.directory, max_bytes=3 * 4200)
+        keys = [cache.key(bytes([n])) for n in range(3)]
+        for age, key in enumerate(keys):
+            cache.set(key, payload)
+            past = time.time() - 100 + age
+            os.utime(cache._path(key, 'structure'), (past, past))
+        cache.get(keys[0])  # now the most recently used
+
+        cache.set(cache.key(b'new'), payload)
+
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(cache.key(b'new')))
+        self.assertGreaterEqual(cache.stats.snapshot()['evictions'], 1)
+        self.assertLessEqual(cache.size(), cache.max_bytes)
+
+    def test_unreadable_entry_is_a_miss_and_removed(self):
+        key = self.cache.key(b'%PDF-1.7 form')
+        self.cache.set(key, {'pages': []})
+        path = self.cache._path(key, 'structure')
+        with open(path, 'wb') as f:
+            f.write(b'not zlib')
+
+        with mock.patch('builtins.print'):
+            self.assertIsNone(self.cache.get(key))
+
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.cache.stats.snapshot()['errors'], 1)
+
+    def test_world_writable_directory_is_refused(self):
+        directory = os.path.join(self.directory, 'shared')
+        os.makedirs(directory)
+        os.chmod(directory, 0o777)
+
+        with self.assertRaises(PermissionError):
+            PDFCache(directory=directory).get(self.cache.key(b'x'))
+
+    def test_eviction_deletes_stale_temp_files_only(self):
+        self.cache.set('ab' + '0' * 62, {'pages': []})
+        shard = os.path.join(self.cache.directory, 'ab')
+        stale, fresh = os.path.join(shard, 'dead.tmp'), os.path.join(shard, 'writing.tmp')
+        for path in (stale, fresh):
+            with open(path, 'wb') as f:
+                f.write(b'partial')
+        os.utime(stale, (time.time() - 2 * 3600,) * 2)
+
+        self.cache._evict()
+
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+
+class FieldDetectionTests(SimpleTestCase):
+
+    def setUp(self):
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((50, 60), 'Part 1. Applicant', fontsize=14)
+        page.insert_text((50, 90), 'Family Name', fontsize=10)
+        self.add_widget(page, fitz.PDF_WIDGET_TYPE_TEXT, 'family_name', (130, 80, 300, 94),
+                        field_flags=fitz.PDF_FIELD_IS_REQUIRED, text_maxlen=40)
+        self.add_widget(page, fitz.PDF_WIDGET_TYPE_COMBOBOX, 'country', (130, 100, 300, 114),
+                        field_label='Country of birth', choice_values=['Canada', 'Mexico'])
+        for left in (130, 160):
+            self.add_widget(page, fitz.PDF_WIDGET_TYPE_RADIOBUTTON, 'married', (left, 120, left + 12, 132),
+                            field_value=False)
+
+        page.insert_text((50, 200), 'Part 2. Travel', fontsize=14)
+        page.insert_text((50, 230), 'Date of Birth: ____________________', fontsize=10)
+        page.insert_text((50, 250), '[ ] I have a passport', fontsize=10)
+        page.insert_text((50, 270), 'City:', fontsize=10)
+        page.insert_text((50, 290), 'Mother name:', fontsize=10)
+        page.insert_text((120, 290), 'as shown on the birth certificate', fontsize=10)
+        page.insert_text((50, 320), 'Signature of applicant: ____________', fontsize=10)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'form.pdf')
+        doc.save(self.path)
+        doc.close()
+
+    @staticmethod
+    def add_widget(page, field_type, name, rect, **attributes):
+        widget = fitz.Widget()
+        widget.field_type = field_type
+        widget.field_name = name
+        widget.rect = fitz.Rect(rect)
+        for attribute, value in attributes.items():
+            setattr(widget, attribute, value)
+        page.add_widget(widget)
+
+    def fields_by_label(self, detection):
+        return {field['field_label']: field for field in detection['fields']}
+
+    def test_widgets_are_read_and_labelled_from_the_page(self):
+        fields = self.fields_by_label(detect_fields(self.path))
+
+        family_name = fields['Family Name']
+        self.assertEqual(family_name['field_id'], 'family_name')
+        self.assertEqual((family_name['field_type'], family_name['required']), ('text', True))
+        self.assertEqual(family_name['validation_rules'], ['max_length:40'])
+        self.assertEqual(family_name['legal_importance'], 'important')
+
+        country = fields['Country of birth']
+        self.assertEqual((country['field_type'], country['options']), ('select', ['Canada', 'Mexico']))
+
+        married = [field for field in fields.values() if field['field_id'] == 'married']
+        self.assertEqual(len(married), 1)  # radio group merged
+        self.assertEqual((married[0]['field_type'], len(married[0]['options'])), ('radio', 2))
+        self.assertTrue(all(field['source'] == 'widget' for field in (family_name, country, married[0])))
+
+    def test_printed_fields_are_detected_from_layout(self):
+        fields = self.fields_by_label(detect_fields(self.path))
+
+        self.assertEqual(fields['Date of Birth']['field_type'], 'date')
+        self.assertEqual(fields['I have a passport']['field_type'], 'checkbox')
+        self.assertEqual(fields['City']['field_type'], 'text')
+        signature = fields['Signature of applicant']
+        self.assertEqual((signature['field_type'], signature['legal_importance']), ('signature', 'critical'))
+        for label in ('Date of Birth', 'I have a passport', 'City'):
+            self.assertEqual(fields[label]['source'], 'layout')
+            self.assertEqual(fields[label]['section'], 'Part 2. Travel')
+        self.assertEqual(fields['Family Name']['section'], 'Part 1. Applicant')
+
+    def test_unresolved_labels_are_the_residue(self):
+        detection = detect_fields(self.path)
+
+        self.assertEqual(detection['residue'], [{'page': 1, 'lines': ['Mother name:']}])
+        self.assertEqual(residue_text(detection), '[Page 1]\nMother name:')
+        self.assertNotIn('Mother name', self.fields_by_label(detection))
+        metadata = detection['metadata']
+        self.assertEqual((metadata['widget_fields'], metadata['layout_fields']), (3, 4))
+        self.assertEqual(metadata['total_fields'], len(detection['fields']))
+        self.assertEqual(metadata['residue_chars'], len('Mother name:'))
+
+    def test_form_without_residue_has_no_residue_text(self):
+        doc = fitz.open()
+        doc.new_page().insert_text((50, 90), 'Family Name: ____________', fontsize=10)
+        path = os.path.join(os.path.dirname(self.path), 'plain.pdf')
+        doc.save(path)
+        doc.close()
+
+        detection = detect_fields(path)
+
+        self.assertEqual(detection['residue'], [])
+        self.assertEqual(residue_text(detection), '')
+
+    def test_cached_structure_gives_the_same_fields(self):
+        structure = extract_pdf_structure(self.path, compact=True)
+
+        self.assertEqual(detect_fields(self.path, structure), detect_fields(self.path))
+
+
+class OverlayTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, 'form.pdf')
+        self.output = os.path.join(self.directory, 'translated.pdf')
+
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((50, 90), 'Family Name', fontsize=10)
+        page.insert_text((150, 90), 'Given Name', fontsize=10)
+        page.insert_text((50, 130), 'City', fontsize=10)
+        page.insert_text((150, 130), 'State', fontsize=10)
+        widget = fitz.Widget()
+        widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+        widget.field_name = 'family_name'
+        widget.rect = fitz.Rect(50, 160, 250, 174)
+        page.add_widget(widget)
+        doc.save(self.path)
+        doc.close()
+        self.structure = extract_pdf_structure(self.path)
+
+    def overlay(self, translations, **kwargs):
+        stats = overlay_translations(self.path, self.structure, translations, self.output, 'Spanish', **kwargs)
+        with fitz.open(self.output) as doc:
+            page = doc[0]
+            words = page.get_text('words')
+            notes = [annot.info['content'] for annot in page.annots(types=[fitz.PDF_ANNOT_TEXT])]
+        return stats, words, notes
+
+    def bbox(self, text):
+        return next(span['bbox'] for span in self.structure[0]['text_blocks'] if span['text'].strip() == text)
+
+    def assert_inside(self, words, text, bbox):
+        placed = [word for word in words if word[4] in text.split()]
+        self.assertEqual(sorted(word[4] for word in placed), sorted(text.split()))
+        for word in placed:
+            self.assertGreaterEqual(word[0], bbox[0] - 0.5)
+            self.assertLessEqual(word[2], bbox[2] + 0.5)
+            self.assertGreaterEqual(word[1], bbox[1] - 0.5)
+            self.assertLessEqual(word[3], bbox[3] + 0.5)
+
+    def test_changed_spans_are_replaced_and_the_rest_kept(self):
+        stats, words, notes = self.overlay({'Family Name': 'Apellido', 'State': 'State'})
+
+        self.assertEqual(stats, {'spans_replaced': 1, 'spans_overflowed': 0, 'fields_filled': 0})
+        texts = [word[4] for word in words]
+        self.assertIn('Apellido', texts)
+        self.assertNotIn('Family', texts)
+        for kept in ('Given', 'City', 'State'):
+            self.assertIn(kept, texts)
+        self.assertEqual(notes, [])
+
+    def test_long_translation_wraps_inside_its_bbox(self):
+        translation = 'Apellido o nombre de familia'
+        stats, words, notes = self.overlay({'Family Name': translation})
+
+        self.assertEqual(stats['spans_overflowed'], 0)
+        self.assert_inside(words, translation, self.bbox('Family Name'))
+        self.assertGreater(len({round(word[3]) for word in words if word[4] in translation.split()}), 1)
+        self.assertEqual(notes, [])
+
+    def test_translation_too_long_to_fit_is_annotated_not_spilled(self):
+        translation = 'Ciudad o municipio de residencia actual del solicitante principal'
+        stats, words, notes = self.overlay({'City': translation, 'Family Name': 'Apellido'})
+
+        self.assertEqual(stats, {'spans_replaced': 2, 'spans_overflowed': 1, 'fields_filled': 0})
+        self.assert_inside(words, translation, self.bbox('City'))
+        self.assertIn('State', [word[4] for word in words])
+        self.assertEqual(notes, [translation])
+
+    def test_widgets_are_filled(self):
+        stats, _, _ = self.overlay({}, field_values={'family_name': 'García', 'missing': 'x'})
+
+        self.assertEqual(stats, {'spans_replaced': 0, 'spans_overflowed': 0, 'fields_filled': 1})
+        with fitz.open(self.output) as doc:
+            self.assertEqual(next(doc[0].widgets()).field_value, 'García')
+
+
+class PDFRendererTests(SimpleTestCase):
+    """The pool with WeasyPrint stubbed out: worker threads run stub_render"""
+
+    timings = {'pages': 1, 'stylesheet_ms': 1.0, 'layout_ms': 2.0, 'write_ms': 3.0, 'cold_stylesheet': False}
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.started = threading.Semaphore(0)
+        render_stats.reset()
+
+        def executor(max_workers, mp_context, initializer, initargs):
+            return ThreadPoolExecutor(max_workers)
+
+        for target, replacement in (('ProcessPoolExecutor', executor), ('_render', self.stub_render)):
+            patcher = mock.patch(f'utils.pdf_render.{target}', replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stub_render(self, html, output_path, language):
+        self.started.release()
+        if not self.release.wait(5):
+            raise RuntimeError('stub render never released')
+        if html == 'broken':
+            raise ValueError('layout failed')
+        return dict(self.timings)
+
+    def make_renderer(self, **kwargs):
+        renderer = PDFRenderer(**kwargs)
+        self.addCleanup(renderer.shutdown)
+        return renderer
+
+    def test_submissions_beyond_max_pending_are_rejected(self):
+        renderer = self.make_renderer(workers=1, max_pending=2, queue_timeout=0.05)
+        futures = [renderer.submit('<p>x</p>', 'out.pdf') for _ in range(2)]
+
+        with self.assertRaises(RenderQueueFull):
+            renderer.submit('<p>x</p>', 'out.pdf')
+        self.assertEqual(render_stats.snapshot()['rejected'], 1)
+
+        self.release.set()
+        for future in futures:
+            self.assertEqual(future.result(timeout=5)['pages'], 1)
+        renderer.queue_timeout = 5  # slots are freed by done callbacks
+        self.assertEqual(renderer.submit('<p>x</p>', 'out.pdf').result(timeout=5)['pages'], 1)
+        snapshot = render_stats.snapshot()
+        self.assertEqual((snapshot['renders'], snapshot['rejected']), (3, 1))
+        self.assertEqual(snapshot['avg_layout_ms'], 2.0)
+
+    def test_waiting_submission_gets_the_freed_slot(self):
+        renderer = self.make_renderer(workers=1, max_pending=1, queue_timeout=5)
+        first = renderer.submit('<p>x</p>', 'out.pdf')
+        self.assertTrue(self.started.acquire(timeout=5))
+
+        threading.Timer(0.05, self.release.set).start()
+        second = renderer.submit('<p>y</p>', 'out.pdf')
+
+        self.assertTrue(first.done())
+        self.assertEqual(second.result(timeout=5)['pages'], 1)
+        self.assertGreater(render_stats.snapshot()['queue_wait_ms'], 0)
+
+    def test_render_times_out_and_the_slot_is_freed_later(self):
+        renderer = self.make_renderer(workers=1, max_pending=1, queue_timeout=0.05)
+
+        with self.assertRaises(TimeoutError):
+            renderer.render('<p>x</p>', 'out.pdf', timeout=0.05)
+        with self.assertRaises(RenderQueueFull):
+            renderer.submit('<p>x</p>', 'out.pdf')
+
+        self.release.set()
+        renderer.queue_timeout = 5
+        self.assertEqual(renderer.render('<p>x</p>', 'out.pdf', timeout=5)['pages'], 1)
+
+    def test_failed_render_is_counted_and_releases_its_slot(self):
+        renderer = self.make_renderer(workers=1, max_pending=1, queue_timeout=5)
+        self.release.set()
+
+        with self.assertRaises(ValueError):
+            renderer.render('broken', 'out.pdf', timeout=5)
+        self.assertEqual(renderer.render('<p>x</p>', 'out.pdf', timeout=5)['pages'], 1)
+
+        snapshot = render_stats.snapshot()
+        self.assertEqual((snapshot['failures'], snapshot['renders']), (1, 1))
+
+    @override_settings(PDF_RENDER_WORKERS=1, PDF_RENDER_MAX_PENDING=3, PDF_RENDER_QUEUE_TIMEOUT=0.5,
+                       PDF_RENDER_TIMEOUT=0.05)
+    def test_shared_pool_is_configured_from_settings(self):
+        with mock.patch('utils.pdf_render._pdf_renderer', None):
+            renderer = get_pdf_renderer()
+        self.addCleanup(renderer.shutdown)
+
+        self.assertEqual((renderer.max_pending, renderer.queue_timeout), (3, 0.5))
+        with self.assertRaises(TimeoutError):
+            renderer.render('<p>x</p>', 'out.pdf')
+        self.release.set()
+
+
+class ChunkingTests(SimpleTestCase):
+
+    def span(self, text, size=10.0, flags=0):
+        return {'text': text, 'bbox': [0, 0, 0, 0], 'font': 'Helvetica', 'size': size, 'flags': flags}
+
+    def page(self, number, lines, heading=None):
+        spans = [self.span(heading, size=14.0)] if heading else []
+        return {'page_number': number, 'text_blocks': spans + [self.span(line) for line in lines]}
+
+    def test_token_estimates_account_for_script(self):
+        self.assertEqual(estimate_tokens('abcdefgh'), 2)
+        self.assertEqual(estimate_tokens('абвг'), 2)
+        self.assertEqual(estimate_tokens('申请表格'), 4)
+        self.assertEqual(estimate_tokens('Name: Müller 申请'), 3 + 1 + 2)
+
+    def test_pages_are_packed_within_the_budget(self):
+        structure = [self.page(number, [f'Line {number}-{line} ' + 'x' * 30 for line in range(10)])
+                     for number in range(1, 31)]
+        fields = [{'field_label': 'Line 3-0', 'page': 3}]
+        chunks = chunk_form(structure, fields, budget=250)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk['tokens'] <= 250 for chunk in chunks))
+        self.assertEqual([page for chunk in chunks for page in chunk['pages']], list(range(1, 31)))
+        self.assertEqual([chunk['key'] for chunk in chunks][:2], ['chunk-1', 'chunk-2'])
+        self.assertEqual(next(chunk for chunk in chunks if 3 in chunk['pages'])['fields'], fields)
+        self.assertTrue(chunks[0]['text'].startswith('--- Page 1 ---'))
+
+    def test_oversized_page_splits_on_section_headings(self):
+        lines = ['y' * 200] * 3
+        structure = [{'page_number': 1, 'text_blocks': (
+            [self.span('Part 1. Applicant', size=14.0)] + [self.span(line) for line in lines]
+            + [self.span('Part 2. Spouse', size=14.0)] + [self.span(line) for line in lines]
+        )}]
+        chunks = chunk_form(structure, budget=200)
+
+        self.assertEqual(len(chunks), 2)
+        self.assertIn('Part 1. Applicant', chunks[0]['text'])
+        self.assertTrue(chunks[1]['text'].split('\n')[1].startswith('Part 2. Spouse'))
+
+    def test_glossary_has_labels_headings_and_recurring_lines(self):
+        structure = [
+            self.page(1, ['For official use only', 'Once'], heading='Part 1. Applicant'),
+            self.page(2, ['For official use only', '________']),
+        ]
+        terms = build_glossary(structure, [{'field_label': 'Family Name:', 'section': 'Part 1. Applicant'}])
+
+        self.assertEqual(terms, ['Family Name', 'Part 1. Applicant', 'For official use only'])
+
+    def test_stitching_merges_field_mapping_tables(self):
+        replies = [
+            'Parte 1\n\nFIELD MAPPING TABLE:\nOriginal Field Label → Translated Label (Technical Field Name)\n'
+            '- Family Name → Apellido (family_name)\n\nTRANSLATION NOTES:\n- Formal register',
+            'Parte 2\n\n**FIELD MAPPING TABLE**\nFamily Name → Apellidos\nCity -> Ciudad (city)\n'
+            'TRANSLATION NOTES:\n- Formal register',
+        ]
+        stitched = stitch_translations(replies)
+
+        self.assertEqual(stitched['text'], 'Parte 1\n\nParte 2')
+        self.assertEqual(stitched['field_mapping'], [
+            {'original': 'Family Name', 'translated': 'Apellido', 'field_name': 'family_name'},
+            {'original': 'City', 'translated': 'Ciudad', 'field_name': 'city'},
+        ])
+        self.assertEqual(stitched['notes'], ['- Formal register'])
+
+
+class PromptEncodingTests(SimpleTestCase):
+    fields = [
+        {'field_id': 'f1', 'field_label': 'Family Name', 'required': True, 'options': [], 'help_text': None},
+        {'field_id': 'f2', 'field_label': 'Sex | Gender', 'required': False, 'options': ['M', 'F']},
+    ]
+
+    def test_table_encoding_drops_empty_columns_and_quotes_separators(self):
+        self.assertEqual(encode_payload(self.fields, 'table').split('\n')[1:], [
+            'field_id|field_label|required|options',
+            'f1|Family Name|true|',
+            'f2|"Sex | Gender"|false|["M","F"]',
+        ])
+
+    def test_compact_encoding_round_trips(self):
+        encoded = encode_payload({'name': 'Ζωή', 'fields': self.fields}, 'compact')
+        self.assertNotIn(' ', encoded.replace('Family Name', '').replace('Sex | Gender', ''))
+        self.assertEqual(json.loads(encoded), {'name': 'Ζωή', 'fields': self.fields})
+        with self.assertRaises(ValueError):
+            encode_payload(self.fields, 'yaml')
+
+    def test_phase_encoding_is_configurable(self):
+        with override_settings(PROMPT_ENCODINGS={'phase1': 'pretty'}):
+            pretty = ImmigrationFormPrompts.phase1_translation_prompt('text', self.fields, {}, 'Spanish')
+        table = ImmigrationFormPrompts.phase1_translation_prompt('text', self.fields, {}, 'Spanish')
+
+        self.assertIn(json.dumps(self.fields, indent=2), pretty)
+        self.assertIn('field_id|field_label|required|options', table)
+        self.assertLess(estimate_tokens(table), estimate_tokens(pretty))
+
+    def test_phase2_sends_user_inputs_once(self):
+        user_inputs = {'filled_fields': {'f1': 'Doe'}, 'empty_fields': ['f2'], 'completion_percentage': 50}
+        prompt = ImmigrationFormPrompts.phase2_reverse_translation_prompt(
+            {'fields': self.fields}, user_inputs, 'Spanish', encoding='compact')
+
+        self.assertEqual(prompt.count("'f2'") + prompt.count('"f2"'), 2)  # structure + empty fields line
+        self.assertIn('{"filled_fields":{"f1":"Doe"}}', prompt)
+
+
+class PromptTemplateTests(SimpleTestCase):
+
+    def test_requests_share_the_static_prefix_for_their_language(self):
+        first = ImmigrationFormPrompts.phase1_translation_prompt(
+            'Nom: ____', [{'field_id': 'f1'}], {'title': 'A'}, 'Spanish', 'French')
+        second = ImmigrationFormPrompts.phase1_translation_prompt(
+            'Name: ____', [{'field_id': 'f2'}], {'title': 'B'}, 'Spanish', 'German', glossary={'Name': 'Nombre'})
+        other_language = ImmigrationFormPrompts.phase1_translation_prompt(
+            'Nom: ____', [{'field_id': 'f1'}], {'title': 'A'}, 'Arabic', 'French')
+
+        prefix = static_prefix('phase1', 'Spanish')
+        self.assertTrue(first.startswith(prefix))
+        self.assertTrue(second.startswith(prefix))
+        self.assertFalse(other_language.startswith(prefix))
+        self.assertIn('IMMIGRATION FORM TRANSLATION - PHASE 1', prefix)
+        for value in ('Nom: ____', 'French', 'f1'):
+            self.assertIn(value, first[len(prefix):])
+
+    def test_static_prefixes_are_memoized(self):
+        self.assertIs(static_prefix('quality_check'), static_prefix('quality_check'))
+        self.assertIs(static_prefix('glossary', 'Hindi'), static_prefix('glossary', 'Hindi'))
+        with self.assertRaises(ValueError):
+            static_prefix('phase3')
+
+
+class TracingTests(PDFUploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.trace_file = os.path.join(self.upload_dir, 'traces.jsonl')
+        for name, value in (('exporter', 'file'), ('path', self.trace_file), ('sample_rate', 1.0)):
+            patcher = mock.patch.object(tracer, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def spans(self):
+        if not os.path.exists(self.trace_file):
+            return []
+        with open(self.trace_file, encoding='utf-8') as spans:
+            return [json.loads(line) for line in spans]
+
+    def test_request_spans_nest_and_carry_the_request_id(self):
+        response = self.post_chunk(self.make_pdf(), 1, 1, totalFiles=1)
+
+        spans = self.spans()
+        root = spans[-1]
+        self.assertEqual(root['name'], 'POST api/upload-chunk')
+        self.assertNotIn('parentSpanId', root)
+        self.assertEqual(root['attributes']['http.status_code'], response.status_code)
+        self.assertEqual(response['X-Request-ID'], root['traceId'])
+        self.assertEqual(response['traceresponse'], f"00-{root['traceId']}-{root['spanId']}-01")
+
+        queries = [span for span in spans if span['name'] == 'db.query']
+        self.assertTrue(queries)
+        for span in queries:
+            self.assertEqual((span['traceId'], span['parentSpanId']), (root['traceId'], root['spanId']))
+            self.assertEqual(span['attributes']['db.system'], 'sqlite')
+
+    def test_unsampled_requests_keep_the_request_id_but_export_nothing(self):
+        tracer.sample_rate = 0.0
+
+        response = self.client.get(f'/api/upload/{self.job_id}', HTTP_X_REQUEST_ID='client-42')
+
+        self.assertEqual(response['X-Request-ID'], 'client-42')
+        self.assertTrue(response['traceresponse'].endswith('-00'))
+        self.assertEqual(self.spans(), [])
+
+    def test_incoming_traceparent_is_continued(self):
+        tracer.sample_rate = 0.0
+        trace_id, parent_id = '4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7'
+
+        self.client.get(f'/api/upload/{self.job_id}', HTTP_TRACEPARENT=f'00-{trace_id}-{parent_id}-01')
+
+        root = self.spans()[-1]
+        self.assertEqual((root['traceId'], root['parentSpanId']), (trace_id, parent_id))
+        self.assertEqual(root['attributes']['http.route'], 'api/upload/<uuid:job_id>')
+
+    @override_settings(TRACE_SAMPLE_RATE=0.25, TRACE_EXPORTER='none', TRACE_FILE='spans.jsonl',
+                       TRACE_SERVICE_NAME='im-buddy-worker')
+    def test_tracer_is_configured_from_settings(self):
+        configured = SimpleLazyObject(_tracer_from_settings)
+
+        self.assertEqual((configured.sample_rate, configured.exporter, configured.path, configured.service_name),
+                         (0.25, 'none', 'spans.jsonl', 'im-buddy-worker'))
+
+    def test_spans_follow_work_to_other_threads_and_the_llm(self):
+        reply = mock.Mock(status_code=200, json=mock.Mock(return_value={'choices': []}))
+        with mock.patch('services.llama_common.get_session') as get_session, \
+                ThreadPoolExecutor(max_workers=1) as executor:
+            get_session.return_value.post.return_value = reply
+            with start_span('outer') as outer:
+                executor.submit(in_current_context(make_api_request),
+                                'http://llm/chat', {'model': 'm', 'max_tokens': 10}).result()
+
+        llm, root = self.spans()
+        self.assertEqual((llm['name'], llm['parentSpanId']), ('llm.request', outer.span_id))
+        self.assertEqual(llm['attributes']['llm.model'], 'm')
+        headers = get_session.return_value.post.call_args.kwargs['headers']
+        self.assertEqual(headers['traceparent'], f"00-{outer.trace_id}-{llm['spanId']}-01")
+        self.assertEqual(root['spanId'], outer.span_id)
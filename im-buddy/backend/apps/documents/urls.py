@@ -0,0 +1,11 @@
+from django.urls import path
+from .views import extract_upload_inputs, translate_upload, upload_chunk, upload_events, upload_status
+
+urlpatterns = [
+    # No trailing slash: the frontend posts to /api/upload-chunk
+    path('upload-chunk', upload_chunk, name='upload_chunk'),
+    path('upload/<uuid:job_id>', upload_status, name='upload_status'),
+    path('upload/<uuid:job_id>/events', upload_events, name='upload_events'),
+    path('upload/<uuid:job_id>/translate', translate_upload, name='translate_upload'),
+    path('upload/<uuid:job_id>/inputs', extract_upload_inputs, name='extract_upload_inputs'),
+]
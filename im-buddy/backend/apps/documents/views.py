@@ -0,0 +1,313 @@
+import json
+import os
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import ensure_csrf_cookie
+from rest_framework import status
+from rest_framework.decorators import api_view, parser_classes, permission_classes, renderer_classes
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from apps.visa_info.models import Language
+from .chunks import (
+    ChunkError, ChunkTooLarge, assemble, job_bytes, job_dir, part_size, parts_dir, received_chunks, write_chunk,
+)
+from .events import EventStreamRenderer, async_event_stream, event_stream
+from .jobs import STAGE_DONE, STAGE_RUNNING, job_registry
+from .models import UploadedDocument, UploadJob
+from .parsing import reschedule_if_stuck, schedule_parse, update_job_status
+from .serializers import UploadJobSerializer
+from .stages import claim_translation, schedule_input_extraction, schedule_translation
+
+
+def _bad_request(message):
+    return Response({'error': message}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _positive_int(value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def _uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _clean_file_name(value):
+    # Only the base name is kept
+    name = os.path.basename(str(value or '').replace('\\', '/')).strip()[:255]
+    return '' if name in ('.', '..') else name
+
+
+def _progress(document, received):
+    return {
+        'jobId': str(document.job.job_id),
+        'fileName': document.file_name,
+        'status': document.status,
+        'totalChunks': document.total_chunks,
+        'received': len(received),
+        'missing': sorted(set(range(1, document.total_chunks + 1)) - set(received)),
+        'complete': document.status != UploadedDocument.STATUS_RECEIVING,
+    }
+
+
+def _document_progress(document):
+    if document.status != UploadedDocument.STATUS_RECEIVING:
+        return _progress(document, range(1, document.total_chunks + 1))
+    directory = parts_dir(settings.UPLOAD_DIR, document.job.job_id, document.file_name)
+    return _progress(document, received_chunks(directory))
+
+
+@ensure_csrf_cookie
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser])
+def upload_chunk(request):
+    """
+    Receive one chunk of a file, gzip-compressed or not
+
+    POST multipart fields: chunk (the bytes) and metadata (JSON with jobId,
+    fileName, chunkIndex from 1, totalChunks, originalSize and optionally
+    totalFiles). Chunks may be sent in any order and retried; the file is
+    assembled and parsed once all have arrived.
+
+    GET ?jobId=&fileName= reports which chunks are still missing, so an
+    interrupted upload can resume. Every response sets the csrftoken
+    cookie, which session-authenticated POSTs send back as X-CSRFToken.
+
+    A job's files may hold UPLOAD_MAX_JOB_BYTES in total (decompressed);
+    chunks past that are refused with 413. Polling a document whose parse
+    was lost in a restart schedules it again.
+    """
+    if request.method == 'GET':
+        job_id = _uuid(request.query_params.get('jobId'))
+        if job_id is None:
+            return _bad_request('jobId must be a UUID')
+        document = get_object_or_404(
+            UploadedDocument.objects.select_related('job'),
+            job__job_id=job_id,
+            job__user=request.user,
+            file_name=_clean_file_name(request.query_params.get('fileName')),
+        )
+        reschedule_if_stuck(document)
+        return Response(_document_progress(document))
+
+    chunk = request.FILES.get('chunk')
+    try:
+        metadata = json.loads(request.data.get('metadata') or '')
+    except ValueError:
+        metadata = None
+    if chunk is None or not isinstance(metadata, dict):
+        return _bad_request('chunk and metadata are required')
+
+    job_id = _uuid(metadata.get('jobId'))
+    if job_id is None:
+        return _bad_request('metadata.jobId must be a UUID')
+    file_name = _clean_file_name(metadata.get('fileName'))
+    chunk_index = _positive_int(metadata.get('chunkIndex'))
+    total_chunks = _positive_int(metadata.get('totalChunks'))
+    if not file_name or not chunk_index or not total_chunks:
+        return _bad_request('metadata needs fileName, chunkIndex and totalChunks')
+    if chunk_index > total_chunks or total_chunks > settings.UPLOAD_MAX_CHUNKS:
+        return _bad_request(f'chunkIndex must be 1..totalChunks, at most {settings.UPLOAD_MAX_CHUNKS} chunks')
+
+    job, _ = UploadJob.objects.get_or_create(
+        job_id=job_id,
+        defaults={'user': request.user, 'total_files': _positive_int(metadata.get('totalFiles'))},
+    )
+    if job.user_id != request.user.id:
+        return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    document, _ = UploadedDocument.objects.get_or_create(
+        job=job, file_name=file_name, defaults={'total_chunks': total_chunks}
+    )
+    if document.total_chunks != total_chunks:
+        return _bad_request(f'totalChunks changed from {document.total_chunks} for {file_name}')
+    if document.status != UploadedDocument.STATUS_RECEIVING:
+        # Already assembled: a late retry has nothing left to do
+        reschedule_if_stuck(document)
+        return Response(_document_progress(document))
+
+    directory = parts_dir(settings.UPLOAD_DIR, job_id, file_name)
+    # A retried chunk replaces its earlier copy, so that copy doesn't count.
+    # Chunks written concurrently can overshoot the cap by one chunk each.
+    budget = (settings.UPLOAD_MAX_JOB_BYTES - job_bytes(settings.UPLOAD_DIR, job_id)
+              + part_size(directory, chunk_index))
+    too_large = Response(
+        {'error': f'Upload job is larger than {settings.UPLOAD_MAX_JOB_BYTES} bytes'},
+        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    )
+    if budget <= 0:
+        return too_large
+    try:
+        write_chunk(
+            directory, chunk_index, chunk,
+            expected_size=_positive_int(metadata.get('originalSize')),
+            max_bytes=min(settings.UPLOAD_MAX_CHUNK_BYTES, budget),
+        )
+    except ChunkTooLarge as e:
+        return too_large if budget < settings.UPLOAD_MAX_CHUNK_BYTES else _bad_request(str(e))
+    except ChunkError as e:
+        return _bad_request(str(e))
+
+    received = received_chunks(directory)
+    upload_detail = {'file': file_name, 'received': len(received), 'total': total_chunks}
+    if len(received) < total_chunks:
+        job_registry.publish(
+            job, stage='upload', stage_status=STAGE_RUNNING,
+            progress=len(received) / total_chunks, detail=upload_detail,
+        )
+    else:
+        output_path = os.path.join(job_dir(settings.UPLOAD_DIR, job_id), 'files', file_name)
+        if assemble(directory, total_chunks, output_path):
+            document.path = output_path
+            document.size = os.path.getsize(output_path)
+            document.status = UploadedDocument.STATUS_PARSING
+            document.save(update_fields=['path', 'size', 'status', 'updated_at'])
+            all_received = (
+                not job.documents.filter(status=UploadedDocument.STATUS_RECEIVING).exists()
+                and job.documents.count() >= (job.total_files or 0)
+            )
+            job_registry.publish(
+                job, stage='upload', stage_status=STAGE_DONE if all_received else STAGE_RUNNING,
+                detail=upload_detail,
+            )
+            update_job_status(job.pk)
+            schedule_parse(document.pk)
+    return Response(_progress(document, received))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def upload_status(request, job_id):
+    """
+    Job status, stage progress and parsed documents
+
+    The fallback for clients without the event stream. The ETag is the
+    job-state version, read from the job's row on every poll; response
+    bodies are cached per version, so repeated polls of an unchanged job
+    cost one small query and usually a 304.
+    """
+    state = job_registry.get(job_id)
+    if state is None or state['user_id'] != request.user.id:
+        return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    etag = f'"{job_id}-{state["version"]}"'
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and etag in parse_etags(if_none_match):
+        response = HttpResponseNotModified()
+    else:
+        key = f'documents:job-body:{etag}'
+        body = cache.get(key)
+        if body is None:
+            job = UploadJob.objects.prefetch_related('documents__stage_results').get(job_id=job_id)
+            data = UploadJobSerializer(job).data
+            data['version'] = state['version']
+            data['stages'] = state['stages']
+            body = JSONRenderer().render(data)
+            cache.set(key, body, settings.JOB_EVENTS_TTL)
+        response = HttpResponse(body, content_type='application/json')
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([EventStreamRenderer, JSONRenderer])
+def upload_events(request, job_id):
+    """Server-sent events for a job's status and stage progress, see events.py"""
+    job = get_object_or_404(UploadJob, job_id=job_id, user=request.user)
+    last_version = _positive_int(request.META.get('HTTP_LAST_EVENT_ID')) or 0
+
+    # ASGI streams only async iterators as they are produced
+    stream = async_event_stream if isinstance(request._request, ASGIRequest) else event_stream
+    response = StreamingHttpResponse(stream(job, last_version), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def translate_upload(request, job_id):
+    """
+    Start (or resume) the translation pipeline for a job's parsed documents
+
+    Stages that already succeeded for the same target language are not
+    run again, so posting again after a failure retries only what failed.
+    Documents already being translated are left alone (see
+    stages.claim_translation).
+    """
+    job = get_object_or_404(UploadJob, job_id=job_id, user=request.user)
+    target_language = request.data.get('target_language')
+    if not target_language:
+        return _bad_request('target_language is required')
+    language = get_object_or_404(Language, code=target_language)
+
+    scheduled = []
+    for document in job.documents.all():
+        if claim_translation(document):
+            schedule_translation(document.pk, language.name)
+            scheduled.append(document.file_name)
+
+    if not scheduled:
+        return Response(
+            {'error': 'No parsed documents are ready to translate'},
+            status=status.HTTP_409_CONFLICT
+        )
+    update_job_status(job.pk)
+    return Response(
+        {'job_id': str(job.job_id), 'target_language': language.name, 'documents': scheduled},
+        status=status.HTTP_202_ACCEPTED
+    )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def extract_upload_inputs(request, job_id):
+    """
+    Read the user's answers from a job's filled-in forms and translate them
+    back into each form's language (input extraction, then phase 2)
+
+    Documents already being processed are left alone (see
+    stages.claim_translation).
+    """
+    job = get_object_or_404(UploadJob, job_id=job_id, user=request.user)
+    user_language = request.data.get('user_language')
+    if not user_language:
+        return _bad_request('user_language is required')
+    language = get_object_or_404(Language, code=user_language)
+    target_country = request.data.get('target_country') or None
+
+    scheduled = []
+    for document in job.documents.all():
+        if claim_translation(document):
+            schedule_input_extraction(document.pk, language.name, target_country)
+            scheduled.append(document.file_name)
+
+    if not scheduled:
+        return Response(
+            {'error': 'No parsed documents are ready to process'},
+            status=status.HTTP_409_CONFLICT
+        )
+    update_job_status(job.pk)
+    return Response(
+        {'job_id': str(job.job_id), 'user_language': language.name, 'target_country': target_country,
+         'documents': scheduled},
+        status=status.HTTP_202_ACCEPTED
+    )
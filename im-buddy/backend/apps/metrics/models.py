@@ -0,0 +1,27 @@
+from django.db import models
+
+
+class PromptCallStats(models.Model):
+    """
+    LLM prompt calls of one phase whose latency fell in one histogram
+    bucket (see utils/prompt_accounting.py). Every worker process adds to
+    the same rows, so the totals cover the whole deployment and survive
+    restarts.
+    """
+    phase = models.CharField(max_length=40)
+    bucket = models.PositiveSmallIntegerField()
+    calls = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    input_tokens = models.PositiveBigIntegerField(default=0)
+    output_tokens = models.PositiveBigIntegerField(default=0)
+    reported_calls = models.PositiveIntegerField(default=0)
+    latency_total_ms = models.FloatField(default=0.0)
+    latency_max_ms = models.FloatField(default=0.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['phase', 'bucket'], name='unique_prompt_call_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.phase} bucket {self.bucket}: {self.calls} calls"
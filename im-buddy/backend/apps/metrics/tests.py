@@ -0,0 +1,90 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+
+from services.prompt_service import request_prompt
+from utils.prompt_accounting import PromptAccounting, prompt_accounting
+from utils.tokens import usage_from_response
+from .models import PromptCallStats
+
+
+class PromptAccountingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='applicant', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_usage_is_read_from_either_response_format(self):
+        self.assertEqual(usage_from_response({'usage': {'prompt_tokens': 12, 'completion_tokens': 3}}),
+                         {'input_tokens': 12, 'output_tokens': 3})
+        metrics = {'metrics': [{'metric': 'num_prompt_tokens', 'value': 40, 'unit': 'tokens'},
+                               {'metric': 'num_completion_tokens', 'value': 7, 'unit': 'tokens'}]}
+        self.assertEqual(usage_from_response(metrics), {'input_tokens': 40, 'output_tokens': 7})
+        self.assertIsNone(usage_from_response({'choices': []}))
+
+    def test_calls_are_accounted_per_phase(self):
+        replies = [
+            {'choices': [{'message': {'content': 'Primary Language: French'}}],
+             'usage': {'prompt_tokens': 500, 'completion_tokens': 20}},
+            {'choices': [{'message': {'content': 'abcdefgh'}}]},
+            ConnectionError('refused'),
+            {'choices': [{'message': {'content': '{}'}}]},
+        ]
+        with mock.patch('services.prompt_service.make_api_request', side_effect=replies):
+            request_prompt('language_detection', text_sample='Nom de famille')
+            request_prompt('language_detection', text_sample='Prénom')
+            with self.assertRaises(ConnectionError):
+                request_prompt('language_detection', text_sample='Adresse')
+            request_prompt('quality_check', original_text='a', translated_text='b',
+                           source_language='French', target_language='English')
+
+        self.user.is_staff = True
+        self.user.save()
+        phases = self.client.get('/api/prompts/stats').json()['phases']
+
+        detection = phases['language_detection']
+        self.assertEqual((detection['calls'], detection['errors'], detection['reported_calls']), (3, 1, 1))
+        self.assertAlmostEqual(detection['error_rate'], 1 / 3)
+        self.assertGreater(detection['input_tokens'], 500)  # reported 500, plus two estimates
+        self.assertEqual(detection['output_tokens'], 20 + 2)
+        self.assertEqual(sum(detection['latency_ms']['histogram'].values()), 3)
+        self.assertEqual(phases['quality_check']['calls'], 1)
+
+    def test_stats_are_admin_only(self):
+        self.assertEqual(self.client.get('/api/prompts/stats').status_code, 403)
+
+    def test_stats_outlive_the_process_that_recorded_them(self):
+        prompt_accounting.record('phase1', 100, 10, 50.0)
+        prompt_accounting.record('phase1', 300, 30, 4000.0, reported=True)
+
+        # A fresh accounting object, as in another worker or after a restart
+        stats = PromptAccounting().snapshot()['phase1_translation']
+        self.assertEqual((stats['calls'], stats['input_tokens'], stats['output_tokens']), (2, 400, 40))
+        self.assertEqual(stats['latency_ms']['max'], 4000.0)
+        self.assertEqual(stats['latency_ms']['histogram']['<=100'], 1)
+        self.assertEqual(stats['latency_ms']['histogram']['<=5000'], 1)
+
+
+class ConcurrentPromptAccountingTests(TransactionTestCase):
+
+    def test_concurrent_records_are_not_lost(self):
+        def record_calls():
+            try:
+                for _ in range(10):
+                    PromptAccounting().record('quality_check', 5, 1, 120.0)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=record_calls) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(PromptCallStats.objects.get().calls, 40)
+        self.assertEqual(prompt_accounting.snapshot()['quality_check']['input_tokens'], 200)
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import prompt_stats
+
+urlpatterns = [
+    path('prompts/stats', prompt_stats, name='prompt_stats'),
+]
@@ -0,0 +1,15 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from utils.prompt_accounting import prompt_accounting
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def prompt_stats(request):
+    """
+    Per-phase LLM prompt accounting: calls, input/output tokens, latency
+    histogram and error rate for each PromptConfig phase, across all workers
+    """
+    return Response({'phases': prompt_accounting.snapshot()})
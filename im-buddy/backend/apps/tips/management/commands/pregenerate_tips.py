@@ -0,0 +1,103 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.visa_info.models import VisaType
+from apps.tips.pregeneration import (
+    RESULT_FAILED, pending_pairs, pregenerate, stale_pairs, tip_languages,
+)
+from services.tips_service import request_tips
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate missing or stale tips for every visa type and language. "
+        "With --loop, keeps running as a background worker that also serves "
+        "generation requests queued by the tips endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--visa-type', action='append', dest='visa_types',
+                            help='Only this visa type code (repeatable)')
+        parser.add_argument('--language', action='append', dest='languages',
+                            help='Only this language code (repeatable)')
+        parser.add_argument('--concurrency', type=int, default=settings.TIP_PREGENERATION_CONCURRENCY,
+                            help='Maximum simultaneous LLM calls')
+        parser.add_argument('--rate', type=float, default=settings.TIP_PREGENERATION_RATE,
+                            help='Maximum LLM calls started per second (0 = unlimited)')
+        parser.add_argument('--max-age-days', type=int, default=settings.TIP_MAX_AGE_DAYS,
+                            help='Regenerate tips older than this many days')
+        parser.add_argument('--skip-supported-languages', action='store_true',
+                            help='Do not add PromptConfig.SUPPORTED_LANGUAGES to the Language table')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List the pairs that would be generated and exit')
+        parser.add_argument('--loop', action='store_true',
+                            help='Run as a background worker')
+        parser.add_argument('--interval', type=int, default=3600,
+                            help='Seconds between full sweeps in --loop mode')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Seconds between checks for queued requests in --loop mode')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.max_age = timedelta(days=options['max_age_days'])
+
+        if options['dry_run']:
+            for visa_type, language in self.sweep_pairs():
+                self.stdout.write(f"{visa_type.code} / {language.code}")
+            return
+
+        if not options['loop']:
+            counts = self.run(self.sweep_pairs())
+            if counts[RESULT_FAILED]:
+                raise CommandError(f"{counts[RESULT_FAILED]} pair(s) failed; rerun to retry them")
+            return
+
+        self.stdout.write("Tip pregeneration worker started")
+        next_sweep = 0.0
+        try:
+            while True:
+                if time.monotonic() >= next_sweep:
+                    pairs = pending_pairs() + self.sweep_pairs()
+                    next_sweep = time.monotonic() + options['interval']
+                else:
+                    pairs = pending_pairs()
+                if pairs:
+                    self.run(pairs)
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Tip pregeneration worker stopped")
+
+    def sweep_pairs(self):
+        languages = tip_languages(include_supported=not self.options['skip_supported_languages'])
+        if self.options['languages']:
+            languages = [language for language in languages if language.code in self.options['languages']]
+
+        visa_types = VisaType.objects.order_by('code')
+        if self.options['visa_types']:
+            visa_types = visa_types.filter(code__in=self.options['visa_types'])
+
+        return stale_pairs(list(visa_types), languages, self.max_age)
+
+    def run(self, pairs):
+        self.stdout.write(f"Refreshing tips for {len(pairs)} pair(s)")
+
+        def report(visa_type, language, result, error):
+            line = f"{visa_type.code} / {language.code}: {result}"
+            if error is not None:
+                self.stderr.write(f"{line} ({error})")
+            else:
+                self.stdout.write(line)
+
+        counts = pregenerate(
+            pairs,
+            request_tips,
+            self.max_age,
+            concurrency=self.options['concurrency'],
+            rate=self.options['rate'],
+            on_result=report,
+        )
+        self.stdout.write(", ".join(f"{name}: {count}" for name, count in counts.items()))
+        return counts
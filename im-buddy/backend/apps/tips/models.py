@@ -1,11 +1,52 @@
 from django.db import models
+from django.utils import timezone
 from apps.visa_info.models import VisaType, Language
 
 
+class TipQuerySet(models.QuerySet):
+    def for_serialization(self):
+        """Load everything TipSerializer nests, in a constant number of queries"""
+        return self.select_related('visa_type', 'language').prefetch_related('visa_type__countries')
+
+
 class Tip(models.Model):
     visa_type = models.ForeignKey(VisaType, on_delete=models.CASCADE, related_name='tips')
     content = models.TextField()
     language = models.ForeignKey(Language, on_delete=models.CASCADE)
+    generated_at = models.DateTimeField(default=timezone.now)
+
+    objects = TipQuerySet.as_manager()
     
     def __str__(self):
-        return f"Tip for {self.visa_type} in {self.language}" 
\ No newline at end of file
+        return f"Tip for {self.visa_type} in {self.language}" 
+
+class TipGenerationClaim(models.Model):
+    """
+    One row per (visa type, language): whoever holds the claim generates
+    the tips while other requests, in any worker process, wait for them.
+    Pending rows are requests queued for the pregenerate_tips worker.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    visa_type = models.ForeignKey(VisaType, on_delete=models.CASCADE, related_name='+')
+    language = models.ForeignKey(Language, on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    claimed_at = models.DateTimeField()
+    coalesced = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['visa_type', 'language'], name='unique_tip_generation_claim'),
+        ]
+
+    def __str__(self):
+        return f"Tip generation for {self.visa_type_id} in {self.language_id} ({self.status})"
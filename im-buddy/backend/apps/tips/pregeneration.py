@@ -0,0 +1,192 @@
+"""
+Ahead-of-time generation of tips for every (visa type, language) pair.
+
+Used by the pregenerate_tips management command. Every pair goes through
+the same TipGenerationClaim used for on-demand generation, so sweeps can
+run concurrently with each other and with web requests, and a sweep that
+is interrupted simply picks up the remaining pairs next time.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.db import close_old_connections, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from apps.visa_info.models import Language
+from utils.prompt_config import PromptConfig
+from .models import Tip, TipGenerationClaim
+from .singleflight import claim_generation, release_generation
+
+RESULT_GENERATED = 'generated'
+RESULT_FRESH = 'fresh'
+RESULT_BUSY = 'busy'
+RESULT_FAILED = 'failed'
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def tip_languages(include_supported=True):
+    """
+    Languages tips are generated for
+
+    Args:
+        include_supported (bool): Also create Language rows for every
+            language in PromptConfig.SUPPORTED_LANGUAGES
+
+    Returns:
+        list: Language objects
+    """
+    if include_supported:
+        for name, info in PromptConfig.SUPPORTED_LANGUAGES.items():
+            Language.objects.get_or_create(code=info["code"], defaults={"name": name})
+    return list(Language.objects.order_by('code'))
+
+
+def pending_pairs():
+    """
+    Pairs queued by get_tips, oldest first
+
+    Returns:
+        list: (VisaType, Language) tuples
+    """
+    claims = (
+        TipGenerationClaim.objects
+        .filter(status=TipGenerationClaim.STATUS_PENDING)
+        .select_related('visa_type', 'language')
+        .order_by('claimed_at')
+    )
+    return [(claim.visa_type, claim.language) for claim in claims]
+
+
+def stale_pairs(visa_types, languages, max_age):
+    """
+    Pairs with no tips, or with tips older than max_age
+
+    Returns:
+        list: (VisaType, Language) tuples, missing pairs first
+    """
+    cutoff = timezone.now() - max_age
+    oldest = {
+        (row['visa_type_id'], row['language_id']): row['oldest']
+        for row in (
+            Tip.objects
+            .filter(visa_type__in=visa_types, language__in=languages)
+            .values('visa_type_id', 'language_id')
+            .annotate(oldest=Min('generated_at'))
+        )
+    }
+
+    missing, stale = [], []
+    for visa_type in visa_types:
+        for language in languages:
+            generated_at = oldest.get((visa_type.pk, language.pk))
+            if generated_at is None:
+                missing.append((visa_type, language))
+            elif generated_at < cutoff:
+                stale.append((visa_type, language))
+    return missing + stale
+
+
+def refresh_tips(visa_type, language, generate_fn, max_age, rate_limiter=None):
+    """
+    Generate tips for one pair unless they exist and are fresh
+
+    Existing tips are updated in place, so the pair always ends up with a
+    single Tip row.
+
+    Returns:
+        str: One of the RESULT_* constants
+    """
+    if not claim_generation(visa_type, language):
+        return RESULT_BUSY
+
+    try:
+        tips = Tip.objects.filter(visa_type=visa_type, language=language).order_by('id')
+        cutoff = timezone.now() - max_age
+        if tips.exists() and not tips.filter(generated_at__lt=cutoff).exists():
+            release_generation(visa_type, language, TipGenerationClaim.STATUS_DONE)
+            return RESULT_FRESH
+
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        content = generate_fn(visa_type.code, language.code)
+
+        with transaction.atomic():
+            tip = tips.first()
+            if tip is None:
+                Tip.objects.create(visa_type=visa_type, content=content, language=language)
+            else:
+                tip.content = content
+                tip.generated_at = timezone.now()
+                tip.save(update_fields=['content', 'generated_at'])
+                tips.exclude(pk=tip.pk).delete()
+    except Exception:
+        release_generation(visa_type, language, TipGenerationClaim.STATUS_FAILED)
+        raise
+
+    release_generation(visa_type, language, TipGenerationClaim.STATUS_DONE)
+    return RESULT_GENERATED
+
+
+def pregenerate(pairs, generate_fn, max_age, concurrency=4, rate=None, on_result=None):
+    """
+    Refresh tips for many pairs with bounded concurrency and rate limiting
+
+    Args:
+        pairs (list): (VisaType, Language) tuples
+        generate_fn (callable): (visa_type_code, language_code) -> content
+        max_age (timedelta): Tips older than this are regenerated
+        concurrency (int): Maximum simultaneous LLM calls
+        rate (float): Maximum LLM calls started per second (None = unlimited)
+        on_result (callable): Called with (visa_type, language, result, error)
+
+    Returns:
+        dict: Number of pairs per RESULT_* value
+    """
+    rate_limiter = RateLimiter(rate)
+    counts = dict.fromkeys([RESULT_GENERATED, RESULT_FRESH, RESULT_BUSY, RESULT_FAILED], 0)
+
+    def run(visa_type, language):
+        close_old_connections()
+        try:
+            return refresh_tips(visa_type, language, generate_fn, max_age, rate_limiter)
+        finally:
+            close_old_connections()
+
+    # Duplicates can appear when a pair is both queued and stale
+    unique_pairs = list({(visa_type.pk, language.pk): (visa_type, language) for visa_type, language in pairs}.values())
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {executor.submit(run, *pair): pair for pair in unique_pairs}
+        for future in as_completed(futures):
+            visa_type, language = futures[future]
+            error = None
+            try:
+                result = future.result()
+            except Exception as e:
+                result, error = RESULT_FAILED, e
+            counts[result] += 1
+            if on_result is not None:
+                on_result(visa_type, language, result, error)
+
+    return counts
+
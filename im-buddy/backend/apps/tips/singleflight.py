@@ -0,0 +1,293 @@
+"""
+Single-flight generation of tips.
+
+When tips for a (visa type, language) pair are missing, exactly one request
+generates them; concurrent requests wait for that result instead of
+issuing their own LLM call.
+
+- Within a process, waiters block on a threading.Event owned by the leader.
+- Across gunicorn workers, the leader is whoever holds the pair's
+  TipGenerationClaim row (a unique constraint makes the claim atomic);
+  other workers poll for the Tip row to appear.
+
+aget_or_generate_tips() is the asyncio equivalent for ASGI views: waiters
+in the same event loop await the leader's Future instead of an Event.
+
+Claims left running longer than TIP_GENERATION_STALE_AFTER (e.g. by a
+killed worker) can be taken over. Pending claims are queued work for the
+pregenerate_tips worker and can be claimed by anyone.
+"""
+import asyncio
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Tip, TipGenerationClaim
+
+
+class TipGenerationPending(Exception):
+    """Tips are still being generated by another request"""
+
+
+class CoalescingStats:
+    """Per-process counters for tip generation requests"""
+
+    FIELDS = ('generated', 'coalesced', 'timeouts', 'failures')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            self._counters = dict.fromkeys(self.FIELDS, 0)
+
+
+coalescing_stats = CoalescingStats()
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+# (event loop, visa type, language) -> Future; only touched from its own loop
+_async_flights = {}
+
+
+def _existing_tips(visa_type, language):
+    return list(Tip.objects.for_serialization().filter(visa_type=visa_type, language=language))
+
+
+def _create_tips(visa_type, language, content):
+    return [Tip.objects.create(visa_type=visa_type, content=content, language=language)]
+
+
+def _claims(visa_type, language):
+    return TipGenerationClaim.objects.filter(visa_type=visa_type, language=language)
+
+
+def _record_coalesced(visa_type, language):
+    coalescing_stats.add('coalesced')
+    _claims(visa_type, language).update(coalesced=F('coalesced') + 1)
+
+
+def claim_generation(visa_type, language):
+    """
+    Try to become the generator for a (visa type, language) pair
+
+    Returns:
+        bool: True if this caller now holds the claim
+    """
+    now = timezone.now()
+    claim, created = TipGenerationClaim.objects.get_or_create(
+        visa_type=visa_type,
+        language=language,
+        defaults={'claimed_at': now}
+    )
+    if created:
+        return True
+
+    # Take over finished, failed or abandoned claims
+    stale_cutoff = now - timedelta(seconds=settings.TIP_GENERATION_STALE_AFTER)
+    taken = (
+        TipGenerationClaim.objects
+        .filter(pk=claim.pk)
+        .filter(~Q(status=TipGenerationClaim.STATUS_RUNNING) | Q(claimed_at__lt=stale_cutoff))
+        .update(status=TipGenerationClaim.STATUS_RUNNING, claimed_at=now)
+    )
+    return taken == 1
+
+
+def release_generation(visa_type, language, status):
+    _claims(visa_type, language).update(status=status)
+
+
+def enqueue_generation(visa_type, language):
+    """
+    Queue a (visa type, language) pair for the pregenerate_tips worker
+
+    Pairs already queued or being generated are left alone, so repeated
+    requests enqueue the work only once.
+
+    Returns:
+        bool: True if the pair was newly queued
+    """
+    now = timezone.now()
+    claim, created = TipGenerationClaim.objects.get_or_create(
+        visa_type=visa_type,
+        language=language,
+        defaults={'status': TipGenerationClaim.STATUS_PENDING, 'claimed_at': now}
+    )
+    if created:
+        return True
+
+    stale_cutoff = now - timedelta(seconds=settings.TIP_GENERATION_STALE_AFTER)
+    queued = (
+        TipGenerationClaim.objects
+        .filter(pk=claim.pk)
+        .filter(
+            Q(status__in=[TipGenerationClaim.STATUS_DONE, TipGenerationClaim.STATUS_FAILED])
+            | Q(status=TipGenerationClaim.STATUS_RUNNING, claimed_at__lt=stale_cutoff)
+        )
+        .update(status=TipGenerationClaim.STATUS_PENDING, claimed_at=now)
+    )
+    if not queued:
+        _record_coalesced(visa_type, language)
+    return queued == 1
+
+
+def _generate_across_workers(visa_type, language, generate_fn):
+    deadline = time.monotonic() + settings.TIP_GENERATION_WAIT_TIMEOUT
+    waiting = False
+
+    while True:
+        if claim_generation(visa_type, language):
+            try:
+                # Another worker may have finished between our check and claim
+                tips = _existing_tips(visa_type, language)
+                if not tips:
+                    content = generate_fn(visa_type.code, language.code)
+                    tips = _create_tips(visa_type, language, content)
+                    coalescing_stats.add('generated')
+            except Exception:
+                coalescing_stats.add('failures')
+                release_generation(visa_type, language, TipGenerationClaim.STATUS_FAILED)
+                raise
+            release_generation(visa_type, language, TipGenerationClaim.STATUS_DONE)
+            return tips
+
+        if not waiting:
+            _record_coalesced(visa_type, language)
+            waiting = True
+
+        time.sleep(settings.TIP_GENERATION_POLL_INTERVAL)
+        tips = _existing_tips(visa_type, language)
+        if tips:
+            return tips
+        if time.monotonic() >= deadline:
+            coalescing_stats.add('timeouts')
+            raise TipGenerationPending(f"Tips for {visa_type.code}/{language.code} are still being generated")
+
+
+def get_or_generate_tips(visa_type, language, generate_fn):
+    """
+    Return stored tips, generating them at most once across all workers
+
+    Args:
+        visa_type (VisaType): Visa type
+        language (Language): Language of the tips
+        generate_fn (callable): (visa_type_code, language_code) -> content
+
+    Returns:
+        list: Tip objects
+
+    Raises:
+        TipGenerationPending: If another request is still generating them
+            after TIP_GENERATION_WAIT_TIMEOUT
+        Exception: Whatever generate_fn raised, for the generating request
+    """
+    tips = _existing_tips(visa_type, language)
+    if tips:
+        return tips
+
+    key = (visa_type.pk, language.pk)
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = threading.Event()
+
+    if not leader:
+        flight.wait(settings.TIP_GENERATION_WAIT_TIMEOUT)
+        # Counted after waiting, once the leader's claim row is sure to exist
+        _record_coalesced(visa_type, language)
+        tips = _existing_tips(visa_type, language)
+        if tips:
+            return tips
+        coalescing_stats.add('timeouts')
+        raise TipGenerationPending(f"Tips for {visa_type.code}/{language.code} are still being generated")
+
+    try:
+        return _generate_across_workers(visa_type, language, generate_fn)
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.set()
+
+
+async def _agenerate_across_workers(visa_type, language, generate_fn):
+    deadline = time.monotonic() + settings.TIP_GENERATION_WAIT_TIMEOUT
+    waiting = False
+
+    while True:
+        if await sync_to_async(claim_generation)(visa_type, language):
+            try:
+                tips = await sync_to_async(_existing_tips)(visa_type, language)
+                if not tips:
+                    content = await generate_fn(visa_type.code, language.code)
+                    tips = await sync_to_async(_create_tips)(visa_type, language, content)
+                    coalescing_stats.add('generated')
+            except Exception:
+                coalescing_stats.add('failures')
+                await sync_to_async(release_generation)(visa_type, language, TipGenerationClaim.STATUS_FAILED)
+                raise
+            await sync_to_async(release_generation)(visa_type, language, TipGenerationClaim.STATUS_DONE)
+            return tips
+
+        if not waiting:
+            await sync_to_async(_record_coalesced)(visa_type, language)
+            waiting = True
+
+        await asyncio.sleep(settings.TIP_GENERATION_POLL_INTERVAL)
+        tips = await sync_to_async(_existing_tips)(visa_type, language)
+        if tips:
+            return tips
+        if time.monotonic() >= deadline:
+            coalescing_stats.add('timeouts')
+            raise TipGenerationPending(f"Tips for {visa_type.code}/{language.code} are still being generated")
+
+
+async def aget_or_generate_tips(visa_type, language, generate_fn):
+    """
+    Async version of get_or_generate_tips
+
+    Args:
+        generate_fn (callable): async (visa_type_code, language_code) -> content
+    """
+    tips = await sync_to_async(_existing_tips)(visa_type, language)
+    if tips:
+        return tips
+
+    loop = asyncio.get_running_loop()
+    key = (loop, visa_type.pk, language.pk)
+    flight = _async_flights.get(key)
+
+    if flight is not None:
+        try:
+            await asyncio.wait_for(asyncio.shield(flight), settings.TIP_GENERATION_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        await sync_to_async(_record_coalesced)(visa_type, language)
+        tips = await sync_to_async(_existing_tips)(visa_type, language)
+        if tips:
+            return tips
+        coalescing_stats.add('timeouts')
+        raise TipGenerationPending(f"Tips for {visa_type.code}/{language.code} are still being generated")
+
+    flight = _async_flights[key] = loop.create_future()
+    try:
+        return await _agenerate_across_workers(visa_type, language, generate_fn)
+    finally:
+        del _async_flights[key]
+        flight.set_result(None)
@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import close_old_connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.visa_info.models import Country, VisaType, Language
+from im_buddy.testing import QueryCountAssertions
+from .models import Tip, TipGenerationClaim
+from .singleflight import TipGenerationPending, aget_or_generate_tips, coalescing_stats, get_or_generate_tips
+
+
+@override_settings(TIP_GENERATION_POLL_INTERVAL=0.02, TIP_GENERATION_WAIT_TIMEOUT=5)
+class SingleFlightTests(TransactionTestCase):
+
+    def setUp(self):
+        self.visa_type = VisaType.objects.create(code='H1B', name='H-1B', description='Work visa')
+        self.language = Language.objects.create(code='es', name='Spanish')
+        coalescing_stats.reset()
+
+    def test_concurrent_requests_generate_once(self):
+        def slow_generate(visa_type, language):
+            time.sleep(0.2)
+            return 'Consejos'
+
+        generate = mock.Mock(side_effect=slow_generate)
+        results = []
+
+        def request():
+            try:
+                results.append(get_or_generate_tips(self.visa_type, self.language, generate))
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(Tip.objects.count(), 1)
+        self.assertEqual([tips[0].content for tips in results], ['Consejos'] * 5)
+        self.assertEqual(TipGenerationClaim.objects.get().coalesced, 4)
+
+    def test_waits_for_generation_in_another_worker(self):
+        TipGenerationClaim.objects.create(
+            visa_type=self.visa_type, language=self.language, claimed_at=timezone.now()
+        )
+
+        def other_worker_finishes():
+            time.sleep(0.1)
+            Tip.objects.create(visa_type=self.visa_type, content='Consejos', language=self.language)
+            close_old_connections()
+
+        threading.Thread(target=other_worker_finishes).start()
+        generate = mock.Mock()
+        tips = get_or_generate_tips(self.visa_type, self.language, generate)
+
+        self.assertEqual(tips[0].content, 'Consejos')
+        generate.assert_not_called()
+
+    @override_settings(TIP_GENERATION_WAIT_TIMEOUT=0.05)
+    def test_times_out_while_another_worker_is_generating(self):
+        TipGenerationClaim.objects.create(
+            visa_type=self.visa_type, language=self.language, claimed_at=timezone.now()
+        )
+
+        with self.assertRaises(TipGenerationPending):
+            get_or_generate_tips(self.visa_type, self.language, mock.Mock())
+
+    def test_failed_generation_releases_the_claim(self):
+        with self.assertRaises(RuntimeError):
+            get_or_generate_tips(self.visa_type, self.language, mock.Mock(side_effect=RuntimeError))
+
+        self.assertEqual(TipGenerationClaim.objects.get().status, TipGenerationClaim.STATUS_FAILED)
+        tips = get_or_generate_tips(self.visa_type, self.language, mock.Mock(return_value='Consejos'))
+        self.assertEqual(tips[0].content, 'Consejos')
+
+
+@override_settings(TIP_GENERATION_POLL_INTERVAL=0.02, TIP_GENERATION_WAIT_TIMEOUT=5)
+class AsyncSingleFlightTests(TestCase):
+
+    def setUp(self):
+        self.visa_type = VisaType.objects.create(code='H1B', name='H-1B', description='Work visa')
+        self.language = Language.objects.create(code='es', name='Spanish')
+        coalescing_stats.reset()
+
+    async def test_concurrent_coroutines_generate_once(self):
+        async def slow_generate(visa_type, language):
+            await asyncio.sleep(0.1)
+            return 'Consejos'
+
+        generate = mock.AsyncMock(side_effect=slow_generate)
+        results = await asyncio.gather(*(
+            aget_or_generate_tips(self.visa_type, self.language, generate) for _ in range(5)
+        ))
+
+        self.assertEqual(generate.await_count, 1)
+        self.assertEqual([tips[0].content for tips in results], ['Consejos'] * 5)
+        self.assertEqual(coalescing_stats.snapshot()['coalesced'], 4)
+
+
+class PregenerateTipsCommandTests(TransactionTestCase):
+
+    def setUp(self):
+        self.visa_type = VisaType.objects.create(code='H1B', name='H-1B', description='Work visa')
+        self.spanish = Language.objects.create(code='es', name='Spanish')
+        self.french = Language.objects.create(code='fr', name='French')
+
+    def pregenerate(self, generate):
+        # One worker: the in-memory SQLite test database cannot take concurrent writes
+        with mock.patch('apps.tips.management.commands.pregenerate_tips.request_tips', side_effect=generate):
+            call_command('pregenerate_tips', '--skip-supported-languages', '--concurrency=1', '--rate=0',
+                         stdout=StringIO(), stderr=StringIO())
+
+    def test_generates_missing_and_stale_tips_only(self):
+        Tip.objects.create(visa_type=self.visa_type, content='Frais', language=self.french)
+        stale = Tip.objects.create(visa_type=self.visa_type, content='Viejo', language=self.spanish,
+                                   generated_at=timezone.now() - timedelta(days=365))
+        generate = mock.Mock(return_value='Nuevo')
+
+        self.pregenerate(generate)
+
+        generate.assert_called_once_with('H1B', 'es')
+        stale.refresh_from_db()
+        self.assertEqual(stale.content, 'Nuevo')
+        self.assertEqual(Tip.objects.count(), 2)
+
+    def test_rerun_is_idempotent(self):
+        self.pregenerate(mock.Mock(return_value='Consejos'))
+        generate = mock.Mock()
+
+        self.pregenerate(generate)
+
+        generate.assert_not_called()
+        self.assertEqual(Tip.objects.count(), 2)
+
+
+class GetTipsViewTests(QueryCountAssertions, TestCase):
+
+    def setUp(self):
+        self.visa_type = VisaType.objects.create(code='H1B', name='H-1B', description='Work visa')
+        self.language = Language.objects.create(code='es', name='Spanish')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('alice'))
+
+    @mock.patch('apps.tips.views.request_tips')
+    def test_missing_tips_are_queued_instead_of_generated(self, request_tips):
+        response = self.client.get('/api/tips/', {'visa_type': 'H1B', 'language': 'es'})
+
+        self.assertEqual(response.status_code, 202)
+        request_tips.assert_not_called()
+        claim = TipGenerationClaim.objects.get()
+        self.assertEqual(claim.status, TipGenerationClaim.STATUS_PENDING)
+
+    def test_tips_run_a_constant_number_of_queries(self):
+        Tip.objects.create(visa_type=self.visa_type, content='Consejo 0', language=self.language)
+
+        def grow():
+            self.visa_type.countries.set(
+                Country.objects.bulk_create(Country(code=f'C{n}', name=f'Country {n}') for n in range(10))
+            )
+            Tip.objects.bulk_create(
+                Tip(visa_type=self.visa_type, content=f'Consejo {n}', language=self.language) for n in range(1, 10)
+            )
+
+        # visa type, language, tips (+ joins), prefetched countries
+        self.assertConstantQueries(4, '/api/tips/', grow=grow, data={'visa_type': 'H1B', 'language': 'es'})
@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import path
-from .views import get_tips
+from .views import get_tips, get_tips_async
 
 urlpatterns = [
-    path('', get_tips, name='get_tips'),
-] 
\ No newline at end of file
+    path('', get_tips_async if settings.ASYNC_LLM_VIEWS else get_tips, name='get_tips'),
+]
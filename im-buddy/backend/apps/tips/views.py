@@ -1,40 +1,108 @@
+import requests
+from asgiref.sync import sync_to_async
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 
 from apps.visa_info.models import VisaType, Language
+from im_buddy.async_views import async_api_view
 from .models import Tip
 from .serializers import TipSerializer
-from services.tips_service import generate_tips
+from .singleflight import TipGenerationPending, aget_or_generate_tips, enqueue_generation, get_or_generate_tips
+from services.tips_service import arequest_tips, request_tips
 
 
 @api_view(['GET'])
 def get_tips(request):
     visa_type = request.query_params.get('visa_type')
     language = request.query_params.get('language', 'en')
-    
+
     if not visa_type:
         return Response(
-            {'error': 'Visa type is required'}, 
+            {'error': 'Visa type is required'},
             status=status.HTTP_400_BAD_REQUEST
         )
-    
+
     visa_type_obj = get_object_or_404(VisaType, code=visa_type)
     language_obj = get_object_or_404(Language, code=language)
-    
-    # Try to get existing tips
-    tips = Tip.objects.filter(visa_type=visa_type_obj, language=language_obj)
-    
-    # If no tips exist, generate them
-    if not tips:
-        tips_content = generate_tips(visa_type, language)
-        tip = Tip.objects.create(
-            visa_type=visa_type_obj,
-            content=tips_content,
-            language=language_obj
-        )
-        tips = [tip]
-    
+
+    if not settings.TIPS_GENERATE_ON_DEMAND:
+        # Serve precomputed tips; missing ones are queued for the
+        # pregenerate_tips worker instead of blocking this request
+        tips = list(Tip.objects.for_serialization().filter(visa_type=visa_type_obj, language=language_obj))
+        if not tips:
+            enqueue_generation(visa_type_obj, language_obj)
+            return Response(
+                {'status': 'pending', 'detail': 'Tips are being generated, retry shortly'},
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Retry-After': '10'}
+            )
+    else:
+        # Get existing tips, or generate them once even under concurrent requests
+        try:
+            tips = get_or_generate_tips(visa_type_obj, language_obj, request_tips)
+        except TipGenerationPending as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '5'}
+            )
+        except requests.exceptions.RequestException as e:
+            print(f"Error calling LLaMa API: {e}")
+            return Response(
+                {'error': f'Tips generation error: {str(e)}'},
+                status=status.HTTP_502_BAD_GATEWAY
+            )
+
     serializer = TipSerializer(tips, many=True)
-    return Response(serializer.data) 
\ No newline at end of file
+    return Response(serializer.data)
+
+
+@async_api_view(['GET'])
+async def get_tips_async(request):
+    """Same contract as get_tips, awaiting on-demand generation on the event loop"""
+    visa_type = request.GET.get('visa_type')
+    language = request.GET.get('language', 'en')
+
+    if not visa_type:
+        return JsonResponse(
+            {'error': 'Visa type is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    visa_type_obj = await VisaType.objects.filter(code=visa_type).afirst()
+    language_obj = await Language.objects.filter(code=language).afirst()
+    if visa_type_obj is None or language_obj is None:
+        return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    if not settings.TIPS_GENERATE_ON_DEMAND:
+        tips = await sync_to_async(list)(
+            Tip.objects.for_serialization().filter(visa_type=visa_type_obj, language=language_obj)
+        )
+        if not tips:
+            await sync_to_async(enqueue_generation)(visa_type_obj, language_obj)
+            response = JsonResponse(
+                {'status': 'pending', 'detail': 'Tips are being generated, retry shortly'},
+                status=status.HTTP_202_ACCEPTED
+            )
+            response['Retry-After'] = '10'
+            return response
+    else:
+        try:
+            tips = await aget_or_generate_tips(visa_type_obj, language_obj, arequest_tips)
+        except TipGenerationPending as e:
+            response = JsonResponse({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '5'
+            return response
+        except requests.exceptions.RequestException as e:
+            print(f"Error calling LLaMa API: {e}")
+            return JsonResponse(
+                {'error': f'Tips generation error: {str(e)}'},
+                status=status.HTTP_502_BAD_GATEWAY
+            )
+
+    data = await sync_to_async(lambda: TipSerializer(tips, many=True).data)()
+    return JsonResponse(data, safe=False)
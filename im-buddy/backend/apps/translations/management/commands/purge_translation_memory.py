@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.translations.memory import TranslationMemory
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete translation memory rows older than TRANSLATION_MEMORY_TTL, "
+        "which lookups already ignore. Run it from cron, e.g. daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int,
+                            help='Delete rows older than this many seconds (default: TRANSLATION_MEMORY_TTL)')
+
+    def handle(self, *args, **options):
+        deleted = TranslationMemory(ttl=options['ttl']).purge_expired()
+        self.stdout.write(f"Deleted {deleted} expired translation memory row(s)")
@@ -0,0 +1,238 @@
+"""
+Translation memory: reuse earlier translations of identical text.
+
+Lookups go through two tiers keyed by a hash of the normalized text, the
+language pair and TRANSLATION_MEMORY_VERSION:
+
+1. an in-process LRU with per-entry expiry
+2. the TranslationMemoryEntry table, shared by all workers
+
+Bumping TRANSLATION_MEMORY_VERSION invalidates every existing entry, and
+entries older than TRANSLATION_MEMORY_TTL seconds are ignored; an entry
+copied into the LRU expires there when its row does. Run
+"manage.py purge_translation_memory" periodically to delete expired rows.
+
+Empty replies, and replies that just echo the source text, are never
+stored, so one bad LLM reply isn't served for the whole TTL.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import TranslationMemoryEntry
+
+_HORIZONTAL_SPACE = re.compile(r'[^\S\n]+')
+
+
+def normalize_text(text):
+    """
+    Normalize text for memory lookups
+
+    Applies Unicode NFC, unifies line endings and collapses runs of spaces
+    and tabs. Line breaks are kept because they carry form layout.
+    """
+    text = unicodedata.normalize('NFC', text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = [_HORIZONTAL_SPACE.sub(' ', line).strip() for line in text.split('\n')]
+    return '\n'.join(lines).strip()
+
+
+def is_storable(text, source_language, target_language, translated_text):
+    """
+    Whether a translation is worth remembering: not blank, and not the
+    source text echoed back when the languages differ
+    """
+    translated = normalize_text(translated_text or '')
+    if not translated:
+        return False
+    return source_language == target_language or translated != normalize_text(text)
+
+
+def content_hash(text, source_language, target_language, version):
+    """
+    Hash identifying a (text, source_language, target_language) triple
+    """
+    key = '\x1f'.join([str(version), source_language, target_language, normalize_text(text)])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    """
+    Two-tier (LRU + database) translation memory with hit-ratio counters
+    """
+
+    def __init__(self, max_entries=None, ttl=None, version=None):
+        self.max_entries = max_entries if max_entries is not None else settings.TRANSLATION_MEMORY_LRU_SIZE
+        self.ttl = ttl if ttl is not None else settings.TRANSLATION_MEMORY_TTL
+        self.version = version if version is not None else settings.TRANSLATION_MEMORY_VERSION
+
+        self._lock = threading.Lock()
+        # SQLite takes one writer at a time and fails a concurrent upsert
+        # with "database is locked" instead of waiting for it, so batch
+        # workers storing at once take turns
+        self._write_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {'lru_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0, 'rejected': 0}
+
+    def key(self, text, source_language, target_language):
+        return content_hash(text, source_language, target_language, self.version)
+
+    def lookup(self, text, source_language, target_language):
+        """
+        Look up a stored translation
+
+        Returns:
+            str: Translated text, or None on a miss
+        """
+        key = self.key(text, source_language, target_language)
+
+        translated = self._lru_get(key)
+        if translated is not None:
+            self._count('lru_hits')
+            return translated
+
+        row = self._db_get(key)
+        if row is not None:
+            translated, updated_at = row
+            self._count('db_hits')
+            # Only for what is left of the row's lifetime
+            ttl = (updated_at - timezone.now()).total_seconds() + self.ttl if self.ttl else None
+            self._lru_put(key, translated, ttl)
+            return translated
+
+        self._count('misses')
+        return None
+
+    def store(self, text, source_language, target_language, translated_text):
+        """
+        Store a translation in both tiers, unless it isn't storable (see
+        is_storable)
+
+        Returns:
+            bool: Whether it was stored
+        """
+        if not is_storable(text, source_language, target_language, translated_text):
+            self._count('rejected')
+            return False
+        key = self.key(text, source_language, target_language)
+        with self._write_lock:
+            TranslationMemoryEntry.objects.update_or_create(
+                content_hash=key,
+                defaults={
+                    'original_text': text,
+                    'translated_text': translated_text,
+                    'source_language_id': source_language,
+                    'target_language_id': target_language,
+                    'version': self.version,
+                }
+            )
+        self._lru_put(key, translated_text)
+        self._count('stores')
+        return True
+
+    def get_or_translate(self, text, source_language, target_language, translate_fn):
+        """
+        Return a remembered translation, or call translate_fn and remember it
+
+        Exceptions from translate_fn propagate and nothing is stored, so
+        failed calls are never served from memory; neither are blank or
+        untranslated replies, which are returned but not stored.
+        """
+        translated = self.lookup(text, source_language, target_language)
+        if translated is None:
+            translated = translate_fn(text, source_language, target_language)
+            self.store(text, source_language, target_language, translated)
+        return translated
+
+    def purge_expired(self):
+        """
+        Delete database entries older than the TTL
+
+        Returns:
+            int: Number of rows deleted
+        """
+        if not self.ttl:
+            return 0
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        deleted, _ = TranslationMemoryEntry.objects.filter(updated_at__lt=cutoff).delete()
+        return deleted
+
+    def clear_local(self):
+        """
+        Drop the in-process tier (the database tier is left untouched)
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get hit/miss counters for this process
+
+        Returns:
+            dict: Counters plus overall and per-tier hit ratios
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+
+        lookups = counters['lru_hits'] + counters['db_hits'] + counters['misses']
+        hits = counters['lru_hits'] + counters['db_hits']
+        counters.update({
+            'lookups': lookups,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'lru_hit_ratio': counters['lru_hits'] / lookups if lookups else 0.0,
+            'lru_size': size,
+            'version': self.version,
+        })
+        return counters
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _lru_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            translated, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return translated
+
+    def _lru_put(self, key, translated_text, ttl=None):
+        if self.max_entries <= 0:
+            return
+        if ttl is None:
+            ttl = self.ttl
+        elif ttl <= 0:
+            return  # expired already
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (translated_text, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _db_get(self, key):
+        queryset = TranslationMemoryEntry.objects.filter(content_hash=key)
+        if self.ttl:
+            queryset = queryset.filter(updated_at__gte=timezone.now() - timedelta(seconds=self.ttl))
+        return queryset.values_list('translated_text', 'updated_at').first()
+
+
+translation_memory = TranslationMemory()
@@ -0,0 +1,171 @@
+"""
+MinHash / LSH index for finding near-duplicate segments.
+
+Each text is reduced to character 3-gram shingles, summarized as a MinHash
+signature and bucketed by bands of that signature, so a query only has to
+compare against texts sharing at least one band. Candidates are then
+verified with the exact Jaccard similarity of their shingle sets, and must
+have the same words as the query: character similarity alone can't tell
+"must sign" from "must not sign".
+"""
+import hashlib
+import random
+import re
+import struct
+import threading
+import time
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORDS = re.compile(r'\w+')
+
+
+def shingles(text, size=3):
+    """
+    Set of character n-grams of the lowercased, space-normalized text
+    """
+    text = ' '.join(text.lower().split())
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def words(text):
+    """
+    Word tokens of the case-folded text, ignoring punctuation and spacing
+    """
+    return tuple(_WORDS.findall(text.casefold()))
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _hash_shingle(shingle):
+    digest = hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest()
+    return struct.unpack('<I', digest)[0]
+
+
+class MinHashIndex:
+    """
+    Thread-safe near-duplicate index mapping source text to a payload
+
+    Args:
+        num_perm (int): Signature length
+        bands (int): Number of LSH bands; num_perm must be divisible by it
+        seed (int): Seed for the permutation coefficients
+        max_items (int): Oldest texts are evicted beyond this size
+        ttl (int): Seconds a text stays matchable after add() (None: forever)
+    """
+
+    def __init__(self, num_perm=64, bands=16, seed=1, max_items=50000, ttl=None):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_items = max_items
+        self.ttl = ttl
+
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+        self._lock = threading.Lock()
+        self._buckets = [dict() for _ in range(bands)]
+        self._items = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, text):
+        return text in self._items
+
+    def signature(self, shingle_set):
+        hashes = [_hash_shingle(shingle) for shingle in shingle_set]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._permutations
+        )
+
+    def _band_keys(self, signature):
+        return [
+            signature[band * self.rows:(band + 1) * self.rows]
+            for band in range(self.bands)
+        ]
+
+    def add(self, text, payload, ttl=None):
+        """
+        Index text with an associated payload (replacing any previous one)
+
+        Args:
+            ttl (float): Seconds it stays matchable, if less than the index's
+                (e.g. what is left of a stored translation's lifetime)
+        """
+        shingle_set = shingles(text)
+        band_keys = self._band_keys(self.signature(shingle_set))
+        lifetimes = [value for value in (ttl, self.ttl) if value is not None]
+        expires_at = time.monotonic() + min(lifetimes) if lifetimes else None
+        with self._lock:
+            if text in self._items:
+                del self._items[text]
+            else:
+                for buckets, key in zip(self._buckets, band_keys):
+                    buckets.setdefault(key, set()).add(text)
+            self._items[text] = (shingle_set, band_keys, payload, words(text), expires_at)
+
+            while len(self._items) > self.max_items:
+                self._remove(next(iter(self._items)))
+
+    def _remove(self, text):
+        # Caller holds self._lock
+        band_keys = self._items.pop(text)[1]
+        for buckets, key in zip(self._buckets, band_keys):
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.discard(text)
+                if not bucket:
+                    del buckets[key]
+
+    def query(self, text, threshold):
+        """
+        Find the most similar indexed text
+
+        Only texts with the same word sequence match, so texts differing
+        in case, spacing or punctuation can share a translation but a
+        changed number ("Page 1 of 3" vs "Page 2 of 3") or an added word
+        ("must not sign") never reuses one.
+
+        Returns:
+            tuple: (matched_text, payload, similarity), or None if nothing
+            reaches the threshold
+        """
+        shingle_set = shingles(text)
+        band_keys = self._band_keys(self.signature(shingle_set))
+        query_words = words(text)
+
+        now = time.monotonic()
+        with self._lock:
+            candidates = set()
+            for buckets, key in zip(self._buckets, band_keys):
+                candidates.update(buckets.get(key, ()))
+            items = []
+            for candidate in candidates:
+                expires_at = self._items[candidate][4]
+                if expires_at is not None and expires_at < now:
+                    self._remove(candidate)
+                else:
+                    items.append((candidate, self._items[candidate]))
+
+        best = None
+        for candidate, (candidate_shingles, _, payload, candidate_words, _) in items:
+            if candidate_words != query_words:
+                continue
+            similarity = jaccard(shingle_set, candidate_shingles)
+            if similarity >= threshold and (best is None or similarity > best[2]):
+                best = (candidate, payload, similarity)
+        return best
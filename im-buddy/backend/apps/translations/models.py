@@ -12,4 +12,21 @@ class Translation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"Translation from {self.source_language} to {self.target_language}" 
\ No newline at end of file
+        return f"Translation from {self.source_language} to {self.target_language}" 
+
+class TranslationMemoryEntry(models.Model):
+    """
+    Shared translation memory row, keyed by a hash of the normalized source
+    text, language pair and memory version.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    # TRANSLATION_MEMORY_VERSION it was stored under, for queries by language pair
+    version = models.CharField(max_length=32, default='', db_index=True)
+    original_text = models.TextField()
+    translated_text = models.TextField()
+    source_language = models.ForeignKey(Language, on_delete=models.CASCADE, related_name='+')
+    target_language = models.ForeignKey(Language, on_delete=models.CASCADE, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Memory entry from {self.source_language_id} to {self.target_language_id}"
@@ -0,0 +1,96 @@
+"""
+Split form text into translatable segments and put it back together.
+
+Segments are lines, further split into sentences. Everything between
+segments (line breaks, indentation, spacing) is kept verbatim as
+non-translatable filler, so joining every piece in order reproduces the
+input exactly.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List
+
+# Sentence end followed by whitespace and the start of a new sentence
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+(?=["“(\[]?[A-Z0-9À-ÖØ-Þ])')
+_LEADING_SPACE = re.compile(r'^\s*')
+_TRAILING_SPACE = re.compile(r'\s*$')
+# Pieces with no letters (numbers, blanks like "_____", punctuation) are kept as-is
+_HAS_LETTER = re.compile(r'[^\W\d_]')
+
+_ABBREVIATIONS = {
+    'e.g.', 'i.e.', 'etc.', 'vs.', 'no.', 'nr.', 'mr.', 'mrs.', 'ms.', 'dr.',
+    'st.', 'jr.', 'sr.', 'approx.', 'art.', 'sec.', 'para.', 'p.', 'pp.',
+}
+
+
+@dataclass
+class Segment:
+    text: str
+    translatable: bool
+
+
+def _ends_with_abbreviation(text):
+    last_word = text.rsplit(None, 1)[-1].lower() if text.strip() else ''
+    # Initials such as "U.S." or "J." are not sentence ends either
+    return last_word in _ABBREVIATIONS or bool(re.fullmatch(r'(?:[a-z]\.)+', last_word))
+
+
+def _split_sentences(line):
+    sentences = []
+    start = 0
+    for match in _SENTENCE_BREAK.finditer(line):
+        if _ends_with_abbreviation(line[start:match.start()]):
+            continue
+        sentences.append(line[start:match.start()])
+        sentences.append(match.group(0))
+        start = match.end()
+    sentences.append(line[start:])
+    return sentences
+
+
+def split_segments(text: str) -> List[Segment]:
+    """
+    Split text into an ordered list of segments
+
+    Returns:
+        list: Segment objects; ''.join(s.text for s in segments) == text
+    """
+    segments = []
+
+    def add(piece, translatable):
+        if not piece:
+            return
+        if not translatable and segments and not segments[-1].translatable:
+            segments[-1].text += piece
+        else:
+            segments.append(Segment(piece, translatable))
+
+    for line in text.splitlines(keepends=True):
+        leading = _LEADING_SPACE.match(line).group(0)
+        trailing = _TRAILING_SPACE.search(line[len(leading):]).group(0)
+        body = line[len(leading):len(line) - len(trailing)]
+
+        add(leading, False)
+        for index, piece in enumerate(_split_sentences(body)):
+            # Odd indexes are the whitespace between two sentences
+            add(piece, index % 2 == 0 and bool(_HAS_LETTER.search(piece)))
+        add(trailing, False)
+
+    return segments
+
+
+def reassemble(segments: List[Segment], translations: Dict[int, str]) -> str:
+    """
+    Join segments back together, substituting translated segments
+
+    Args:
+        segments (list): Output of split_segments
+        translations (dict): Segment index -> translated text
+
+    Returns:
+        str: Reassembled text
+    """
+    return ''.join(
+        translations.get(index, segment.text) if segment.translatable else segment.text
+        for index, segment in enumerate(segments)
+    )
@@ -0,0 +1,430 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import httpx
+import requests
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.visa_info.models import Language
+from services import llama_common
+from utils.tracing import tracer
+from .memory import TranslationMemory, normalize_text, translation_memory
+from .models import Translation, TranslationMemoryEntry
+from .segmenter import split_segments
+from .translator import clear_fuzzy_indexes, translate_segmented
+from .views import translate_async
+
+
+class TranslationMemoryTests(TestCase):
+
+    def setUp(self):
+        Language.objects.create(code='en', name='English')
+        Language.objects.create(code='es', name='Spanish')
+        self.memory = TranslationMemory(max_entries=10, ttl=3600, version='1')
+        self.translate_fn = mock.Mock(return_value='Fecha de nacimiento')
+
+    def test_normalization_ignores_spacing_but_keeps_lines(self):
+        self.assertEqual(normalize_text('  Date \t of  birth \r\n Name '), 'Date of birth\nName')
+
+    def test_second_lookup_is_served_from_lru(self):
+        self.memory.get_or_translate('Date of birth', 'en', 'es', self.translate_fn)
+        result = self.memory.get_or_translate('Date  of birth ', 'en', 'es', self.translate_fn)
+
+        self.assertEqual(result, 'Fecha de nacimiento')
+        self.assertEqual(self.translate_fn.call_count, 1)
+        self.assertEqual(self.memory.stats()['lru_hits'], 1)
+
+    def test_database_tier_is_shared_between_processes(self):
+        self.memory.store('Date of birth', 'en', 'es', 'Fecha de nacimiento')
+        other_worker = TranslationMemory(max_entries=10, ttl=3600, version='1')
+
+        self.assertEqual(other_worker.lookup('Date of birth', 'en', 'es'), 'Fecha de nacimiento')
+        self.assertEqual(other_worker.stats()['db_hits'], 1)
+
+    def test_version_bump_invalidates_entries(self):
+        self.memory.store('Date of birth', 'en', 'es', 'Fecha de nacimiento')
+        bumped = TranslationMemory(max_entries=10, ttl=3600, version='2')
+
+        self.assertIsNone(bumped.lookup('Date of birth', 'en', 'es'))
+
+    def test_failed_translation_is_not_stored(self):
+        failing = mock.Mock(side_effect=requests.exceptions.Timeout('timed out'))
+
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.memory.get_or_translate('Signature', 'en', 'es', failing)
+        self.assertFalse(TranslationMemoryEntry.objects.exists())
+
+    def test_blank_or_echoed_replies_are_not_stored(self):
+        for reply in ('', '  \n ', ' Signature '):
+            result = self.memory.get_or_translate('Signature', 'en', 'es', mock.Mock(return_value=reply))
+            self.assertEqual(result, reply)
+
+        self.assertFalse(TranslationMemoryEntry.objects.exists())
+        self.assertIsNone(self.memory.lookup('Signature', 'en', 'es'))
+        self.assertEqual(self.memory.stats()['rejected'], 3)
+
+    def test_database_hit_is_cached_only_for_the_rest_of_its_lifetime(self):
+        self.memory.store('Date of birth', 'en', 'es', 'Fecha de nacimiento')
+        TranslationMemoryEntry.objects.update(updated_at=timezone.now() - timedelta(seconds=3590))
+        other_worker = TranslationMemory(max_entries=10, ttl=3600, version='1')
+        other_worker.lookup('Date of birth', 'en', 'es')
+
+        with mock.patch('apps.translations.memory.time.monotonic', return_value=time.monotonic() + 20):
+            other_worker.lookup('Date of birth', 'en', 'es')
+
+        self.assertEqual((other_worker.stats()['lru_hits'], other_worker.stats()['db_hits']), (0, 2))
+
+    def test_purge_command_deletes_expired_rows(self):
+        self.memory.store('Date of birth', 'en', 'es', 'Fecha de nacimiento')
+        self.memory.store('Signature', 'en', 'es', 'Firma')
+        TranslationMemoryEntry.objects.filter(original_text='Signature').update(
+            updated_at=timezone.now() - timedelta(seconds=7200)
+        )
+        output = StringIO()
+
+        call_command('purge_translation_memory', '--ttl', '3600', stdout=output)
+
+        self.assertEqual(list(TranslationMemoryEntry.objects.values_list('original_text', flat=True)),
+                         ['Date of birth'])
+        self.assertIn('Deleted 1 ', output.getvalue())
+
+
+class SegmentedTranslationTests(TestCase):
+
+    def setUp(self):
+        Language.objects.create(code='en', name='English')
+        Language.objects.create(code='es', name='Spanish')
+        self.memory = TranslationMemory(max_entries=100, ttl=3600, version='1')
+        clear_fuzzy_indexes()
+
+    @staticmethod
+    def fake_batch(texts, source_language, target_language):
+        return [f'ES({text})' for text in texts]
+
+    def test_segments_reassemble_to_the_original_text(self):
+        text = 'Date of birth:\n  Signature ____\n\nPlease sign here. See the U.S. rules.\n'
+        self.assertEqual(''.join(segment.text for segment in split_segments(text)), text)
+
+    def test_only_unseen_segments_are_sent_in_one_batch(self):
+        batch = mock.Mock(side_effect=self.fake_batch)
+        self.memory.store('Signature', 'en', 'es', 'Firma')
+
+        result = translate_segmented(
+            'Date of birth\nSignature\n  Date of birth', 'en', 'es', batch_fn=batch, memory=self.memory
+        )
+
+        self.assertEqual(result, 'ES(Date of birth)\nFirma\n  ES(Date of birth)')
+        batch.assert_called_once_with(['Date of birth'], 'en', 'es')
+
+    def test_near_duplicate_segment_reuses_translation(self):
+        batch = mock.Mock(side_effect=self.fake_batch)
+        translate_segmented('Full name of the applicant', 'en', 'es', batch_fn=batch, memory=self.memory)
+
+        result = translate_segmented('Full name of the applicant:', 'en', 'es', batch_fn=batch, memory=self.memory)
+
+        self.assertEqual(result, 'ES(Full name of the applicant):')
+        self.assertEqual(batch.call_count, 1)
+
+    def test_version_bump_invalidates_near_duplicates(self):
+        batch = mock.Mock(side_effect=self.fake_batch)
+        translate_segmented('Full name of the applicant', 'en', 'es', batch_fn=batch, memory=self.memory)
+        bumped = TranslationMemory(max_entries=100, ttl=3600, version='2')
+
+        result = translate_segmented('Full name of the applicant:', 'en', 'es', batch_fn=batch, memory=bumped)
+        clear_fuzzy_indexes()  # as in a fresh worker, warming from the table
+        warmed = translate_segmented('Full name of the applicant.', 'en', 'es', batch_fn=batch,
+                                     memory=TranslationMemory(max_entries=100, ttl=3600, version='2'))
+
+        self.assertEqual(result, 'ES(Full name of the applicant:)')
+        self.assertEqual(warmed, 'ES(Full name of the applicant.)')
+        self.assertEqual(batch.call_count, 3)
+
+    def test_expired_entries_are_not_near_duplicates(self):
+        batch = mock.Mock(side_effect=self.fake_batch)
+        translate_segmented('Full name of the applicant', 'en', 'es', batch_fn=batch, memory=self.memory)
+        TranslationMemoryEntry.objects.update(updated_at=timezone.now() - timedelta(seconds=3601))
+        clear_fuzzy_indexes()
+
+        result = translate_segmented('Full name of the applicant:', 'en', 'es', batch_fn=batch, memory=self.memory)
+
+        self.assertEqual(result, 'ES(Full name of the applicant:)')
+        self.assertEqual(batch.call_count, 2)
+
+    def test_near_duplicates_expire_in_the_index(self):
+        batch = mock.Mock(side_effect=self.fake_batch)
+        translate_segmented('Full name of the applicant', 'en', 'es', batch_fn=batch, memory=self.memory)
+
+        with mock.patch('apps.translations.minhash.time.monotonic', return_value=time.monotonic() + 3601):
+            result = translate_segmented('Full name of the applicant:', 'en', 'es', batch_fn=batch,
+                                         memory=self.memory)
+
+        self.assertEqual(result, 'ES(Full name of the applicant:)')
+        self.assertEqual(batch.call_count, 2)
+
+    def test_near_duplicate_with_a_negation_is_translated(self):
+        batch = mock.Mock(side_effect=self.fake_batch)
+        affirmative = 'You must sign this form in the presence of an immigration officer before submitting it'
+        negated = affirmative.replace('must sign', 'must not sign')
+        translate_segmented(affirmative, 'en', 'es', batch_fn=batch, memory=self.memory)
+
+        result = translate_segmented(negated, 'en', 'es', batch_fn=batch, memory=self.memory)
+
+        self.assertEqual(result, f'ES({negated})')
+        self.assertEqual(batch.call_count, 2)
+
+    def test_near_duplicate_with_different_numbers_is_translated(self):
+        batch = mock.Mock(side_effect=self.fake_batch)
+        translate_segmented('Page 1 of 3', 'en', 'es', batch_fn=batch, memory=self.memory)
+
+        result = translate_segmented('Page 2 of 3', 'en', 'es', batch_fn=batch, memory=self.memory)
+
+        self.assertEqual(result, 'ES(Page 2 of 3)')
+
+
+class TranslateViewTests(TestCase):
+
+    def setUp(self):
+        Language.objects.create(code='en', name='English')
+        Language.objects.create(code='es', name='Spanish')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('alice'))
+        translation_memory.clear_local()
+        clear_fuzzy_indexes()
+
+    @mock.patch('services.llama_service.request_translation', return_value='Firma')
+    def test_repeated_text_skips_the_translation_service(self, request_translation):
+        payload = {'text': 'Signature', 'source_language': 'en', 'target_language': 'es'}
+
+        first = self.client.post('/api/translations/translate/', payload, format='json')
+        second = self.client.post('/api/translations/translate/', payload, format='json')
+
+        self.assertEqual(first.data['translated_text'], 'Firma')
+        self.assertEqual(second.data['translated_text'], 'Firma')
+        self.assertEqual(request_translation.call_count, 1)
+        self.assertEqual(Translation.objects.count(), 2)
+
+
+class TranslateAsyncViewTests(TestCase):
+
+    def setUp(self):
+        Language.objects.create(code='en', name='English')
+        Language.objects.create(code='es', name='Spanish')
+        self.user = User.objects.create_user('alice')
+        translation_memory.clear_local()
+        clear_fuzzy_indexes()
+
+    def post(self, payload, user):
+        request = AsyncRequestFactory().post(
+            '/api/translations/translate/', json.dumps(payload), content_type='application/json'
+        )
+        request.user = user
+        request._dont_enforce_csrf_checks = True
+        return translate_async(request)
+
+    async def test_translates_and_saves_like_the_sync_view(self):
+        payload = {'text': 'Signature', 'source_language': 'en', 'target_language': 'es'}
+
+        with mock.patch('services.llama_service.arequest_translation', return_value='Firma') as request_translation:
+            first = await self.post(payload, self.user)
+            second = await self.post(payload, self.user)
+
+        self.assertEqual(json.loads(first.content)['translated_text'], 'Firma')
+        self.assertEqual(json.loads(second.content)['translated_text'], 'Firma')
+        self.assertEqual(request_translation.await_count, 1)
+        self.assertEqual(await Translation.objects.acount(), 2)
+
+    async def test_requires_authentication(self):
+        response = await self.post({'text': 'Signature'}, AnonymousUser())
+
+        self.assertIn(response.status_code, (401, 403))
+
+
+
+@mock.patch('services.llama_common.get_headers', return_value={'Authorization': 'Bearer test'})
+class AsyncLlamaClientTests(SimpleTestCase):
+
+    def test_each_event_loop_keeps_its_own_client(self, get_headers):
+        async def clients():
+            first = llama_common.get_async_client()
+            same = llama_common.get_async_client()
+            await llama_common.close_async_client()
+            return first, same, llama_common.get_async_client()
+
+        first, same, reopened = asyncio.run(clients())
+        other_loop = asyncio.run(clients())[0]
+
+        self.assertIs(first, same)
+        self.assertTrue(first.is_closed)
+        self.assertIsNot(reopened, first)
+        self.assertIsNot(other_loop, first)
+
+    def test_non_json_reply_is_a_request_exception(self, get_headers):
+        async def request():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(
+                lambda request: httpx.Response(200, text='<html>Bad gateway</html>')
+            ))
+            with mock.patch('services.llama_common.get_async_client', return_value=client):
+                try:
+                    return await llama_common.amake_api_request('https://llama.test/v1/chat', {'messages': []})
+                finally:
+                    await client.aclose()
+
+        with self.assertRaises(requests.exceptions.RequestException) as raised:
+            asyncio.run(request())
+        self.assertIsInstance(raised.exception, requests.exceptions.JSONDecodeError)
+
+
+@override_settings(TRANSLATION_BATCH_CONCURRENCY=4)
+class TranslateBatchViewTests(TransactionTestCase):
+
+    def setUp(self):
+        Language.objects.create(code='en', name='English')
+        Language.objects.create(code='es', name='Spanish')
+        Language.objects.create(code='fr', name='French')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('alice'))
+        translation_memory.clear_local()
+        clear_fuzzy_indexes()
+
+    @staticmethod
+    def fake_translation(text, source_language, target_language):
+        if text == 'Fail':
+            raise requests.exceptions.ConnectionError('connection refused')
+        return f'{target_language}({text})'
+
+    def test_results_keep_input_order_with_per_item_errors(self):
+        payload = {
+            'source_language': 'en',
+            'target_language': 'es',
+            'items': [
+                {'text': 'Name'},
+                {'text': 'Name', 'target_language': 'fr'},
+                {'text': 'Fail'},
+                {'text': ' Name '},
+                {'text': 'Name', 'target_language': 'xx'},
+                {'text': ''},
+            ],
+        }
+
+        with mock.patch('services.llama_service.request_translation',
+                        side_effect=self.fake_translation) as request_translation:
+            response = self.client.post('/api/translations/translate/batch/', payload, format='json')
+
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], list(range(6)))
+        self.assertEqual(results[0]['translated_text'], 'es(Name)')
+        self.assertEqual(results[1]['translated_text'], 'fr(Name)')
+        self.assertIn('connection refused', results[2]['error'])
+        self.assertEqual(results[3]['translated_text'], 'es(Name)')
+        self.assertEqual(results[4]['error'], 'Unknown language')
+        self.assertEqual(results[5]['error'], 'Missing required fields')
+        # "Name" and " Name " into Spanish are translated once
+        self.assertEqual(request_translation.call_count, 3)
+        self.assertEqual(Translation.objects.count(), 3)
+
+    def test_items_are_translated_in_parallel(self):
+        # Each call waits for another to be running at the same time
+        barrier = threading.Barrier(2, timeout=5)
+
+        def translation(text, source_language, target_language):
+            barrier.wait()
+            return self.fake_translation(text, source_language, target_language)
+
+        payload = {'source_language': 'en', 'target_language': 'es',
+                   'items': [{'text': 'Name'}, {'text': 'Address'}]}
+        with mock.patch('services.llama_service.request_translation', side_effect=translation):
+            response = self.client.post('/api/translations/translate/batch/', payload, format='json')
+
+        self.assertEqual([result['translated_text'] for result in response.data['results']],
+                         ['es(Name)', 'es(Address)'])
+
+    def test_invalid_and_failing_items_are_per_item_errors(self):
+        def translation(text, source_language, target_language):
+            if text == 'Broken':
+                raise DatabaseError('disk I/O error')
+            return self.fake_translation(text, source_language, target_language)
+
+        payload = {
+            'source_language': 'en',
+            'target_language': 'es',
+            'items': [
+                {'text': 123},
+                {'text': 'Name', 'target_language': ['es']},
+                {'text': 'Broken'},
+                {'text': 'Name'},
+            ],
+        }
+
+        with mock.patch('services.llama_service.request_translation', side_effect=translation):
+            response = self.client.post('/api/translations/translate/batch/', payload, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertIn('must be strings', results[0]['error'])
+        self.assertIn('must be strings', results[1]['error'])
+        self.assertEqual(results[2]['error'], 'Translation error: internal error')
+        self.assertEqual(results[3]['translated_text'], 'es(Name)')
+
+    def test_repeated_texts_are_remembered_once(self):
+        # "Name" is an item of its own and a segment of the last two, so
+        # several workers store the same memory entry at once
+        texts = ['Name', 'Name', ' Name ', 'Date of birth', 'Name\nDate of birth', 'Date of birth\nName']
+        payload = {'source_language': 'en', 'target_language': 'es',
+                   'items': [{'text': text} for text in texts]}
+
+        with mock.patch('services.llama_service.request_translation', side_effect=self.fake_translation):
+            response = self.client.post('/api/translations/translate/batch/', payload, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['translated_text'] for result in response.data['results']], [
+            'es(Name)', 'es(Name)', 'es(Name)', 'es(Date of birth)',
+            'es(Name)\nes(Date of birth)', 'es(Date of birth)\nes(Name)',
+        ])
+        self.assertEqual(Translation.objects.count(), len(texts))
+        entries = TranslationMemoryEntry.objects.all()
+        hashes = [entry.content_hash for entry in entries]
+        self.assertEqual(len(hashes), len(set(hashes)))
+        self.assertEqual(
+            {entry.original_text: entry.translated_text for entry in entries},
+            {'Name': 'es(Name)', 'Date of birth': 'es(Date of birth)',
+             'Name\nDate of birth': 'es(Name)\nes(Date of birth)',
+             'Date of birth\nName': 'es(Date of birth)\nes(Name)'},
+        )
+
+    def test_llm_spans_nest_under_the_request_span(self):
+        trace_file = os.path.join(tempfile.mkdtemp(), 'traces.jsonl')
+        self.addCleanup(os.remove, trace_file)
+        payload = {'source_language': 'en', 'target_language': 'es',
+                   'items': [{'text': 'Name'}, {'text': 'Address'}]}
+
+        with mock.patch.multiple(tracer, exporter='file', path=trace_file, sample_rate=1.0), \
+                mock.patch('services.llama_common.get_headers', return_value={}), \
+                mock.patch('services.llama_common.get_session') as get_session:
+            get_session.return_value.post.return_value = mock.Mock(
+                status_code=200, json=mock.Mock(return_value={'translated_text': 'traducido'}))
+            self.client.post('/api/translations/translate/batch/', payload, format='json')
+
+        with open(trace_file, encoding='utf-8') as spans:
+            spans = [json.loads(line) for line in spans]
+        root = spans[-1]
+        self.assertEqual(root['name'], 'POST api/translations/translate/batch/')
+        llm = [span for span in spans if span['name'] == 'llm.request']
+        self.assertEqual(len(llm), 2)
+        for span in llm:
+            self.assertEqual((span['traceId'], span['parentSpanId']), (root['traceId'], root['spanId']))
+
+    def test_rejects_empty_batch(self):
+        response = self.client.post('/api/translations/translate/batch/', {'items': []}, format='json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,265 @@
+"""
+Segment-level translation on top of the translation memory.
+
+Text is split into segments (see segmenter.py). Each segment is resolved
+from the translation memory, then from a near-duplicate MinHash index;
+only the remaining unique segments are sent to the LLM, in one batched
+request, and the output is reassembled in the original order.
+
+Planning and completion are separate steps so callers can fetch the
+missing segments however they like; atranslate() does so with the async
+LLaMa client.
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from services.llama_service import arequest_batch_translation, request_batch_translation
+from .memory import is_storable, normalize_text, translation_memory
+from .minhash import MinHashIndex
+from .models import TranslationMemoryEntry
+from .segmenter import Segment, split_segments, reassemble
+
+
+@dataclass
+class TranslationPlan:
+    source_language: str
+    target_language: str
+    segments: List[Segment]
+    # Segment index -> translated text, for segments already resolved
+    translations: Dict[int, str] = field(default_factory=dict)
+    # Normalized text -> indexes of the segments waiting on it
+    pending: Dict[str, List[int]] = field(default_factory=dict)
+
+    @property
+    def missing_texts(self):
+        """Unique segment texts that still need translating, in document order"""
+        return [self.segments[indexes[0]].text for indexes in self.pending.values()]
+
+
+class SegmentStats:
+    """Counters describing how segments were resolved in this process"""
+
+    FIELDS = ('segments', 'exact_hits', 'fuzzy_hits', 'duplicates', 'translated', 'llm_requests')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self._counters[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+        reused = counters['exact_hits'] + counters['fuzzy_hits'] + counters['duplicates']
+        counters['reuse_ratio'] = reused / counters['segments'] if counters['segments'] else 0.0
+        return counters
+
+    def reset(self):
+        with self._lock:
+            self._counters = dict.fromkeys(self.FIELDS, 0)
+
+
+segment_stats = SegmentStats()
+
+_fuzzy_indexes = {}
+_fuzzy_lock = threading.Lock()
+
+_TRAILING_PUNCTUATION = re.compile(r'[^\w\s]*$')
+
+
+def get_fuzzy_index(source_language, target_language, memory=translation_memory):
+    """
+    Get the near-duplicate index for a language pair and memory version,
+    warming it from the most recent live translation memory entries on
+    first use
+
+    Entries follow the memory's invalidation rules: only rows stored under
+    its version are indexed, and each one expires with the memory's TTL.
+    """
+    key = (memory.version, source_language, target_language)
+    with _fuzzy_lock:
+        index = _fuzzy_indexes.get(key)
+        if index is not None:
+            return index
+        # Indexes of another version can't be hit again
+        for stale in [other for other in _fuzzy_indexes if other[0] != memory.version]:
+            del _fuzzy_indexes[stale]
+        index = MinHashIndex(max_items=settings.TRANSLATION_FUZZY_INDEX_SIZE, ttl=memory.ttl or None)
+        _fuzzy_indexes[key] = index
+
+    entries = TranslationMemoryEntry.objects.filter(
+        source_language_id=source_language, target_language_id=target_language, version=memory.version
+    )
+    now = timezone.now()
+    if memory.ttl:
+        entries = entries.filter(updated_at__gte=now - timedelta(seconds=memory.ttl))
+    entries = (
+        entries.order_by('-updated_at')
+        .values_list('original_text', 'translated_text', 'updated_at')[:settings.TRANSLATION_FUZZY_WARM_LIMIT]
+    )
+    for original_text, translated_text, updated_at in reversed(list(entries)):
+        if len(original_text) <= settings.TRANSLATION_FUZZY_MAX_LENGTH:
+            remaining = (updated_at - now).total_seconds() + memory.ttl if memory.ttl else None
+            index.add(normalize_text(original_text), translated_text, ttl=remaining)
+    return index
+
+
+def clear_fuzzy_indexes():
+    with _fuzzy_lock:
+        _fuzzy_indexes.clear()
+
+
+def adapt_fuzzy_match(text, matched_text, translated):
+    """
+    Fit a near-duplicate's translation to text
+
+    Matches have the same words (see MinHashIndex.query) but may end
+    differently, e.g. "Full name of the applicant:" against "Full name of
+    the applicant". The matched text's trailing punctuation is swapped for
+    text's in the translation.
+
+    Returns:
+        str: Adapted translation, or None if the translation doesn't end
+        with the matched text's punctuation, so it can't be swapped
+    """
+    wanted = _TRAILING_PUNCTUATION.search(text).group()
+    present = _TRAILING_PUNCTUATION.search(matched_text).group()
+    if wanted == present:
+        return translated
+    translated = translated.rstrip()
+    if not translated.endswith(present):
+        return None
+    return translated[:len(translated) - len(present)] + wanted
+
+
+def plan_translation(text, source_language, target_language, memory=translation_memory):
+    """
+    Split text into segments and resolve as many as possible locally
+
+    Returns:
+        TranslationPlan: Resolved translations and the segments still missing
+    """
+    plan = TranslationPlan(source_language, target_language, split_segments(text))
+    fuzzy_index = None
+    resolved = {}
+    counts = dict.fromkeys(SegmentStats.FIELDS, 0)
+
+    for index, segment in enumerate(plan.segments):
+        if not segment.translatable:
+            continue
+        counts['segments'] += 1
+        key = normalize_text(segment.text)
+
+        if key in plan.pending:
+            plan.pending[key].append(index)
+            counts['duplicates'] += 1
+            continue
+        if key in resolved:
+            plan.translations[index] = resolved[key]
+            counts['duplicates'] += 1
+            continue
+
+        translated = memory.lookup(segment.text, source_language, target_language)
+        if translated is not None:
+            counts['exact_hits'] += 1
+        elif len(key) <= settings.TRANSLATION_FUZZY_MAX_LENGTH:
+            if fuzzy_index is None:
+                fuzzy_index = get_fuzzy_index(source_language, target_language, memory)
+            match = fuzzy_index.query(key, settings.TRANSLATION_FUZZY_THRESHOLD)
+            if match is not None:
+                translated = adapt_fuzzy_match(key, match[0], match[1])
+                if translated is not None:
+                    counts['fuzzy_hits'] += 1
+
+        if translated is None:
+            plan.pending[key] = [index]
+        else:
+            resolved[key] = translated
+            plan.translations[index] = translated
+
+    segment_stats.add(**counts)
+    return plan
+
+
+def complete_translation(plan, translated_texts, memory=translation_memory):
+    """
+    Fill in the missing segments of a plan and reassemble the text
+
+    Args:
+        plan (TranslationPlan): Output of plan_translation
+        translated_texts (list): Translations of plan.missing_texts, same order
+
+    Returns:
+        str: Fully translated text
+    """
+    missing_texts = plan.missing_texts
+    if len(translated_texts) != len(missing_texts):
+        raise ValueError(
+            f"Expected {len(missing_texts)} translated segments, got {len(translated_texts)}"
+        )
+
+    fuzzy_index = get_fuzzy_index(plan.source_language, plan.target_language, memory) if missing_texts else None
+    for (key, indexes), text, translated in zip(plan.pending.items(), missing_texts, translated_texts):
+        for index in indexes:
+            plan.translations[index] = translated
+        memory.store(text, plan.source_language, plan.target_language, translated)
+        if (len(key) <= settings.TRANSLATION_FUZZY_MAX_LENGTH
+                and is_storable(text, plan.source_language, plan.target_language, translated)):
+            fuzzy_index.add(key, translated)
+
+    segment_stats.add(translated=len(missing_texts))
+    return reassemble(plan.segments, plan.translations)
+
+
+def translate_segmented(text, source_language, target_language,
+                        batch_fn=request_batch_translation, memory=translation_memory):
+    """
+    Translate text segment by segment, reusing earlier work
+
+    Raises:
+        requests.exceptions.RequestException: If the LLM call fails
+    """
+    plan = plan_translation(text, source_language, target_language, memory=memory)
+    missing_texts = plan.missing_texts
+    translated_texts = []
+    if missing_texts:
+        translated_texts = batch_fn(missing_texts, source_language, target_language)
+        segment_stats.add(llm_requests=1)
+    return complete_translation(plan, translated_texts, memory=memory)
+
+
+async def atranslate(text, source_language, target_language,
+                     batch_fn=arequest_batch_translation, memory=translation_memory):
+    """
+    Async counterpart of memory.get_or_translate(..., translate_segmented)
+
+    Database work runs through sync_to_async; only the LLM call is awaited
+    on the event loop, so many translations can wait on it at once.
+
+    Raises:
+        requests.exceptions.RequestException: If the LLM call fails
+    """
+    translated = await sync_to_async(memory.lookup)(text, source_language, target_language)
+    if translated is not None:
+        return translated
+
+    plan = await sync_to_async(plan_translation)(text, source_language, target_language, memory=memory)
+    missing_texts = plan.missing_texts
+    translated_texts = []
+    if missing_texts:
+        translated_texts = await batch_fn(missing_texts, source_language, target_language)
+        segment_stats.add(llm_requests=1)
+
+    translated = await sync_to_async(complete_translation)(plan, translated_texts, memory=memory)
+    await sync_to_async(memory.store)(text, source_language, target_language, translated)
+    return translated
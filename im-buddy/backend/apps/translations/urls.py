@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from .views import translate
+from .views import translate, translate_async, translate_batch, memory_stats
 
 urlpatterns = [
-    path('translate/', translate, name='translate'),
-] 
\ No newline at end of file
+    path('translate/', translate_async if settings.ASYNC_LLM_VIEWS else translate, name='translate'),
+    path('translate/batch/', translate_batch, name='translate_batch'),
+    path('memory/stats/', memory_stats, name='translation_memory_stats'),
+]
@@ -1,13 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.shortcuts import get_object_or_404
 
 from apps.visa_info.models import Language
+from im_buddy.async_views import async_api_view
+from utils.tracing import in_current_context
+from .memory import normalize_text, translation_memory
 from .models import Translation
 from .serializers import TranslationSerializer
-from services.llama_service import translate_text
+from .translator import atranslate, segment_stats, translate_segmented
 
 
 @api_view(['POST'])
@@ -16,19 +26,28 @@ def translate(request):
     text = request.data.get('text')
     source_language = request.data.get('source_language')
     target_language = request.data.get('target_language')
-    
+
     if not text or not source_language or not target_language:
         return Response(
-            {'error': 'Missing required fields'}, 
+            {'error': 'Missing required fields'},
             status=status.HTTP_400_BAD_REQUEST
         )
-    
+
     source_lang_obj = get_object_or_404(Language, code=source_language)
     target_lang_obj = get_object_or_404(Language, code=target_language)
-    
-    # Call translation service
-    translated_text = translate_text(text, source_language, target_language)
-    
+
+    # Serve from translation memory, translating only unseen segments
+    try:
+        translated_text = translation_memory.get_or_translate(
+            text, source_language, target_language, translate_segmented
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"Error calling LLaMa API: {e}")
+        return Response(
+            {'error': f'Translation error: {str(e)}'},
+            status=status.HTTP_502_BAD_GATEWAY
+        )
+
     # Save translation to database
     translation = Translation.objects.create(
         user=request.user,
@@ -37,6 +56,160 @@ def translate(request):
         source_language=source_lang_obj,
         target_language=target_lang_obj
     )
-    
+
     serializer = TranslationSerializer(translation)
-    return Response(serializer.data) 
\ No newline at end of file
+    return Response(serializer.data)
+
+
+@async_api_view(['POST'])
+async def translate_async(request):
+    """Same contract as translate, awaiting the LLM call on the event loop"""
+    text = request.data.get('text')
+    source_language = request.data.get('source_language')
+    target_language = request.data.get('target_language')
+
+    if not text or not source_language or not target_language:
+        return JsonResponse(
+            {'error': 'Missing required fields'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    source_lang_obj = await Language.objects.filter(code=source_language).afirst()
+    target_lang_obj = await Language.objects.filter(code=target_language).afirst()
+    if source_lang_obj is None or target_lang_obj is None:
+        return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        translated_text = await atranslate(text, source_language, target_language)
+    except requests.exceptions.RequestException as e:
+        print(f"Error calling LLaMa API: {e}")
+        return JsonResponse(
+            {'error': f'Translation error: {str(e)}'},
+            status=status.HTTP_502_BAD_GATEWAY
+        )
+
+    translation = await Translation.objects.acreate(
+        user=request.user,
+        original_text=text,
+        translated_text=translated_text,
+        source_language=source_lang_obj,
+        target_language=target_lang_obj
+    )
+
+    data = await sync_to_async(lambda: TranslationSerializer(translation).data)()
+    return JsonResponse(data)
+
+
+def _translate_item(text, source_language, target_language):
+    # Runs in a worker thread: give it a clean DB connection and close it after
+    close_old_connections()
+    try:
+        return translation_memory.get_or_translate(
+            text, source_language, target_language, translate_segmented
+        )
+    finally:
+        close_old_connections()
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def translate_batch(request):
+    items = request.data.get('items')
+    default_source = request.data.get('source_language')
+    default_target = request.data.get('target_language')
+
+    if not isinstance(items, list) or not items:
+        return Response(
+            {'error': 'items must be a non-empty list'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > settings.TRANSLATION_BATCH_MAX_ITEMS:
+        return Response(
+            {'error': f'At most {settings.TRANSLATION_BATCH_MAX_ITEMS} items per batch'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Normalize items, falling back to the batch-level languages
+    requested = []
+    for item in items:
+        if not isinstance(item, dict):
+            item = {}
+        requested.append((
+            item.get('text'),
+            item.get('source_language') or default_source,
+            item.get('target_language') or default_target,
+        ))
+
+    codes = {code for _, source, target in requested for code in (source, target) if isinstance(code, str)}
+    languages = Language.objects.in_bulk(list(codes))
+
+    # Dedupe: each unique (text, source, target) is translated once
+    errors = {}
+    unique = {}
+    item_keys = []
+    for index, (text, source, target) in enumerate(requested):
+        key = None
+        if not text or not source or not target:
+            errors[index] = 'Missing required fields'
+        elif not all(isinstance(value, str) for value in (text, source, target)):
+            errors[index] = 'text, source_language and target_language must be strings'
+        elif source not in languages or target not in languages:
+            errors[index] = 'Unknown language'
+        else:
+            key = (normalize_text(text), source, target)
+            unique.setdefault(key, (text, source, target))
+        item_keys.append(key)
+
+    results = {}
+    if unique:
+        workers = min(settings.TRANSLATION_BATCH_CONCURRENCY, len(unique))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                key: executor.submit(in_current_context(_translate_item), *args)
+                for key, args in unique.items()
+            }
+            for key, future in futures.items():
+                try:
+                    results[key] = future.result()
+                except requests.exceptions.RequestException as e:
+                    print(f"Error calling LLaMa API: {e}")
+                    results[key] = e
+                except Exception as e:
+                    # e.g. a database error in one item: fail that item, not the batch
+                    print(f"Error translating batch item: {e}")
+                    results[key] = RuntimeError('internal error')
+
+    # Save all successful translations in one query
+    translations = []
+    for index, key in enumerate(item_keys):
+        if key is None:
+            continue
+        if isinstance(results[key], Exception):
+            errors[index] = f'Translation error: {str(results[key])}'
+            continue
+        text, source, target = requested[index]
+        translations.append(Translation(
+            user=request.user,
+            original_text=text,
+            translated_text=results[key],
+            source_language=languages[source],
+            target_language=languages[target]
+        ))
+    created = iter(Translation.objects.bulk_create(translations))
+
+    response_items = []
+    for index in range(len(requested)):
+        if index in errors:
+            response_items.append({'index': index, 'error': errors[index]})
+        else:
+            response_items.append({'index': index, **TranslationSerializer(next(created)).data})
+
+    return Response({'results': response_items})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def memory_stats(request):
+    stats = translation_memory.stats()
+    stats['segments'] = segment_stats.snapshot()
+    return Response(stats)
@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class VisaInfoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.visa_info' 
\ No newline at end of file
+    name = 'apps.visa_info'
+
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
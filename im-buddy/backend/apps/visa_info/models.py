@@ -24,4 +24,16 @@ class VisaType(models.Model):
     countries = models.ManyToManyField(Country, related_name='visa_types')
     
     def __str__(self):
-        return self.name 
\ No newline at end of file
+        return self.name
+
+
+class ReferenceDataVersion(models.Model):
+    """
+    Current version of the cached reference data (see refdata.py); one row,
+    shared by every worker process
+    """
+    name = models.CharField(max_length=20, primary_key=True)
+    version = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.name} at {self.version}"
@@ -0,0 +1,122 @@
+"""
+Cached, versioned reference data (countries, languages, visa types).
+
+Serialized responses are stored in Django's cache under a data version
+that changes whenever one of the models is saved or deleted (see
+signals.py). Each payload carries a strong ETag so clients can revalidate
+with If-None-Match and get a 304 without a body.
+
+bulk_create(), QuerySet.update() and raw SQL do not send model signals;
+call bump_data_version() after using them on these tables.
+
+The version is a ReferenceDataVersion row, so a bump reaches every
+worker: each process rereads it at most REFERENCE_DATA_VERSION_CHECK
+seconds after its last read (its own bumps apply at once). Payloads are
+keyed by version, so any cache backend works; a shared one just saves
+other workers the rebuild.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from .models import ReferenceDataVersion
+
+VERSION_NAME = 'refdata'
+
+# Payloads for the current version, kept in process to skip cache
+# round-trips and unpickling on warm hits. Keys include the version, so
+# entries never go stale; the dict is dropped when the version changes and
+# holds at most REFERENCE_DATA_LOCAL_PAYLOADS entries.
+_local_payloads = OrderedDict()
+_local_version = None
+_version_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _set_local_version(version):
+    global _local_payloads, _local_version, _version_checked_at
+
+    with _lock:
+        if version != _local_version:
+            _local_payloads = OrderedDict()
+            _local_version = version
+        _version_checked_at = time.monotonic()
+
+
+def get_data_version():
+    if _local_version is not None and time.monotonic() - _version_checked_at < settings.REFERENCE_DATA_VERSION_CHECK:
+        return _local_version
+
+    row, _ = ReferenceDataVersion.objects.get_or_create(
+        name=VERSION_NAME, defaults={'version': uuid.uuid4().hex}
+    )
+    _set_local_version(row.version)
+    return row.version
+
+
+def bump_data_version(**kwargs):
+    """
+    Invalidate every cached reference payload (usable as a signal receiver)
+    """
+    version = uuid.uuid4().hex
+    ReferenceDataVersion.objects.update_or_create(name=VERSION_NAME, defaults={'version': version})
+    _set_local_version(version)
+
+
+def get_payload(name, build):
+    """
+    Get a serialized payload for the current data version
+
+    Args:
+        name (str): Payload name, unique per distinct response; may contain
+            request parameters, as it is hashed into the cache key
+
+    Returns:
+        tuple: (JSON bytes, strong ETag)
+    """
+    version = get_data_version()
+    key = f'visa_info:refdata:{version}:{hashlib.sha256(name.encode()).hexdigest()[:32]}'
+
+    with _lock:
+        payload = _local_payloads.get(key)
+        if payload is not None:
+            _local_payloads.move_to_end(key)
+            return payload
+
+    payload = cache.get(key)
+    if payload is None:
+        body = JSONRenderer().render(build())
+        payload = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        cache.set(key, payload, settings.REFERENCE_DATA_CACHE_TIMEOUT)
+
+    with _lock:
+        if version == _local_version:
+            _local_payloads[key] = payload
+            while len(_local_payloads) > settings.REFERENCE_DATA_LOCAL_PAYLOADS:
+                _local_payloads.popitem(last=False)
+    return payload
+
+
+def cached_json_response(request, name, build):
+    """
+    Respond with a cached payload, or 304 if the client's ETag matches
+    """
+    body, etag = get_payload(name, build)
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+
+    response['ETag'] = etag
+    response['Cache-Control'] = f'private, max-age={settings.REFERENCE_DATA_MAX_AGE}, must-revalidate'
+    return response
@@ -0,0 +1,11 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .models import Country, Language, VisaType
+from .refdata import bump_data_version
+
+
+def connect_signals():
+    for model in (Country, Language, VisaType):
+        post_save.connect(bump_data_version, sender=model, dispatch_uid=f'refdata_save_{model.__name__}')
+        post_delete.connect(bump_data_version, sender=model, dispatch_uid=f'refdata_delete_{model.__name__}')
+    m2m_changed.connect(bump_data_version, sender=VisaType.countries.through, dispatch_uid='refdata_countries')
@@ -0,0 +1,113 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from im_buddy.testing import QueryCountAssertions
+from . import refdata
+from .models import Country, Language, ReferenceDataVersion, VisaType
+
+
+class ReferenceDataQueryCountTests(QueryCountAssertions, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('alice'))
+        self.usa = Country.objects.create(code='USA', name='United States')
+        self.canada = Country.objects.create(code='CAN', name='Canada')
+        self.add_visa_types(2)
+
+    def add_visa_types(self, count):
+        start = VisaType.objects.count()
+        for number in range(start, start + count):
+            visa_type = VisaType.objects.create(code=f'V{number}', name=f'Visa {number}', description='')
+            visa_type.countries.set([self.usa, self.canada])
+
+    def test_visa_type_list(self):
+        self.assertConstantQueries(2, '/api/visa-types/', grow=lambda: self.add_visa_types(20))
+
+    def test_visa_type_list_filtered_by_country(self):
+        self.assertConstantQueries(2, '/api/visa-types/', grow=lambda: self.add_visa_types(20),
+                                   data={'country': 'USA'})
+
+    def test_country_list(self):
+        def grow():
+            for n in range(20):
+                Country.objects.create(code=f'C{n}', name=f'Country {n}')
+        self.assertConstantQueries(1, '/api/countries/', grow=grow)
+
+    def test_language_list(self):
+        def grow():
+            for n in range(20):
+                Language.objects.create(code=f'l{n}', name=f'Language {n}')
+        self.assertConstantQueries(1, '/api/languages/', grow=grow)
+
+
+class ReferenceDataCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('alice'))
+        Country.objects.create(code='USA', name='United States')
+        Language.objects.create(code='es', name='Spanish')
+
+    def test_warm_hit_runs_no_queries(self):
+        self.client.get('/api/countries/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/countries/')
+        self.assertEqual(response.json(), [{'code': 'USA', 'name': 'United States'}])
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get('/api/languages/')['ETag']
+
+        response = self.client.get('/api/languages/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_model_changes_invalidate_cached_responses(self):
+        etag = self.client.get('/api/countries/')['ETag']
+        Country.objects.create(code='CAN', name='Canada')
+
+        response = self.client.get('/api/countries/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_visa_type_countries_change_invalidates_bootstrap(self):
+        visa_type = VisaType.objects.create(code='H1B', name='H-1B', description='')
+        self.assertEqual(self.client.get('/api/reference-data/').json()['visa_types'][0]['countries'], [])
+
+        visa_type.countries.add('USA')
+
+        data = self.client.get('/api/reference-data/').json()
+        self.assertEqual(set(data), {'countries', 'languages', 'visa_types'})
+        self.assertEqual(data['visa_types'][0]['countries'], [{'code': 'USA', 'name': 'United States'}])
+
+    def test_version_bumped_by_another_worker_is_seen(self):
+        etag = self.client.get('/api/countries/')['ETag']
+        # Another process changes the data: only the shared version row moves
+        Country.objects.bulk_create([Country(code='CAN', name='Canada')])
+        ReferenceDataVersion.objects.filter(name=refdata.VERSION_NAME).update(version='other-worker')
+
+        with override_settings(REFERENCE_DATA_VERSION_CHECK=0):
+            response = self.client.get('/api/countries/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_invalid_country_filter_is_rejected(self):
+        response = self.client.get('/api/visa-types/', {'country': 'x' * 50})
+
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(REFERENCE_DATA_LOCAL_PAYLOADS=2)
+    def test_local_payloads_are_bounded(self):
+        for code in ('USA', 'CAN', 'MEX', 'GBR'):
+            self.assertEqual(self.client.get('/api/visa-types/', {'country': code}).status_code, 200)
+
+        self.assertEqual(len(refdata._local_payloads), 2)
+
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CountryViewSet, LanguageViewSet, VisaTypeViewSet
+from .views import CountryViewSet, LanguageViewSet, VisaTypeViewSet, reference_data
 
 router = DefaultRouter()
 router.register(r'countries', CountryViewSet)
@@ -8,5 +8,6 @@ router.register(r'languages', LanguageViewSet)
 router.register(r'visa-types', VisaTypeViewSet)
 
 urlpatterns = [
+    path('reference-data/', reference_data, name='reference_data'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -1,25 +1,66 @@
-from rest_framework import viewsets
+import re
+
+from rest_framework import status, viewsets
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
 from .models import Country, Language, VisaType
+from .refdata import cached_json_response
 from .serializers import CountrySerializer, LanguageSerializer, VisaTypeSerializer
 
 
-class CountryViewSet(viewsets.ReadOnlyModelViewSet):
+class CachedListMixin:
+    """Serve list responses from the versioned reference-data cache"""
+
+    # Query parameters that change the list, with the pattern a value must
+    # match (so arbitrary input can't fill the cache); anything else is ignored
+    cache_params = {}
+
+    def list(self, request, *args, **kwargs):
+        for key, pattern in self.cache_params.items():
+            value = request.query_params.get(key)
+            if value and not pattern.fullmatch(value):
+                return Response({key: f'Invalid {key}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = '&'.join(f'{key}={request.query_params.get(key, "")}' for key in self.cache_params)
+        return cached_json_response(
+            request,
+            f'{self.basename}:list:{params}',
+            lambda: super(CachedListMixin, self).list(request, *args, **kwargs).data
+        )
+
+
+class CountryViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Country.objects.all().order_by('name')
     serializer_class = CountrySerializer
 
 
-class LanguageViewSet(viewsets.ReadOnlyModelViewSet):
+class LanguageViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Language.objects.all().order_by('name')
     serializer_class = LanguageSerializer
 
 
-class VisaTypeViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = VisaType.objects.all().order_by('name')
+class VisaTypeViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
+    # Countries are nested in the serializer: fetch them in one extra query
+    queryset = VisaType.objects.all().prefetch_related('countries').order_by('name')
     serializer_class = VisaTypeSerializer
+    cache_params = {'country': re.compile(r'[A-Za-z0-9]{1,3}')}  # Country.code
     
     def get_queryset(self):
-        queryset = VisaType.objects.all().order_by('name')
+        queryset = super().get_queryset()
         country_code = self.request.query_params.get('country')
         if country_code:
             queryset = queryset.filter(countries__code=country_code)
-        return queryset 
\ No newline at end of file
+        return queryset
+
+
+@api_view(['GET'])
+def reference_data(request):
+    """All countries, languages and visa types in a single response"""
+    def build():
+        return {
+            'countries': CountrySerializer(CountryViewSet.queryset.all(), many=True).data,
+            'languages': LanguageSerializer(LanguageViewSet.queryset.all(), many=True).data,
+            'visa_types': VisaTypeSerializer(VisaTypeViewSet.queryset.all(), many=True).data,
+        }
+
+    return cached_json_response(request, 'bootstrap', build)
@@ -0,0 +1,111 @@
+"""
+Load test: concurrency scaling of the async translate view.
+
+Starts the mock LLaMa server with a fixed latency, then fires N concurrent
+translation requests at
+
+- translate_async, all on one event loop (one ASGI worker), and
+- translate, on a thread pool the size of a sync gunicorn deployment,
+
+and reports wall time and throughput for each. Every request uses unique
+text, so each one reaches the (mock) LLM.
+
+    python -m benchmarks.async_scaling --latency 0.5 --levels 1,10,50,200 --sync-workers 4
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .harness import create_database, use_mock_llama  # sets up Django; import first
+
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.test import AsyncRequestFactory
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.translations.views import translate, translate_async
+from apps.visa_info.models import Language
+from services import llama_common
+
+from .mock_llama_server import MockLlamaApp, start_in_thread
+
+
+def seed():
+    Language.objects.create(code='en', name='English')
+    Language.objects.create(code='es', name='Spanish')
+    return User.objects.create_user('benchmark')
+
+
+def payload(run, number):
+    return {'text': f'Benchmark sentence {run} {number}', 'source_language': 'en', 'target_language': 'es'}
+
+
+async def run_async(user, run, count):
+    factory = AsyncRequestFactory()
+
+    async def one(number):
+        request = factory.post('/api/translations/translate/', json.dumps(payload(run, number)),
+                               content_type='application/json')
+        request.user = user
+        request._dont_enforce_csrf_checks = True
+        response = await translate_async(request)
+        assert response.status_code == 200, response.content
+
+    try:
+        await asyncio.gather(*(one(number) for number in range(count)))
+    finally:
+        await llama_common.close_async_client()
+
+
+def run_sync(user, run, count, workers):
+    factory = APIRequestFactory()
+
+    def one(number):
+        close_old_connections()
+        try:
+            request = factory.post('/api/translations/translate/', payload(run, number), format='json')
+            force_authenticate(request, user=user)
+            response = translate(request)
+            assert response.status_code == 200, response.data
+        finally:
+            close_old_connections()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(one, range(count)))
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--latency', type=float, default=0.5, help='Mock LLM latency in seconds')
+    parser.add_argument('--levels', default='1,10,50,200', help='Comma-separated concurrency levels')
+    parser.add_argument('--sync-workers', type=int, default=4,
+                        help='Threads in the sync baseline (gunicorn workers x threads)')
+    args = parser.parse_args()
+
+    base_url, server = start_in_thread(MockLlamaApp(latency=args.latency))
+    use_mock_llama(base_url)
+    user = create_database(seed)
+
+    print(f'mock latency {args.latency}s, sync baseline {args.sync_workers} workers')
+    print(f"{'requests':>8}  {'async s':>8}  {'async rps':>9}  {'sync s':>8}  {'sync rps':>8}")
+    try:
+        for run, count in enumerate(int(level) for level in args.levels.split(',')):
+            async_seconds = timed(lambda: asyncio.run(run_async(user, f'a{run}', count)))
+            sync_seconds = timed(run_sync, user, f's{run}', count, args.sync_workers)
+            print(f'{count:>8}  {async_seconds:>8.2f}  {count / async_seconds:>9.1f}  '
+                  f'{sync_seconds:>8.2f}  {count / sync_seconds:>8.1f}')
+    finally:
+        llama_common.close_session()
+        server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Load test: phase-1 translation of a long form, by chunk parallelism.
+
+Builds a synthetic form (default 36 pages), starts the mock LLaMa server
+with a fixed latency and runs the whole translation pipeline with 1, 2, 4
+and 8 concurrent calls. The form is cut into chunks of at most
+--chunk-tokens estimated tokens, so the chunk count - and how far the
+pipeline can spread the translation - depends on the budget.
+
+    python -m benchmarks.chunked_translation --pages 36 --latency 0.5 --levels 1,2,4,8
+"""
+import argparse
+import time
+import uuid
+
+from .harness import create_database, use_mock_llama  # sets up Django; import first
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from apps.documents.models import UploadedDocument, UploadJob
+from apps.documents.stages import translation_pipeline
+from services import llama_common
+from utils.chunking import chunk_form
+
+from .mock_llama_server import MockLlamaApp, start_in_thread
+
+
+def make_structure(pages, lines_per_page):
+    def span(text, size=10.0):
+        return {'text': text, 'bbox': [0, 0, 0, 0], 'font': 'Helvetica', 'size': size, 'flags': 0}
+
+    return [
+        {
+            'page_number': number,
+            'text_blocks': [span(f'Part {number}. Section heading', size=14.0)] + [
+                span(f'Question {number}.{line}: Please state the details requested in this section.')
+                for line in range(lines_per_page)
+            ],
+        }
+        for number in range(1, pages + 1)
+    ]
+
+
+def seed():
+    return User.objects.create_user('benchmark')
+
+
+def run(user, structure, workers):
+    job = UploadJob.objects.create(job_id=uuid.uuid4(), user=user, total_files=1)
+    document = UploadedDocument.objects.create(job=job, file_name='form.pdf', total_chunks=1)
+    started = time.perf_counter()
+    summary = translation_pipeline.run(
+        document,
+        params={'target_language': 'Spanish', 'title': 'Benchmark form'},
+        inputs={'structure': structure, 'detection': {'fields': [], 'residue': []}},
+        max_workers=workers,
+    )
+    assert summary['status'] == 'done', summary['errors']
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pages', type=int, default=36)
+    parser.add_argument('--lines', type=int, default=40, help='Lines of text per page')
+    parser.add_argument('--chunk-tokens', type=int, default=settings.TRANSLATION_CHUNK_TOKENS)
+    parser.add_argument('--latency', type=float, default=0.5, help='Mock LLM latency in seconds')
+    parser.add_argument('--levels', default='1,2,4,8', help='Comma-separated concurrent call limits')
+    args = parser.parse_args()
+
+    settings.TRANSLATION_CHUNK_TOKENS = args.chunk_tokens
+    structure = make_structure(args.pages, args.lines)
+    chunks = len(chunk_form(structure, budget=args.chunk_tokens))
+
+    base_url, server = start_in_thread(MockLlamaApp(latency=args.latency))
+    use_mock_llama(base_url)
+    user = create_database(seed)
+
+    print(f'{args.pages} pages, {chunks} chunks of <= {args.chunk_tokens} tokens, mock latency {args.latency}s')
+    print(f"{'workers':>7}  {'seconds':>8}  {'speedup':>7}")
+    try:
+        baseline = None
+        for workers in (int(level) for level in args.levels.split(',')):
+            seconds = run(user, structure, workers)
+            baseline = baseline or seconds
+            print(f'{workers:>7}  {seconds:>8.2f}  {baseline / seconds:>6.1f}x')
+    finally:
+        llama_common.close_session()
+        server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Shared setup for benchmarks: configures Django against a throwaway SQLite
+file database and points the LLaMa services at a mock server.
+
+Import this module before any app models.
+"""
+import os
+import tempfile
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'im_buddy.settings')
+os.environ.setdefault('DJANGO_SECRET_KEY', 'benchmark')
+os.environ.setdefault('LLAMA_API_KEY', 'benchmark')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from services import llama_service, prompt_service, tips_service  # noqa: E402
+
+
+def begin_immediate(sender, connection, **kwargs):
+    # SQLite fails (rather than waits) when two threads in deferred
+    # transactions both try to upgrade to a write lock, as update_or_create
+    # does; taking the write lock at BEGIN makes them queue instead, like
+    # row locks on a server database would
+    connection._start_transaction_under_autocommit = lambda: connection.cursor().execute('BEGIN IMMEDIATE')
+
+
+def create_database(seed):
+    """
+    Create and migrate a file database, so worker threads share it
+
+    Args:
+        seed (callable): Called once to create fixtures; its return value is
+            passed back
+    """
+    connection_created.connect(begin_immediate)
+    connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    result = seed()
+    # Requests run on other threads from here on; don't hold a connection open
+    connection.close()
+    return result
+
+
+def use_mock_llama(base_url):
+    """Send LLaMa API calls to base_url (the URLs are read at import time)"""
+    llama_service.LLAMA_TRANSLATE_URL = f'{base_url}/v1/translate'
+    tips_service.LLAMA_CHAT_URL = f'{base_url}/v1/chat/completions'
+    prompt_service.LLAMA_CHAT_URL = f'{base_url}/v1/chat/completions'
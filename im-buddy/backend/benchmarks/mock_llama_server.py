@@ -0,0 +1,204 @@
+"""
+Local stand-in for the LLaMa API, for load tests that must not spend quota.
+
+Serves /v1/translate and /v1/chat/completions. Response latency is drawn
+from a configurable distribution, a fraction of requests can fail, and chat
+completions requested with "stream": true are sent as server-sent events
+one token at a time. Handlers sleep with asyncio, so one server process can
+hold thousands of slow requests open and never becomes the bottleneck.
+
+Latency specs (seconds):
+    0.5                 fixed
+    uniform:0.2,0.8     uniform between the bounds
+    normal:0.5,0.1      mean, standard deviation (clipped at 0)
+    lognormal:0.5,0.4   median, sigma - long tail like real LLM latency
+
+Run standalone and point the backend at it:
+
+    python -m benchmarks.mock_llama_server --port 8099 --latency lognormal:0.5,0.4 --error-rate 0.01
+    LLAMA_API_BASE_URL=http://127.0.0.1:8099 python manage.py runserver
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import socket
+import threading
+import time
+
+import uvicorn
+
+MOCK_TIPS = (
+    "Documents: Bring your passport and two recent photos. "
+    "Forms: Answer every question and sign each page. "
+    "Common mistakes: Dates must use the format shown on the form."
+)
+
+
+def parse_latency(spec):
+    """
+    Parse a latency spec into a sampling function
+
+    Args:
+        spec (str or float): See the module docstring
+
+    Returns:
+        callable: rng -> latency in seconds
+    """
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+
+    kind, _, params = str(spec).partition(':')
+    if not params:
+        value = float(kind)
+        return lambda rng: value
+
+    args = [float(value) for value in params.split(',')]
+    if kind == 'uniform':
+        low, high = args
+        return lambda rng: rng.uniform(low, high)
+    if kind == 'normal':
+        mean, deviation = args
+        return lambda rng: max(0.0, rng.gauss(mean, deviation))
+    if kind == 'lognormal':
+        median, sigma = args
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency distribution: {kind}")
+
+
+class MockLlamaApp:
+    """
+    Minimal ASGI app mimicking the LLaMa endpoints we call
+
+    Args:
+        latency: Latency spec for the whole response (time to first token
+            when streaming)
+        error_rate (float): Fraction of requests answered with error_status
+        error_status (int): HTTP status of injected errors
+        token_delay (float): Seconds between streamed tokens
+        seed (int): Seed for latency and error sampling
+    """
+
+    def __init__(self, latency=0.5, error_rate=0.0, error_status=500, token_delay=0.02, seed=None):
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.token_delay = token_delay
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        self.requests += 1
+        await asyncio.sleep(self.sample_latency(self.rng))
+
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            await self._send_json(send, self.error_status, {'error': 'Injected mock error'})
+            return
+
+        payload = json.loads(body or b'{}')
+        if scope['path'] == '/v1/translate':
+            result = {'translated_text': self._translate(payload)}
+            await self._send_json(send, 200, result)
+        elif scope['path'] == '/v1/chat/completions':
+            if payload.get('stream'):
+                await self._stream_chat(send, MOCK_TIPS)
+            else:
+                await self._send_json(send, 200, {'choices': [{'message': {'content': MOCK_TIPS}}]})
+        else:
+            await self._send_json(send, 404, {'error': 'Not found'})
+
+    @staticmethod
+    def _translate(payload):
+        # Keep batch markers on their own lines so batched requests split back
+        lines = payload.get('text', '').split('\n')
+        target = payload.get('target_language')
+        return '\n'.join(line if line.startswith('<<<') or not line.strip() else f'[{target}] {line}'
+                         for line in lines)
+
+    @staticmethod
+    async def _send_json(send, status, result):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': json.dumps(result).encode()})
+
+    async def _stream_chat(self, send, content):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')],
+        })
+        for token in content.split(' '):
+            chunk = {'choices': [{'delta': {'content': token + ' '}}]}
+            await send({'type': 'http.response.body', 'body': f'data: {json.dumps(chunk)}\n\n'.encode(),
+                        'more_body': True})
+            await asyncio.sleep(self.token_delay)
+        await send({'type': 'http.response.body', 'body': b'data: [DONE]\n\n'})
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_in_thread(app, port=None):
+    """
+    Serve app on 127.0.0.1 from a daemon thread
+
+    Returns:
+        tuple: (base URL, uvicorn.Server) - set server.should_exit to stop it
+    """
+    port = port or free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f'http://127.0.0.1:{port}', server
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', default='0.5', help='Mock LLM latency spec, e.g. lognormal:0.5,0.4')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of mock LLM calls that fail')
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--token-delay', type=float, default=0.02, help='Seconds between streamed tokens')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def app_from_arguments(args):
+    return MockLlamaApp(latency=args.latency, error_rate=args.error_rate, error_status=args.error_status,
+                        token_delay=args.token_delay, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--port', type=int, default=8099)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    uvicorn.run(app_from_arguments(args), host='127.0.0.1', port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark: serial vs multi-process PDF extraction.
+
+Generates dense synthetic forms (many small spans per page) with 10, 50
+and 200 pages and times extract_pdf_structure with one worker, the
+automatic worker count, and every CPU. Also reports span memory per page
+for the dict and compact (SpanTable) representations.
+
+    python -m benchmarks.pdf_extraction --pages 10,50,200 --spans 400
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+from utils.pdf_extraction import choose_worker_count, extract_pdf_structure, iter_pdf_structure
+from utils.pdf_spans import dict_spans_nbytes
+
+
+def make_form(path, pages, spans_per_page):
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        for span in range(spans_per_page):
+            column, row = divmod(span, 80)
+            fontname = 'hebo' if span % 7 == 0 else 'helv'
+            page.insert_text((36 + column * 110, 30 + row * 10), f'Field {page_num}.{span}:',
+                             fontsize=7, fontname=fontname)
+    doc.save(path)
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pages', default='10,50,200', help='Comma-separated page counts')
+    parser.add_argument('--spans', type=int, default=400, help='Text spans per page')
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    directory = tempfile.mkdtemp()
+    print(f'{cpus} CPUs, {args.spans} spans per page')
+    print(f"{'pages':>6}  {'serial s':>9}  {'auto':>4}  {'auto s':>8}  {'speedup':>7}  "
+          f"{'all CPUs s':>10}  {'speedup':>7}")
+
+    for pages in (int(count) for count in args.pages.split(',')):
+        path = os.path.join(directory, f'form-{pages}.pdf')
+        make_form(path, pages, args.spans)
+
+        serial, expected = timed(extract_pdf_structure, path)
+        auto_workers = choose_worker_count(pages)
+        auto, result = timed(extract_pdf_structure, path, workers=None)
+        assert [page['text_blocks'] for page in result] == [page['text_blocks'] for page in expected]
+        everything, _ = timed(extract_pdf_structure, path, workers=cpus)
+
+        print(f'{pages:>6}  {serial:>9.2f}  {auto_workers:>4}  {auto:>8.2f}  {serial / auto:>7.2f}  '
+              f'{everything:>10.2f}  {serial / everything:>7.2f}')
+
+    page = next(iter_pdf_structure(path))
+    compact = next(iter_pdf_structure(path, compact=True))
+    dict_bytes = dict_spans_nbytes(page['text_blocks'])
+    print(f"span memory per page: dicts {dict_bytes / 1024:.1f} KiB, "
+          f"compact {compact['memory_bytes'] / 1024:.1f} KiB ({dict_bytes / compact['memory_bytes']:.1f}x smaller)")
+
+
+if __name__ == '__main__':
+    main()
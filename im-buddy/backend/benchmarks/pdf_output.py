@@ -0,0 +1,60 @@
+"""
+Benchmark: layout-preserving overlay vs the Markdown -> WeasyPrint rebuild.
+
+Translates every span of a synthetic form (the "translation" prefixes
+each span, so output is longer than input) and times overlay_translations
+against rendering the same text with markdown + WeasyPrint, as
+rebuild_via_markdown does after its LLM call. The LLM call itself is not
+included, so the rebuild time is a lower bound.
+
+    python -m benchmarks.pdf_output --pages 10 --spans 150
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from utils.pdf_extraction import extract_pdf_structure
+from utils.pdf_overlay import overlay_translations
+
+from .pdf_extraction import make_form
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--spans', type=int, default=150, help='Text spans per page')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'form.pdf')
+    make_form(path, args.pages, args.spans)
+    structure = extract_pdf_structure(path)
+    translations = {span['text'].strip(): f"Campo {span['text'].strip()}"
+                    for page in structure for span in page['text_blocks']}
+
+    started = time.perf_counter()
+    stats = overlay_translations(path, structure, translations, os.path.join(directory, 'overlay.pdf'), 'Spanish')
+    overlay = time.perf_counter() - started
+    print(f'overlay: {overlay:.2f}s ({overlay / args.pages * 1000:.0f} ms/page), {stats}')
+
+    try:
+        import markdown
+        from weasyprint import HTML
+    except (ImportError, OSError) as e:
+        print(f'WeasyPrint rebuild skipped: {e}')
+        return
+
+    text = '\n\n'.join(
+        '\n'.join(f"- {translations[span['text'].strip()]}" for span in page['text_blocks'])
+        for page in structure
+    )
+    started = time.perf_counter()
+    HTML(string=markdown.markdown(text)).write_pdf(os.path.join(directory, 'rebuild.pdf'))
+    rebuild = time.perf_counter() - started
+    print(f'markdown + WeasyPrint: {rebuild:.2f}s ({rebuild / args.pages * 1000:.0f} ms/page), '
+          f'{rebuild / overlay:.1f}x slower')
+
+
+if __name__ == '__main__':
+    main()
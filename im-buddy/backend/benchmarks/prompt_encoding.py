@@ -0,0 +1,121 @@
+"""
+Report: prompt tokens saved by each payload encoding.
+
+For every form in a corpus, detects its fields, builds the phase-1,
+phase-2 and input-extraction prompts with each encoding (see
+utils/prompt_encoding.py) and prints the estimated prompt tokens and the
+saving against the indented-JSON original. Pass a directory of PDFs, or
+run without one to use a generated corpus of printed and fillable forms.
+
+    python -m benchmarks.prompt_encoding [--corpus path/to/pdfs]
+"""
+import argparse
+import os
+import tempfile
+
+import fitz  # PyMuPDF
+
+from utils.field_detection import detect_fields
+from utils.pdf_extraction import extract_pdf_structure
+from utils.prompt_encoding import ENCODING_PRETTY, ENCODINGS
+from utils.prompts import ImmigrationFormPrompts
+from utils.tokens import estimate_tokens
+
+LABELS = ('Family Name', 'Given Names', 'Date of Birth', 'Place of Birth', 'Passport Number',
+          'Nationality', 'Home Address', 'Telephone Number', 'Email', 'Occupation')
+
+
+def make_printed_form(path, pages, fields_per_page):
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 50), f'Part {page_num + 1}. Applicant Details', fontsize=14)
+        for index in range(fields_per_page):
+            label = LABELS[index % len(LABELS)]
+            page.insert_text((50, 90 + index * 22), f'{label} ({index + 1}): ____________________', fontsize=10)
+    doc.save(path)
+
+
+def make_fillable_form(path, pages, fields_per_page):
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        for index in range(fields_per_page):
+            y = 90 + index * 22
+            page.insert_text((50, y), f'{LABELS[index % len(LABELS)]} ({index + 1})', fontsize=10)
+            widget = fitz.Widget()
+            widget.field_name = f'p{page_num + 1}_field_{index + 1}'
+            widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+            widget.rect = fitz.Rect(220, y - 10, 500, y + 4)
+            page.add_widget(widget)
+    doc.save(path)
+
+
+def generated_corpus(directory):
+    paths = []
+    for maker, pages, fields in ((make_printed_form, 2, 10), (make_printed_form, 12, 25),
+                                 (make_fillable_form, 3, 15), (make_fillable_form, 30, 20)):
+        path = os.path.join(directory, f'{maker.__name__[5:]}-{pages}p.pdf')
+        maker(path, pages, fields)
+        paths.append(path)
+    return paths
+
+
+def prompts(path, encoding):
+    structure = extract_pdf_structure(path)
+    fields = detect_fields(path, structure)['fields']
+    content = '\n'.join(span['text'] for page in structure for span in page['text_blocks'])
+    metadata = {'total_pages': len(structure), 'title': os.path.basename(path)}
+    filled = {field['field_id']: f'value {number}' for number, field in enumerate(fields) if number % 4}
+    user_inputs = {
+        'filled_fields': filled,
+        'empty_fields': [field['field_id'] for field in fields if field['field_id'] not in filled],
+        'completion_percentage': round(100 * len(filled) / max(len(fields), 1)),
+    }
+    return len(fields), {
+        'phase1': ImmigrationFormPrompts.phase1_translation_prompt(
+            content, fields, metadata, 'Spanish', encoding=encoding),
+        'phase2': ImmigrationFormPrompts.phase2_reverse_translation_prompt(
+            dict(metadata, fields=fields), user_inputs, 'Spanish', encoding=encoding),
+        'input_extraction': ImmigrationFormPrompts.user_input_extraction_prompt(
+            fields, content, 'Spanish', encoding=encoding),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', help='Directory of sample PDF forms (default: generated forms)')
+    args = parser.parse_args()
+
+    if args.corpus:
+        paths = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+                       if name.lower().endswith('.pdf'))
+    else:
+        paths = generated_corpus(tempfile.mkdtemp())
+
+    others = [encoding for encoding in ENCODINGS if encoding != ENCODING_PRETTY]
+    print(f"{'form':<24}  {'fields':>6}  {'phase':<16}  {ENCODING_PRETTY:>7}  "
+          + '  '.join(f'{encoding:>7}  {"saved":>6}' for encoding in others))
+    totals = {}
+    for path in paths:
+        by_encoding = {}
+        for encoding in ENCODINGS:
+            field_count, built = prompts(path, encoding)
+            by_encoding[encoding] = {phase: estimate_tokens(prompt) for phase, prompt in built.items()}
+        for phase, pretty in by_encoding[ENCODING_PRETTY].items():
+            columns = []
+            for encoding in ENCODINGS:
+                tokens = by_encoding[encoding][phase]
+                totals[encoding] = totals.get(encoding, 0) + tokens
+                if encoding != ENCODING_PRETTY:
+                    columns.append(f'{tokens:>7}  {1 - tokens / pretty:>6.0%}')
+            print(f'{os.path.basename(path)[:24]:<24}  {field_count:>6}  {phase:<16}  {pretty:>7}  '
+                  + '  '.join(columns))
+
+    pretty = totals[ENCODING_PRETTY]
+    print(f"{'total':<24}  {'':>6}  {'':<16}  {pretty:>7}  "
+          + '  '.join(f'{totals[encoding]:>7}  {1 - totals[encoding] / pretty:>6.0%}' for encoding in others))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Report: how much of each prompt repeats a prefix already sent.
+
+Provider-side prompt caching only helps when a request starts with the
+same bytes as an earlier one. This builds the prompts a sample of traffic
+would send - every generated form (see benchmarks.prompt_encoding) in
+several target languages, through each phase - in request order, and for
+each prompt measures the longest prefix it shares with any earlier prompt.
+The reuse ratio is the share of all prompt tokens inside such prefixes;
+large forms dominate it, so the median ratio per request is shown too.
+
+    python -m benchmarks.prompt_prefix --languages Spanish,French,Arabic,Chinese
+"""
+import argparse
+import os
+import tempfile
+from statistics import median
+
+from utils.field_detection import detect_fields
+from utils.pdf_extraction import extract_pdf_structure
+from utils.prompts import ImmigrationFormPrompts
+from utils.tokens import estimate_tokens
+
+from .prompt_encoding import generated_corpus
+
+
+def common_prefix_length(a, b):
+    # Binary search on slice equality; comparisons run in C
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def sample_requests(paths, languages):
+    """(phase, prompt) pairs in request order"""
+    for path in paths:
+        structure = extract_pdf_structure(path)
+        fields = detect_fields(path, structure)['fields']
+        content = '\n'.join(span['text'] for page in structure for span in page['text_blocks'])
+        metadata = {'total_pages': len(structure), 'title': os.path.basename(path)}
+        filled = {field['field_id']: f'value {number}' for number, field in enumerate(fields)}
+        yield 'language_detection', ImmigrationFormPrompts.language_detection_prompt(content[:2000])
+        yield 'field_residue', ImmigrationFormPrompts.field_residue_prompt(content[:500], fields[:5])
+        for language in languages:
+            yield 'glossary', ImmigrationFormPrompts.glossary_prompt(
+                [field['field_label'] for field in fields[:20]], language, 'English')
+            yield 'phase1', ImmigrationFormPrompts.phase1_translation_prompt(
+                content, fields, metadata, language, 'English')
+            yield 'quality_check', ImmigrationFormPrompts.translation_quality_check_prompt(
+                content[:1000], content[:1000], 'English', language)
+            yield 'input_extraction', ImmigrationFormPrompts.user_input_extraction_prompt(
+                fields, content, language)
+            yield 'phase2', ImmigrationFormPrompts.phase2_reverse_translation_prompt(
+                dict(metadata, fields=fields), {'filled_fields': filled}, language, 'Canada')
+
+
+def measure(requests):
+    """(reused tokens, total tokens) of each request, by phase"""
+    seen, results = {}, {}
+    for phase, prompt in requests:
+        earlier = seen.setdefault(phase, [])
+        shared = max((common_prefix_length(prompt, other) for other in earlier), default=0)
+        earlier.append(prompt)
+        results.setdefault(phase, []).append((estimate_tokens(prompt[:shared]), estimate_tokens(prompt)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--languages', default='Spanish,French,Arabic,Chinese')
+    args = parser.parse_args()
+
+    paths = generated_corpus(tempfile.mkdtemp())
+    results = measure(sample_requests(paths, args.languages.split(',')))
+
+    def row(name, requests):
+        reused = sum(reused for reused, _ in requests)
+        total = sum(total for _, total in requests)
+        per_request = median(reused / total for reused, total in requests)
+        print(f'{name:<18}  {len(requests):>8}  {total:>8}  {reused:>8}  {reused / total:>6.0%}  {per_request:>6.0%}')
+
+    print(f"{'phase':<18}  {'requests':>8}  {'tokens':>8}  {'reused':>8}  {'ratio':>6}  {'median':>6}")
+    for phase, requests in results.items():
+        row(phase, requests)
+    row('all', [request for requests in results.values() for request in requests])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""
+End-to-end load-test suite for the Django endpoints.
+
+Each scenario drives one endpoint through the full middleware/URL stack at
+a fixed concurrency, with the LLaMa API replaced by the local mock server,
+and reports p50/p95/p99 latency, throughput, errors and DB queries per
+request. Results are written as JSON; pass an earlier result file with
+--compare to flag regressions (exit status 1).
+
+Queries are counted on every connection, including the worker threads an
+endpoint fans out to (translate_batch), so queries_per_request is the
+scenario's total divided by its requests.
+
+    python -m benchmarks.suite --concurrency 8 --requests 200 --latency lognormal:0.3,0.4
+    python -m benchmarks.suite --compare benchmarks/results/baseline.json
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict
+
+from .harness import create_database, use_mock_llama  # sets up Django; import first
+
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+
+from apps.visa_info.models import Country, Language, VisaType
+from services import llama_common
+
+from . import mock_llama_server
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# Metric -> True if higher is better; compared against --tolerance
+COMPARED_METRICS = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'throughput_rps': True,
+    'queries_per_request': False,
+}
+
+
+@dataclass
+class Scenario:
+    """One endpoint under load; request(n) returns (method, path, kwargs) for the n-th call"""
+    name: str
+    request: Callable[[int], tuple]
+    settings: Dict = field(default_factory=dict)
+
+
+class QueryCounter:
+    """Counts queries run on any thread's connection"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+
+query_counter = QueryCounter()
+connection_created.connect(query_counter.install)
+
+
+def _json_post(path, payload):
+    return 'post', path, {'data': json.dumps(payload), 'content_type': 'application/json'}
+
+
+def _translate_batch(n):
+    # 20 items, a quarter of them repeated within the batch
+    items = [{'text': f'Batch {n} line {i % 15}'} for i in range(20)]
+    return _json_post('/api/translations/translate/batch/',
+                      {'items': items, 'source_language': 'en', 'target_language': 'es'})
+
+
+SCENARIOS = [
+    Scenario('translate', lambda n: _json_post(
+        '/api/translations/translate/',
+        {'text': f'Unique sentence number {n}.', 'source_language': 'en', 'target_language': 'es'})),
+    Scenario('translate_repeated', lambda n: _json_post(
+        '/api/translations/translate/',
+        {'text': f'Repeated sentence {n % 5}.', 'source_language': 'en', 'target_language': 'es'})),
+    Scenario('translate_batch', _translate_batch),
+    Scenario('tips', lambda n: ('get', '/api/tips/', {'data': {'visa_type': f'V{n % 20}', 'language': 'es'}}),
+             settings={'TIPS_GENERATE_ON_DEMAND': True}),
+    Scenario('reference_data', lambda n: ('get', '/api/reference-data/', {})),
+    Scenario('visa_types', lambda n: ('get', '/api/visa-types/', {'data': {'country': 'C1'}})),
+]
+
+
+def seed():
+    Language.objects.create(code='en', name='English')
+    Language.objects.create(code='es', name='Spanish')
+    countries = [Country.objects.create(code=f'C{n}', name=f'Country {n}') for n in range(10)]
+    for n in range(20):
+        visa_type = VisaType.objects.create(code=f'V{n}', name=f'Visa {n}', description='Benchmark visa')
+        visa_type.countries.set(countries[:n % 10 + 1])
+
+    client = Client()
+    client.force_login(User.objects.create_user('benchmark'))
+    return client.cookies
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(scenario, cookies, total, concurrency):
+    """
+    Returns:
+        dict: Latency percentiles (ms), throughput, errors and queries per request
+    """
+    counter = itertools.count()
+    local = threading.local()
+    latencies, statuses = [], []
+    lock = threading.Lock()
+
+    def one(_):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            local.client.cookies = cookies
+        method, path, kwargs = scenario.request(next(counter))
+
+        close_old_connections()
+        started = time.perf_counter()
+        response = getattr(local.client, method)(path, **kwargs)
+        elapsed = time.perf_counter() - started
+        close_old_connections()
+
+        with lock:
+            latencies.append(elapsed)
+            statuses.append(response.status_code)
+
+    for connection in connections.all(initialized_only=True):
+        query_counter.install(connection)
+    with override_settings(**scenario.settings):
+        query_counter.reset()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(total)))
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'throughput_rps': total / wall,
+        'errors': sum(status >= 400 for status in statuses),
+        'queries_per_request': query_counter.count / total,
+        'statuses': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+    }
+
+
+def compare(results, baseline, tolerance, noise_ms):
+    """
+    Latency changes smaller than noise_ms are ignored, so millisecond-scale
+    endpoints don't flag regressions on scheduler jitter.
+
+    Returns:
+        list: (scenario, metric, baseline value, new value) for each regression
+    """
+    regressions = []
+    for name, metrics in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous[metric], metrics[metric]
+            if higher_is_better:
+                regressed = new < old * (1 - tolerance)
+            else:
+                floor = noise_ms if metric.endswith('_ms') else 1e-9
+                regressed = new > old * (1 + tolerance) and new - old > floor
+            if regressed:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scenarios', default=','.join(scenario.name for scenario in SCENARIOS),
+                        help='Comma-separated scenario names')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='Earlier result file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Allowed relative change before a metric counts as a regression')
+    parser.add_argument('--noise-ms', type=float, default=50.0,
+                        help='Latency increases below this many ms never count as regressions')
+    mock_llama_server.add_arguments(parser)
+    args = parser.parse_args()
+
+    selected = args.scenarios.split(',')
+    unknown = set(selected) - {scenario.name for scenario in SCENARIOS}
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    mock = mock_llama_server.app_from_arguments(args)
+    base_url, server = mock_llama_server.start_in_thread(mock)
+    use_mock_llama(base_url)
+    cookies = create_database(seed)
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'latency': args.latency,
+            'error_rate': args.error_rate,
+        },
+        'scenarios': {},
+    }
+
+    print(f"{'scenario':<20} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'errors':>6} {'queries':>7}")
+    try:
+        for scenario in SCENARIOS:
+            if scenario.name not in selected:
+                continue
+            metrics = run_scenario(scenario, cookies, args.requests, args.concurrency)
+            results['scenarios'][scenario.name] = metrics
+            print(f"{scenario.name:<20} {metrics['p50_ms']:>8.1f} {metrics['p95_ms']:>8.1f} "
+                  f"{metrics['p99_ms']:>8.1f} {metrics['throughput_rps']:>8.1f} {metrics['errors']:>6} "
+                  f"{metrics['queries_per_request']:>7.1f}")
+    finally:
+        llama_common.close_session()
+        server.should_exit = True
+    results['meta']['mock_llm_calls'] = mock.requests
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.noise_ms)
+        for name, metric, old, new in regressions:
+            print(f'REGRESSION {name}.{metric}: {old:.2f} -> {new:.2f}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {args.compare} (tolerance {args.tolerance:.0%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""
+ASGI config for im_buddy project.
+
+Serve with an ASGI worker and ASYNC_LLM_VIEWS=True so LLM-bound views run
+as coroutines, e.g.:
+
+    gunicorn im_buddy.asgi:application -k uvicorn.workers.UvicornWorker
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'im_buddy.settings')
+
+application = get_asgi_application()
@@ -0,0 +1,77 @@
+"""
+Helpers for native async (ASGI) views.
+
+DRF 3.14 views are synchronous, so async views are plain Django views
+wrapped by async_api_view, which reproduces the DRF behaviour they rely
+on: method checks, the configured authentication classes (including
+SessionAuthentication's CSRF check), IsAuthenticated, and request body
+parsing into request.data.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+def _not_authenticated(drf_request):
+    # Same status/header choice as APIView.permission_denied()
+    error = exceptions.NotAuthenticated()
+    authenticators = drf_request.authenticators
+    header = authenticators[0].authenticate_header(drf_request) if authenticators else None
+
+    response = JsonResponse({'detail': str(error.detail)}, status=401 if header else 403)
+    if header:
+        response['WWW-Authenticate'] = header
+    return response
+
+
+def _authenticate_and_parse(request):
+    """
+    Returns:
+        tuple: (user, data, None) or (None, None, error response)
+    """
+    drf_request = Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    try:
+        user = drf_request.user
+        if not (user and user.is_authenticated):
+            return None, None, _not_authenticated(drf_request)
+        data = drf_request.data if request.method in ('POST', 'PUT', 'PATCH') else {}
+    except exceptions.APIException as e:
+        return None, None, JsonResponse({'detail': str(e.detail)}, status=e.status_code)
+    return user, data, None
+
+
+def async_api_view(http_method_names):
+    """
+    Decorator for async views that need DRF-style authentication
+
+    The wrapped view receives request.user and request.data, and must
+    return a Django HttpResponse (e.g. JsonResponse).
+    """
+    allowed = [method.upper() for method in http_method_names]
+
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in allowed:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+            user, data, error_response = await sync_to_async(_authenticate_and_parse)(request)
+            if error_response is not None:
+                return error_response
+
+            request.user, request.data = user, data
+            return await view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,6 +1,10 @@
 import os
 from pathlib import Path
-from decouple import config, Csv
+from decouple import Choices, config, Csv
+
+from utils.prompt_config import PromptConfig
+from utils.prompt_encoding import ENCODINGS
+from utils.tracing import EXPORTERS as TRACE_EXPORTERS
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -28,9 +32,12 @@ INSTALLED_APPS = [
     'apps.visa_info',
     'apps.translations',
     'apps.tips',
+    'apps.documents',
+    'apps.metrics',
 ]
 
 MIDDLEWARE = [
+    'im_buddy.tracing.TracingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -66,6 +73,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the in-memory default, which raises "table is
+        # locked" instead of waiting when tests write from worker threads
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -98,13 +108,21 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Frontend origins that call the API with the session cookie
+FRONTEND_ORIGINS = config(
+    'FRONTEND_ORIGINS', default='http://localhost:5173,http://localhost:3000', cast=Csv()  # Vite default port first
+)
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = DEBUG  # Only in development
+CORS_ALLOW_CREDENTIALS = True  # session cookie on uploads from the frontend
+CORS_EXPOSE_HEADERS = ['X-Request-ID', 'traceresponse']
 if not DEBUG:
-    CORS_ALLOWED_ORIGINS = [
-        "http://localhost:5173",  # Vite default port
-        "http://localhost:3000",
-    ]
+    CORS_ALLOWED_ORIGINS = FRONTEND_ORIGINS
+
+# Session-authenticated POSTs from the frontend send its Origin and the
+# csrftoken cookie as X-CSRFToken; the CSRF check must trust that origin
+CSRF_TRUSTED_ORIGINS = FRONTEND_ORIGINS
 
 # REST Framework settings
 REST_FRAMEWORK = {
@@ -115,4 +133,119 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
-} 
\ No newline at end of file
+}
+
+# Translation memory
+TRANSLATION_MEMORY_VERSION = config('TRANSLATION_MEMORY_VERSION', default='1')
+TRANSLATION_MEMORY_TTL = config('TRANSLATION_MEMORY_TTL', default=60 * 60 * 24 * 30, cast=int)  # seconds
+TRANSLATION_MEMORY_LRU_SIZE = config('TRANSLATION_MEMORY_LRU_SIZE', default=10000, cast=int)
+
+# Segment-level reuse of near-duplicate translations (MinHash similarity)
+TRANSLATION_FUZZY_THRESHOLD = config('TRANSLATION_FUZZY_THRESHOLD', default=0.9, cast=float)
+TRANSLATION_FUZZY_MAX_LENGTH = config('TRANSLATION_FUZZY_MAX_LENGTH', default=500, cast=int)
+TRANSLATION_FUZZY_WARM_LIMIT = config('TRANSLATION_FUZZY_WARM_LIMIT', default=5000, cast=int)
+TRANSLATION_FUZZY_INDEX_SIZE = config('TRANSLATION_FUZZY_INDEX_SIZE', default=50000, cast=int)
+
+# Batch translation endpoint
+TRANSLATION_BATCH_MAX_ITEMS = config('TRANSLATION_BATCH_MAX_ITEMS', default=200, cast=int)
+TRANSLATION_BATCH_CONCURRENCY = config('TRANSLATION_BATCH_CONCURRENCY', default=8, cast=int)
+
+# On-demand tip generation (single-flight across workers)
+TIP_GENERATION_WAIT_TIMEOUT = config('TIP_GENERATION_WAIT_TIMEOUT', default=30, cast=float)  # seconds
+TIP_GENERATION_POLL_INTERVAL = config('TIP_GENERATION_POLL_INTERVAL', default=0.25, cast=float)
+TIP_GENERATION_STALE_AFTER = config('TIP_GENERATION_STALE_AFTER', default=120, cast=int)
+
+# Tip pregeneration (manage.py pregenerate_tips)
+TIPS_GENERATE_ON_DEMAND = config('TIPS_GENERATE_ON_DEMAND', default=False, cast=bool)
+TIP_MAX_AGE_DAYS = config('TIP_MAX_AGE_DAYS', default=30, cast=int)
+TIP_PREGENERATION_CONCURRENCY = config('TIP_PREGENERATION_CONCURRENCY', default=4, cast=int)
+TIP_PREGENERATION_RATE = config('TIP_PREGENERATION_RATE', default=1.0, cast=float)  # LLM calls per second
+
+# Cache (use a shared backend such as Redis when running several workers,
+# so they share cached payloads instead of each building its own)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='im-buddy'),
+    }
+}
+
+# Reference data (countries, languages, visa types)
+REFERENCE_DATA_CACHE_TIMEOUT = config('REFERENCE_DATA_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)  # seconds
+REFERENCE_DATA_MAX_AGE = config('REFERENCE_DATA_MAX_AGE', default=300, cast=int)  # client Cache-Control
+REFERENCE_DATA_VERSION_CHECK = config('REFERENCE_DATA_VERSION_CHECK', default=5, cast=float)  # seconds
+REFERENCE_DATA_LOCAL_PAYLOADS = config('REFERENCE_DATA_LOCAL_PAYLOADS', default=256, cast=int)  # per process
+
+# Prompt payload encoding per phase: pretty, compact or table (see
+# utils/prompt_encoding.py); an unknown one stops startup here
+PROMPT_ENCODINGS = {
+    phase: config(f'PROMPT_ENCODING_{phase.upper()}', default=encoding, cast=Choices(ENCODINGS))
+    for phase, encoding in PromptConfig.PAYLOAD_ENCODINGS.items()
+}
+
+# Parsed PDF cache (utils/pdf_cache.py), shared by workers on the same host
+PDF_CACHE_DIR = config('PDF_CACHE_DIR', default='/var/lib/im-buddy/pdf-cache')
+PDF_CACHE_MAX_BYTES = config('PDF_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)
+
+# WeasyPrint render pool (utils/pdf_render.py): worker processes, renders
+# queued or running before submissions wait, and timeouts in seconds
+PDF_RENDER_WORKERS = config('PDF_RENDER_WORKERS', default=2, cast=int)
+PDF_RENDER_MAX_PENDING = config('PDF_RENDER_MAX_PENDING', default=16, cast=int)
+PDF_RENDER_QUEUE_TIMEOUT = config('PDF_RENDER_QUEUE_TIMEOUT', default=5.0, cast=float)
+PDF_RENDER_TIMEOUT = config('PDF_RENDER_TIMEOUT', default=60.0, cast=float)
+
+# Chunked document uploads (apps.documents)
+UPLOAD_DIR = config('UPLOAD_DIR', default=os.path.join(BASE_DIR, 'media', 'uploads'))
+UPLOAD_MAX_CHUNK_BYTES = config('UPLOAD_MAX_CHUNK_BYTES', default=8 * 1024 * 1024, cast=int)  # decompressed
+UPLOAD_MAX_CHUNKS = config('UPLOAD_MAX_CHUNKS', default=200, cast=int)
+UPLOAD_MAX_JOB_BYTES = config('UPLOAD_MAX_JOB_BYTES', default=200 * 1024 * 1024, cast=int)  # all files of a job
+UPLOAD_PARTS_MAX_AGE = config('UPLOAD_PARTS_MAX_AGE', default=60 * 60 * 24, cast=int)  # seconds without a chunk
+UPLOAD_PARSE_TIMEOUT = config('UPLOAD_PARSE_TIMEOUT', default=600, cast=int)  # seconds before a parse is retried
+DOCUMENT_BACKGROUND_WORKERS = config('DOCUMENT_BACKGROUND_WORKERS', default=2, cast=int)  # parse + pipelines
+
+# Document translation pipeline: concurrent stage calls within one document
+PIPELINE_CONCURRENCY = config('PIPELINE_CONCURRENCY', default=4, cast=int)
+# Estimated source tokens per phase-1 translation call; keep it at about half
+# the phase-1 max_tokens so the translated chunk fits in the reply
+TRANSLATION_CHUNK_TOKENS = config('TRANSLATION_CHUNK_TOKENS', default=4000, cast=int)
+# A document translating with no stage activity for this long lost its worker
+# (e.g. in a restart) and may be translated again
+TRANSLATION_STALE_AFTER = config('TRANSLATION_STALE_AFTER', default=15 * 60, cast=int)  # seconds
+
+# Upload job status events (GET /api/upload/<jobId>/events)
+JOB_EVENTS_TTL = config('JOB_EVENTS_TTL', default=60 * 60, cast=int)  # seconds a status response is cached
+JOB_EVENTS_POLL_INTERVAL = config('JOB_EVENTS_POLL_INTERVAL', default=0.5, cast=float)  # cross-worker
+JOB_EVENTS_HEARTBEAT = config('JOB_EVENTS_HEARTBEAT', default=15, cast=float)
+JOB_EVENTS_MAX_DURATION = config('JOB_EVENTS_MAX_DURATION', default=300, cast=float)
+
+# Route LLM-bound endpoints (translate, tips) to their async views; enable
+# when serving through im_buddy.asgi with an ASGI worker
+ASYNC_LLM_VIEWS = config('ASYNC_LLM_VIEWS', default=False, cast=bool)
+
+# Request tracing (utils/tracing.py, im_buddy/tracing.py): fraction of new
+# traces recorded (0-1) and where spans go; spans from the console exporter
+# and other app logs carry the request ID
+TRACE_SAMPLE_RATE = config('TRACE_SAMPLE_RATE', default=0.0, cast=float)
+TRACE_EXPORTER = config('TRACE_EXPORTER', default='console', cast=Choices(TRACE_EXPORTERS))
+TRACE_FILE = config('TRACE_FILE', default='traces.jsonl')
+TRACE_SERVICE_NAME = config('TRACE_SERVICE_NAME', default='im-buddy')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'utils.tracing.RequestIdFilter'},
+    },
+    'formatters': {
+        'request': {'format': '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'filters': ['request_id'],
+            'formatter': 'request',
+        },
+    },
+    'loggers': {
+        'im_buddy': {'handlers': ['console'], 'level': config('LOG_LEVEL', default='INFO'), 'propagate': False},
+    },
+}
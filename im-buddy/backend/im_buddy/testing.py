@@ -0,0 +1,32 @@
+"""
+Shared helpers for the apps' test suites
+"""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountAssertions:
+    """
+    Mixin for TestCase classes that guards endpoints against N+1 queries
+    """
+
+    def count_queries(self, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 300, response.content)
+        return len(queries), response
+
+    def assertConstantQueries(self, expected, url, grow, method='get', **kwargs):
+        """
+        Assert that an endpoint runs `expected` queries, both before and
+        after `grow()` adds more rows to its result
+        """
+        before, first = self.count_queries(method, url, **kwargs)
+        grow()
+        after, second = self.count_queries(method, url, **kwargs)
+
+        self.assertNotEqual(first.content, second.content, "grow() did not change the response")
+        self.assertEqual(
+            (before, after), (expected, expected),
+            f"{url} ran {before} queries, then {after} after growing the result (expected {expected})"
+        )
@@ -0,0 +1,124 @@
+"""
+Request tracing: a root span per HTTP request, and a span per DB query.
+
+TracingMiddleware starts the trace (see utils/tracing.py) before the rest
+of the middleware runs, continuing the caller's trace if the request has
+a W3C traceparent header. The span is named after the matched URL route
+("POST upload/<uuid:job_id>/translate"), so DRF and async views are
+grouped by endpoint rather than by URL.
+
+Every request gets a request ID: the client's X-Request-ID if it sent a
+usable one, otherwise the trace ID. It is returned in the X-Request-ID
+response header with the trace's traceresponse header, carried by every
+span of the trace (including background work the request submits), and
+added to log records by utils.tracing.RequestIdFilter.
+
+Database queries on any connection run under a db.query span while a
+sampled trace is active; outside one the wrapper is a single lookup.
+"""
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from utils.tracing import STATUS_ERROR, current_span, start_span
+
+REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+# Longest SQL statement recorded on a db.query span
+DB_STATEMENT_MAX_CHARS = 1000
+
+
+def _query_span(execute, sql, params, many, context):
+    span = current_span()
+    if span is None or not span.sampled:
+        return execute(sql, params, many, context)
+
+    connection = context["connection"]
+    attributes = {
+        "db.system": connection.vendor,
+        "db.name": connection.alias,
+        "db.statement": sql[:DB_STATEMENT_MAX_CHARS],
+    }
+    if many:
+        attributes["db.executemany"] = True
+    with start_span("db.query", attributes):
+        return execute(sql, params, many, context)
+
+
+def install_query_spans(connection, **kwargs):
+    """Add the db.query span wrapper to a connection (once)"""
+    if _query_span not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_span)
+
+
+connection_created.connect(install_query_spans)
+
+
+class TracingMiddleware:
+    """
+    Runs each request in a trace; place it first in MIDDLEWARE so the
+    other middleware is timed too
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self._start(request) as span:
+            response = self.get_response(request)
+            return self._finish(request, response, span)
+
+    async def __acall__(self, request):
+        with self._start(request) as span:
+            response = await self.get_response(request)
+            return self._finish(request, response, span)
+
+    def _start(self, request):
+        # Connections opened before the signal was connected (or reused
+        # across requests) get the query wrapper here
+        for connection in connections.all(initialized_only=True):
+            install_query_spans(connection)
+
+        incoming = request.headers.get("X-Request-ID", "")
+        return start_span(
+            f"{request.method} {request.path}",
+            {"http.method": request.method, "http.target": request.get_full_path()},
+            traceparent=request.headers.get("traceparent"),
+            request_id=incoming if REQUEST_ID.match(incoming) else None,
+        )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        span = current_span()
+        match = request.resolver_match
+        if span is None or match is None:
+            return None
+        route = match.route or request.path
+        span.name = f"{request.method} {route}"
+        span.set_attributes({
+            "http.route": route,
+            "code.function": match.view_name or getattr(view_func, "__qualname__", repr(view_func)),
+        })
+        return None
+
+    def process_exception(self, request, exception):
+        span = current_span()
+        if span is not None:
+            span.record_exception(exception)
+        return None
+
+    def _finish(self, request, response, span):
+        span.set_attributes({"http.status_code": response.status_code, "http.request_id": span.request_id})
+        if response.status_code >= 500:
+            span.status = STATUS_ERROR
+        response["X-Request-ID"] = span.request_id
+        response["traceresponse"] = span.traceparent
+        return response
@@ -1,45 +1,298 @@
+import asyncio
 import os
+import threading
+import weakref
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from dotenv import load_dotenv
 
+from utils.tracing import start_span
+
 # Load environment variables
 load_dotenv()
 
 # Get API key from environment
 LLAMA_API_KEY = os.getenv("LLAMA_API_KEY")
 
+# Base URL of the LLaMa API; point it at benchmarks/mock_llama_server.py to
+# load-test without spending quota
+LLAMA_API_BASE_URL = os.getenv("LLAMA_API_BASE_URL", "https://api.llama.com").rstrip("/")
+
+# Connection pool settings. One pool is kept per process, so size it to the
+# number of threads a single gunicorn worker runs concurrently.
+LLAMA_POOL_CONNECTIONS = int(os.getenv("LLAMA_POOL_CONNECTIONS", "4"))
+LLAMA_POOL_MAXSIZE = int(os.getenv("LLAMA_POOL_MAXSIZE", os.getenv("GUNICORN_THREADS", "10")))
+
+# Timeouts in seconds: (connect, read)
+LLAMA_CONNECT_TIMEOUT = float(os.getenv("LLAMA_CONNECT_TIMEOUT", "5"))
+LLAMA_READ_TIMEOUT = float(os.getenv("LLAMA_READ_TIMEOUT", "60"))
+
+# Async client limits. One event loop serves every in-flight request of an
+# ASGI worker, so this is sized for hundreds of concurrent LLM calls.
+LLAMA_ASYNC_MAX_CONNECTIONS = int(os.getenv("LLAMA_ASYNC_MAX_CONNECTIONS", "200"))
+LLAMA_ASYNC_MAX_KEEPALIVE = int(os.getenv("LLAMA_ASYNC_MAX_KEEPALIVE", "50"))
+
+
+class PoolStats:
+    """
+    Thread-safe counters for connection reuse in the shared session.
+
+    A request that had to open a new connection counts as a miss; every
+    other request was served from a kept-alive pooled connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_new_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self):
+        with self._lock:
+            requests_made = self.requests
+            misses = min(self.new_connections, requests_made)
+        hits = requests_made - misses
+        return {
+            "requests": requests_made,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / requests_made if requests_made else 0.0,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.new_connections = 0
+
+
+pool_stats = PoolStats()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        pool_stats.record_new_connection()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        pool_stats.record_new_connection()
+        return super()._new_conn()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report new connections to pool_stats"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+# One httpx client per event loop; an entry goes away with its loop
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+
 def get_headers():
     """
     Get common headers for LLaMa API requests
-    
+
     Returns:
         dict: Headers with auth and content-type
     """
     if not LLAMA_API_KEY:
         raise ValueError("LLAMA_API_KEY environment variable not set")
-        
+
     return {
         "Authorization": f"Bearer {LLAMA_API_KEY}",
         "Content-Type": "application/json"
     }
-    
-def make_api_request(url, data):
+
+
+def get_session():
+    """
+    Get the shared keep-alive session for LLaMa API requests
+
+    The session is created lazily once per process (and recreated after a
+    fork, so gunicorn workers never share sockets with the master).
+
+    Returns:
+        requests.Session: Session with pooled connections and auth headers
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            session = requests.Session()
+            session.headers.update(get_headers())
+            adapter = PooledHTTPAdapter(
+                pool_connections=LLAMA_POOL_CONNECTIONS,
+                pool_maxsize=LLAMA_POOL_MAXSIZE,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+            _session_pid = pid
+    return _session
+
+
+def close_session():
+    """
+    Close the shared session and release its pooled connections
+    """
+    global _session, _session_pid
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pid = None
+
+
+def get_pool_stats():
+    """
+    Get connection pool hit/miss counters for this process
+
+    Returns:
+        dict: requests, hits, misses and hit_ratio
+    """
+    return pool_stats.snapshot()
+
+
+def _span_attributes(url, data):
+    return {"http.url": url, "llm.model": data.get("model"), "llm.max_tokens": data.get("max_tokens")}
+
+
+def make_api_request(url, data, timeout=None):
     """
     Make a request to the LLaMa API
-    
+
     Args:
         url (str): API endpoint URL
         data (dict): Request payload
-        
+        timeout (tuple): Optional (connect, read) timeout override in seconds
+
     Returns:
         dict: API response as JSON
-        
+
     Raises:
-        requests.exceptions.RequestException: If API call fails
-    """
-    headers = get_headers()
-    
-    response = requests.post(url, headers=headers, json=data)
-    response.raise_for_status()
-    
-    return response.json() 
\ No newline at end of file
+        requests.exceptions.RequestException: If API call fails or times out
+    """
+    session = get_session()
+
+    pool_stats.record_request()
+    with start_span("llm.request", _span_attributes(url, data)) as span:
+        response = session.post(
+            url,
+            json=data,
+            headers={"traceparent": span.traceparent},
+            timeout=timeout or (LLAMA_CONNECT_TIMEOUT, LLAMA_READ_TIMEOUT),
+        )
+        span.set_attribute("http.status_code", response.status_code)
+        response.raise_for_status()
+
+        return response.json()
+
+
+def get_async_client():
+    """
+    Get the shared async client for LLaMa API requests
+
+    httpx clients are bound to the event loop they were first used on, so
+    one client is kept per running loop (in practice, one per ASGI worker).
+    Loops running at the same time (e.g. async_to_sync threads) each keep
+    their own client instead of replacing, and orphaning, another's.
+
+    Returns:
+        httpx.AsyncClient: Client with pooled connections and auth headers
+    """
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        client = _async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                headers=get_headers(),
+                limits=httpx.Limits(
+                    max_connections=LLAMA_ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLAMA_ASYNC_MAX_KEEPALIVE,
+                ),
+                timeout=httpx.Timeout(LLAMA_READ_TIMEOUT, connect=LLAMA_CONNECT_TIMEOUT),
+            )
+            _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """
+    Close the running loop's async client and release its pooled connections
+    """
+    with _async_clients_lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def amake_api_request(url, data, timeout=None):
+    """
+    Make a request to the LLaMa API without blocking the event loop
+
+    httpx errors are re-raised as the matching requests exceptions, so
+    callers handle failures the same way for both clients.
+
+    Args:
+        url (str): API endpoint URL
+        data (dict): Request payload
+        timeout (tuple): Optional (connect, read) timeout override in seconds
+
+    Returns:
+        dict: API response as JSON
+
+    Raises:
+        requests.exceptions.RequestException: If API call fails or times out
+    """
+    client = get_async_client()
+    request_timeout = httpx.USE_CLIENT_DEFAULT
+    if timeout:
+        request_timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+
+    with start_span("llm.request", _span_attributes(url, data)) as span:
+        try:
+            response = await client.post(
+                url, json=data, headers={"traceparent": span.traceparent}, timeout=request_timeout
+            )
+            span.set_attribute("http.status_code", response.status_code)
+            response.raise_for_status()
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.HTTPStatusError as e:
+            raise requests.exceptions.HTTPError(str(e)) from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+        try:
+            return response.json()
+        except ValueError as e:
+            # What requests raises for a body that isn't JSON
+            raise requests.exceptions.JSONDecodeError(
+                getattr(e, "msg", str(e)), getattr(e, "doc", ""), getattr(e, "pos", 0)
+            ) from e
@@ -1,30 +1,136 @@
+import asyncio
+import re
 import requests
-from .llama_common import make_api_request
+from .llama_common import LLAMA_API_BASE_URL, amake_api_request, make_api_request
 
 # API endpoint URL
-LLAMA_TRANSLATE_URL = "https://api.llama.com/v1/translate"
+LLAMA_TRANSLATE_URL = f"{LLAMA_API_BASE_URL}/v1/translate"
 
-def translate_text(text, source_language, target_language):
+# Marker line placed before each segment of a batched translation request
+SEGMENT_MARKER = "<<<{}>>>"
+SEGMENT_MARKER_PATTERN = re.compile(r"^[ \t]*<<<(\d+)>>>[ \t]*$", re.MULTILINE)
+
+def request_translation(text, source_language, target_language):
     """
-    Translate text using the LLaMa API
-    
+    Translate text using the LLaMa API, raising on failure
+
     Args:
         text (str): Text to translate
         source_language (str): Source language code
         target_language (str): Target language code
-        
+
     Returns:
         str: Translated text
+
+    Raises:
+        requests.exceptions.RequestException: If API call fails
     """
     data = {
         "text": text,
         "source_language": source_language,
         "target_language": target_language
     }
-    
+
+    result = make_api_request(LLAMA_TRANSLATE_URL, data)
+    return result.get("translated_text", "")
+
+async def arequest_translation(text, source_language, target_language):
+    """
+    Async version of request_translation
+
+    Raises:
+        requests.exceptions.RequestException: If API call fails
+    """
+    data = {
+        "text": text,
+        "source_language": source_language,
+        "target_language": target_language
+    }
+
+    result = await amake_api_request(LLAMA_TRANSLATE_URL, data)
+    return result.get("translated_text", "")
+
+def _batch_text(texts):
+    return "\n".join(
+        f"{SEGMENT_MARKER.format(number)}\n{text}"
+        for number, text in enumerate(texts, start=1)
+    )
+
+def _split_batch(translated, count):
+    # parts = [preamble, "1", text1, "2", text2, ...]
+    parts = SEGMENT_MARKER_PATTERN.split(translated)
+    numbers = [int(number) for number in parts[1::2]]
+    if numbers == list(range(1, count + 1)):
+        return [text.strip("\n") for text in parts[2::2]]
+
+    print(f"Batch translation markers lost ({len(numbers)}/{count}), translating segments one by one")
+    return None
+
+def request_batch_translation(texts, source_language, target_language):
+    """
+    Translate several segments with a single LLaMa API call
+
+    Segments are sent as one text, each preceded by a numbered marker line.
+    If the markers do not survive translation intact, each segment is
+    translated on its own instead.
+
+    Args:
+        texts (list): Segments to translate
+        source_language (str): Source language code
+        target_language (str): Target language code
+
+    Returns:
+        list: Translated segments, in input order
+
+    Raises:
+        requests.exceptions.RequestException: If API call fails
+    """
+    if not texts:
+        return []
+    if len(texts) == 1:
+        return [request_translation(texts[0], source_language, target_language)]
+
+    translated = request_translation(_batch_text(texts), source_language, target_language)
+    segments = _split_batch(translated, len(texts))
+    if segments is not None:
+        return segments
+    return [request_translation(text, source_language, target_language) for text in texts]
+
+async def arequest_batch_translation(texts, source_language, target_language):
+    """
+    Async version of request_batch_translation; the per-segment fallback
+    runs concurrently
+
+    Raises:
+        requests.exceptions.RequestException: If API call fails
+    """
+    if not texts:
+        return []
+    if len(texts) == 1:
+        return [await arequest_translation(texts[0], source_language, target_language)]
+
+    translated = await arequest_translation(_batch_text(texts), source_language, target_language)
+    segments = _split_batch(translated, len(texts))
+    if segments is not None:
+        return segments
+    return list(await asyncio.gather(*(
+        arequest_translation(text, source_language, target_language) for text in texts
+    )))
+
+def translate_text(text, source_language, target_language):
+    """
+    Translate text using the LLaMa API
+
+    Args:
+        text (str): Text to translate
+        source_language (str): Source language code
+        target_language (str): Target language code
+
+    Returns:
+        str: Translated text
+    """
     try:
-        result = make_api_request(LLAMA_TRANSLATE_URL, data)
-        return result.get("translated_text", "")
+        return request_translation(text, source_language, target_language)
     except requests.exceptions.RequestException as e:
         print(f"Error calling LLaMa API: {e}")
-        return f"Translation error: {str(e)}" 
\ No newline at end of file
+        return f"Translation error: {str(e)}"
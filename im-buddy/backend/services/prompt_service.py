@@ -0,0 +1,50 @@
+import time
+
+from utils.prompts import PromptManager
+from utils.tokens import usage_from_response
+from .llama_common import LLAMA_API_BASE_URL, make_api_request
+
+# API endpoint URL
+LLAMA_CHAT_URL = f"{LLAMA_API_BASE_URL}/v1/chat/completions"
+
+_prompt_manager = PromptManager(log_prompts=False)
+
+def _prompt_request_data(prompt_package):
+    settings = prompt_package["settings"]
+    return {
+        "model": "llama-3",
+        "messages": [
+            {"role": "system", "content": "You are an expert immigration form translator."},
+            {"role": "user", "content": prompt_package["prompt"]}
+        ],
+        "temperature": settings["temperature"],
+        "max_tokens": settings["max_tokens"],
+        "top_p": settings["top_p"],
+    }
+
+def request_prompt(phase, **context):
+    """
+    Run one ImmigrationFormPrompts phase through the LLaMa chat API
+
+    Args:
+        phase (str): Phase name, see ImmigrationFormPrompts.get_prompt_by_phase
+        **context: Arguments for that phase's prompt builder
+
+    Returns:
+        str: The model's reply
+
+    Raises:
+        requests.exceptions.RequestException: If API call fails
+    """
+    prompt_package = _prompt_manager.prepare_prompt(phase, context)
+    started = time.perf_counter()
+    try:
+        result = make_api_request(LLAMA_CHAT_URL, _prompt_request_data(prompt_package))
+    except Exception as e:
+        _prompt_manager.log_prompt_failure(prompt_package, e, time.perf_counter() - started)
+        raise
+    content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+    _prompt_manager.log_prompt_execution(
+        prompt_package, content, time.perf_counter() - started, usage_from_response(result)
+    )
+    return content
@@ -2,6 +2,8 @@ import os
 from dotenv import load_dotenv
 from supabase import create_client
 
+from utils.tracing import start_span
+
 # Load environment variables
 load_dotenv()
 
@@ -42,7 +44,13 @@ def fetch_data(table_name, query=None):
     Returns:
         dict: Query results
     """
-    client = get_client()
+    with start_span("supabase.fetch", {"db.system": "supabase", "db.table": table_name}) as span:
+        result = _build_query(get_client(), table_name, query).execute()
+        span.set_attribute("db.rows", len(getattr(result, "data", None) or []))
+        return result
+
+
+def _build_query(client, table_name, query):
     base_query = client.table(table_name).select("*")
     
     if query:
@@ -62,4 +70,4 @@ def fetch_data(table_name, query=None):
             if "offset" in query:
                 base_query = base_query.offset(query["offset"])
     
-    return base_query.execute() 
\ No newline at end of file
+    return base_query 
\ No newline at end of file
@@ -1,20 +1,10 @@
 import requests
-from .llama_common import make_api_request
+from .llama_common import LLAMA_API_BASE_URL, amake_api_request, make_api_request
 
 # API endpoint URL
-LLAMA_CHAT_URL = "https://api.llama.com/v1/chat/completions"
+LLAMA_CHAT_URL = f"{LLAMA_API_BASE_URL}/v1/chat/completions"
 
-def generate_tips(visa_type, language):
-    """
-    Generate smart tips for completing visa applications using LLaMa API
-    
-    Args:
-        visa_type (str): Visa type code
-        language (str): Language code for the tips
-        
-    Returns:
-        str: Generated tips content
-    """
+def _tips_request_data(visa_type, language):
     # Craft a prompt to generate visa tips
     prompt = f"""
     Generate helpful tips for filling out a {visa_type} visa application.
@@ -22,7 +12,7 @@ def generate_tips(visa_type, language):
     Please provide the tips in {language} language.
     Format the tips in a structured way with categories.
     """
-    
+
     data = {
         "model": "llama-3",
         "messages": [
@@ -32,10 +22,52 @@ def generate_tips(visa_type, language):
         "temperature": 0.7,
         "max_tokens": 1000
     }
-    
+
+    return data
+
+def _tips_content(result):
+    return result.get("choices", [{}])[0].get("message", {}).get("content", "No tips generated")
+
+def request_tips(visa_type, language):
+    """
+    Generate smart tips for completing visa applications, raising on failure
+
+    Args:
+        visa_type (str): Visa type code
+        language (str): Language code for the tips
+
+    Returns:
+        str: Generated tips content
+
+    Raises:
+        requests.exceptions.RequestException: If API call fails
+    """
+    result = make_api_request(LLAMA_CHAT_URL, _tips_request_data(visa_type, language))
+    return _tips_content(result)
+
+async def arequest_tips(visa_type, language):
+    """
+    Async version of request_tips
+
+    Raises:
+        requests.exceptions.RequestException: If API call fails
+    """
+    result = await amake_api_request(LLAMA_CHAT_URL, _tips_request_data(visa_type, language))
+    return _tips_content(result)
+
+def generate_tips(visa_type, language):
+    """
+    Generate smart tips for completing visa applications using LLaMa API
+
+    Args:
+        visa_type (str): Visa type code
+        language (str): Language code for the tips
+
+    Returns:
+        str: Generated tips content
+    """
     try:
-        result = make_api_request(LLAMA_CHAT_URL, data)
-        return result.get("choices", [{}])[0].get("message", {}).get("content", "No tips generated")
+        return request_tips(visa_type, language)
     except requests.exceptions.RequestException as e:
         print(f"Error calling LLaMa API: {e}")
-        return f"Tips generation error: {str(e)}" 
\ No newline at end of file
+        return f"Tips generation error: {str(e)}"
@@ -4,4 +4,6 @@ urlpatterns = [
     path('', include('apps.visa_info.urls')),
     path('translations/', include('apps.translations.urls')),
     path('tips/', include('apps.tips.urls')),
+    path('', include('apps.documents.urls')),
+    path('', include('apps.metrics.urls')),
 ] 
\ No newline at end of file
@@ -0,0 +1,228 @@
+"""
+Token-budgeted chunking of parsed forms for phase-1 translation.
+
+phase1_translation_prompt asks for the whole translated form back, and
+PromptConfig caps that reply at PROMPT_SETTINGS["phase1_translation"]
+["max_tokens"], so a long form cannot go out as one prompt. chunk_form()
+packs the pages of an extract_pdf_structure() document into chunks whose
+text and fields fit a token budget, splitting a page that is too large on
+its section headings (and, if a section is still too large, between
+lines). Chunks are translated independently and in parallel.
+
+For consistent terminology, build_glossary() collects the terms every
+chunk must translate the same way - field labels, headings and lines that
+recur across pages - which are translated once up front and given to each
+chunk's prompt. stitch_translations() joins the chunk replies back into
+one text with a single, de-duplicated field mapping table.
+
+Token counts are local estimates (see tokens.estimate_tokens).
+"""
+import re
+from collections import Counter
+
+from .field_detection import FILL_LINE, body_size, is_heading
+from .prompt_config import PromptConfig
+from .prompt_encoding import encode_payload, encoding_for
+from .tokens import estimate_tokens
+
+# A translated chunk comes back longer than its source (target-language
+# expansion, the field mapping table and notes), so the source budget is
+# the reply cap divided by this
+OUTPUT_EXPANSION = 2
+DEFAULT_CHUNK_TOKENS = PromptConfig.PROMPT_SETTINGS["phase1_translation"]["max_tokens"] // OUTPUT_EXPANSION
+
+GLOSSARY_MAX_TERMS = 60
+GLOSSARY_MAX_TERM_CHARS = 60
+
+MAPPING_HEADER = re.compile(r"^\W*field mapping table\W*$", re.IGNORECASE | re.MULTILINE)
+NOTES_HEADER = re.compile(r"^\W*translation notes\W*$", re.IGNORECASE | re.MULTILINE)
+MAPPING_ROW = re.compile(r"^\W*(.+?)\s*(?:→|->)\s*(.+?)(?:\s*\(([^()]*)\))?\s*$")
+
+
+def fields_tokens(fields):
+    """Estimated tokens of fields as they appear in the phase-1 prompt"""
+    return estimate_tokens(encode_payload(fields, encoding_for("phase1"))) if fields else 0
+
+
+def _page_sections(page):
+    # Lines of a page grouped by heading; the text before the first heading
+    # is a section of its own
+    spans = [span for span in page["text_blocks"] if span["text"].strip()]
+    page_body_size = body_size(spans)
+    sections = [[]]
+    for span in spans:
+        if is_heading(span, page_body_size) and sections[-1]:
+            sections.append([])
+        sections[-1].append(span["text"].strip())
+    return [lines for lines in sections if lines]
+
+
+def _units(page, fields, budget):
+    """
+    Split one page into pieces that each fit the budget: the whole page if
+    it fits, else its sections, else runs of lines
+    """
+    number = page["page_number"]
+    lines = [span["text"].strip() for span in page["text_blocks"] if span["text"].strip()]
+    page_fields = [field for field in fields if field.get("page") == number]
+    if estimate_tokens("\n".join(lines)) + fields_tokens(page_fields) <= budget:
+        return [(number, lines, page_fields)]
+
+    pieces = []
+    for section in _page_sections(page):
+        if estimate_tokens("\n".join(section)) <= budget:
+            pieces.append(section)
+            continue
+        run, run_tokens = [], 0
+        for line in section:
+            tokens = estimate_tokens(line) + 1
+            if run and run_tokens + tokens > budget:
+                pieces.append(run)
+                run, run_tokens = [], 0
+            run.append(line)
+            run_tokens += tokens
+        pieces.append(run)
+
+    # A field goes with the piece holding its label, or the first piece
+    units = [(number, piece, []) for piece in pieces]
+    for field in page_fields:
+        label = (field.get("field_label") or "").strip()
+        index = next((i for i, piece in enumerate(pieces) if label and any(label in line for line in piece)), 0)
+        units[index][2].append(field)
+    return units
+
+
+def chunk_form(structure, fields=(), budget=DEFAULT_CHUNK_TOKENS):
+    """
+    Pack a parsed form into chunks that each fit a token budget
+
+    Consecutive pages are packed together until the next one would not
+    fit; a page larger than the budget is split on its section headings.
+    Chunk text marks where each page starts, so the reply keeps the page
+    breaks.
+
+    Args:
+        structure (list): Pages from extract_pdf_structure
+        fields (list): Detected fields, each with its "page"
+        budget (int): Estimated tokens of text plus fields per chunk
+
+    Returns:
+        list: Dicts with key, pages (page numbers), text, fields and tokens,
+        in document order
+    """
+    chunks = []
+    current = None
+    for page in structure:
+        for number, lines, unit_fields in _units(page, fields, budget):
+            text = "\n".join(lines)
+            tokens = estimate_tokens(text) + fields_tokens(unit_fields)
+            if current is None or current["tokens"] + tokens > budget:
+                current = {"pages": [], "parts": [], "fields": [], "tokens": 0}
+                chunks.append(current)
+            if number not in current["pages"]:
+                current["pages"].append(number)
+                current["parts"].append(f"--- Page {number} ---")
+            current["parts"].append(text)
+            current["fields"].extend(unit_fields)
+            current["tokens"] += tokens
+
+    for index, chunk in enumerate(chunks, start=1):
+        chunk["key"] = f"chunk-{index}"
+        chunk["text"] = "\n".join(chunk.pop("parts"))
+    return chunks
+
+
+def build_glossary(structure, fields=(), max_terms=GLOSSARY_MAX_TERMS):
+    """
+    Terms every chunk must translate the same way
+
+    Field labels and section headings first, then short lines that appear
+    on more than one page (running headers, repeated instructions), most
+    frequent first.
+
+    Args:
+        structure (list): Pages from extract_pdf_structure
+        fields (list): Detected fields
+        max_terms (int): Glossary size limit
+
+    Returns:
+        list: Distinct terms, at most max_terms
+    """
+    terms = []
+
+    def add(text):
+        term = (text or "").strip().rstrip(":").strip()
+        if 2 < len(term) <= GLOSSARY_MAX_TERM_CHARS and not FILL_LINE.search(term) and term not in terms:
+            terms.append(term)
+
+    for field in fields:
+        add(field.get("field_label"))
+        add(field.get("section"))
+
+    pages_with_line = Counter()
+    for page in structure:
+        spans = [span for span in page["text_blocks"] if span["text"].strip()]
+        page_body_size = body_size(spans)
+        for span in spans:
+            if is_heading(span, page_body_size):
+                add(span["text"])
+        pages_with_line.update({span["text"].strip() for span in spans})
+    for line, pages in pages_with_line.most_common():
+        if pages < 2:
+            break
+        add(line)
+
+    return terms[:max_terms]
+
+
+def _mapping_rows(section):
+    rows = []
+    for line in section.splitlines():
+        match = MAPPING_ROW.match(line)
+        if match:
+            original, translated, field_name = match.groups()
+            if original == "Original Field Label":
+                continue  # the format line echoed back
+            rows.append({"original": original.strip(), "translated": translated.strip(), "field_name": field_name})
+    return rows
+
+
+def split_translation_reply(reply):
+    """
+    Split a phase-1 reply into its translated text, field mapping rows and notes
+
+    Returns:
+        tuple: (text, [{"original", "translated", "field_name"}], [note lines])
+    """
+    mapping = MAPPING_HEADER.search(reply)
+    notes = NOTES_HEADER.search(reply)
+    text_end = min(match.start() for match in (mapping, notes) if match) if (mapping or notes) else len(reply)
+
+    rows = []
+    if mapping:
+        end = notes.start() if notes and notes.start() > mapping.end() else len(reply)
+        rows = _mapping_rows(reply[mapping.end():end])
+    note_lines = []
+    if notes:
+        end = mapping.start() if mapping and mapping.start() > notes.end() else len(reply)
+        note_lines = [line.strip() for line in reply[notes.end():end].splitlines() if line.strip()]
+    return reply[:text_end].strip(), rows, note_lines
+
+
+def stitch_translations(replies):
+    """
+    Join the phase-1 replies for a form's chunks, in chunk order
+
+    Returns:
+        dict: text (the translated chunks, in order), field_mapping (one
+        row per original label, first translation wins) and notes
+        (distinct note lines)
+    """
+    texts, mapping, notes = [], {}, []
+    for reply in replies:
+        text, rows, note_lines = split_translation_reply(reply)
+        texts.append(text)
+        for row in rows:
+            mapping.setdefault(row["original"], row)
+        notes.extend(line for line in note_lines if line not in notes)
+    return {"text": "\n\n".join(texts), "field_mapping": list(mapping.values()), "notes": notes}
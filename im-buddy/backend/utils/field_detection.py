@@ -0,0 +1,329 @@
+"""
+Deterministic form-field detection, so the LLM only sees what is left over.
+
+Fillable PDFs list their fields as AcroForm widgets; those are read
+directly (name, type, rect, options, required flag). Printed forms are
+scanned for label/field pairs in the span geometry from
+extract_pdf_structure: "Label: ________" fill lines, checkbox glyphs
+followed by a label, and labels ending in ":" with blank space to their
+right. Labels are matched to widgets by position, and each field gets the
+section of the closest heading above it.
+
+Spans that look like labels but could not be resolved are returned as the
+residue; only those go to the LLM (see
+ImmigrationFormPrompts.field_residue_prompt).
+
+detect_fields() returns fields in the format field_extraction_prompt asks
+for: field_id, field_label, field_type, required, validation_rules,
+conditional_logic, section, options, help_text, legal_importance.
+"""
+import re
+from statistics import median
+
+import fitz  # PyMuPDF
+
+from .pdf_extraction import iter_pdf_structure
+
+WIDGET_TYPES = {
+    fitz.PDF_WIDGET_TYPE_TEXT: "text",
+    fitz.PDF_WIDGET_TYPE_CHECKBOX: "checkbox",
+    fitz.PDF_WIDGET_TYPE_RADIOBUTTON: "radio",
+    fitz.PDF_WIDGET_TYPE_COMBOBOX: "select",
+    fitz.PDF_WIDGET_TYPE_LISTBOX: "select",
+    fitz.PDF_WIDGET_TYPE_SIGNATURE: "signature",
+}
+
+BOLD_FLAG = 16  # PyMuPDF span flag
+
+FILL_LINE = re.compile(r"_{3,}|\.{5,}")
+CHECKBOX_GLYPHS = ("☐", "□", "❑", "❒", "[ ]", "( )")
+DATE_LABEL = re.compile(r"\b(date|dob|d\.o\.b|born|mm/dd|dd/mm|yyyy)\b", re.IGNORECASE)
+NUMBER_LABEL = re.compile(r"\b(number|no\.|num|#|phone|telephone|zip|postal code|a-number|ssn)\b",
+                          re.IGNORECASE)
+SIGNATURE_LABEL = re.compile(r"\bsignature\b", re.IGNORECASE)
+CRITICAL_LABEL = re.compile(r"\b(signature|sign|certify|declare|declaration|attest|oath)\b", re.IGNORECASE)
+# "Part 1.", "Section B", "1. Personal Information"
+HEADING_TEXT = re.compile(r"^(part|section|schedule|appendix)\b|^\d+\.\s+[A-Z]", re.IGNORECASE)
+
+# Geometry tolerances, in points
+SAME_LINE_OVERLAP = 0.5   # fraction of the shorter height two boxes must share
+MAX_LABEL_GAP = 200       # how far left of a widget its label may start
+MAX_LABEL_ABOVE = 24      # how far above a widget its label may sit
+MIN_BLANK_WIDTH = 60      # blank space after "Label:" that counts as a field
+
+
+def _vertical_overlap(a, b):
+    overlap = min(a[3], b[3]) - max(a[1], b[1])
+    shorter = min(a[3] - a[1], b[3] - b[1]) or 1
+    return overlap / shorter
+
+
+def _clean_label(text):
+    text = FILL_LINE.sub("", text)
+    for glyph in CHECKBOX_GLYPHS:
+        text = text.replace(glyph, "")
+    return text.strip().rstrip(":").strip()
+
+
+def _infer_text_type(label, multiline=False):
+    if SIGNATURE_LABEL.search(label):
+        return "signature"
+    if DATE_LABEL.search(label):
+        return "date"
+    if NUMBER_LABEL.search(label):
+        return "number"
+    return "textarea" if multiline else "text"
+
+
+def _importance(label, required):
+    if CRITICAL_LABEL.search(label):
+        return "critical"
+    return "important" if required else "standard"
+
+
+def _make_field(field_id, label, field_type, page_number, rect, source, required=False,
+                options=None, validation_rules=None, help_text=None):
+    return {
+        "field_id": field_id,
+        "field_label": label,
+        "field_type": field_type,
+        "required": required,
+        "validation_rules": validation_rules or [],
+        "conditional_logic": None,
+        "section": None,
+        "options": options or [],
+        "help_text": help_text,
+        "legal_importance": _importance(label, required),
+        "page": page_number,
+        "rect": tuple(round(value, 1) for value in rect),
+        "source": source,
+    }
+
+
+def body_size(spans):
+    """Median font size of a page's spans"""
+    sizes = [span["size"] for span in spans]
+    return median(sizes) if sizes else 0
+
+
+def is_heading(span, page_body_size):
+    """Whether a span looks like a section heading (larger than body text, or a bold "Part 1." style title)"""
+    text = span["text"].strip()
+    if not text or text.endswith(":") or FILL_LINE.search(text):
+        return False
+    return span["size"] >= page_body_size + 1.5 or bool(span["flags"] & BOLD_FLAG and HEADING_TEXT.search(text))
+
+
+def _headings(spans):
+    page_body_size = body_size(spans)
+    return sorted((span["bbox"][1], span["text"].strip()) for span in spans if is_heading(span, page_body_size))
+
+
+def widget_fields(page):
+    """
+    Fields from a page's AcroForm widgets, radio groups merged into one
+
+    Returns:
+        list: Field dicts, labels taken from the widget tooltip if any
+    """
+    fields = {}
+    for widget in page.widgets():
+        field_type = WIDGET_TYPES.get(widget.field_type)
+        if field_type is None:  # push buttons, unknown
+            continue
+        name = widget.field_name or f"widget_{widget.xref}"
+        flags = widget.field_flags or 0
+        required = bool(flags & fitz.PDF_FIELD_IS_REQUIRED)
+
+        if name in fields and field_type == "radio":
+            fields[name]["options"].append(widget.on_state())
+            continue
+
+        label = (widget.field_label or "").strip()
+        options = []
+        validation_rules = []
+        if field_type == "text":
+            field_type = _infer_text_type(label or name, multiline=bool(flags & fitz.PDF_TX_FIELD_IS_MULTILINE))
+            if widget.text_maxlen:
+                validation_rules.append(f"max_length:{widget.text_maxlen}")
+        elif field_type == "select":
+            options = [value if isinstance(value, str) else value[1] for value in widget.choice_values or []]
+        elif field_type == "radio":
+            options = [widget.on_state()]
+
+        fields[name] = _make_field(
+            name, label, field_type, page.number + 1, widget.rect, "widget",
+            required=required, options=options, validation_rules=validation_rules,
+        )
+    return list(fields.values())
+
+
+def _label_for_rect(rect, spans, used):
+    """Closest span to the left on the same line, else directly above"""
+    best, best_distance = None, None
+    for index, span in enumerate(spans):
+        if index in used or not _clean_label(span["text"]):
+            continue
+        bbox = span["bbox"]
+        if bbox[2] <= rect[0] + 2 and _vertical_overlap(bbox, rect) >= SAME_LINE_OVERLAP:
+            distance = rect[0] - bbox[2]
+            if distance > MAX_LABEL_GAP:
+                continue
+        elif 0 <= rect[1] - bbox[3] <= MAX_LABEL_ABOVE and bbox[0] < rect[2] and bbox[2] > rect[0]:
+            distance = (rect[1] - bbox[3]) * 2  # prefer same-line labels
+        else:
+            continue
+        if best_distance is None or distance < best_distance:
+            best, best_distance = index, distance
+    return best
+
+
+def _has_span_right_of(span, spans, page_width):
+    bbox = span["bbox"]
+    for other in spans:
+        other_bbox = other["bbox"]
+        if other is span or other_bbox[0] < bbox[2] - 1:
+            continue
+        if _vertical_overlap(bbox, other_bbox) >= SAME_LINE_OVERLAP and other_bbox[0] - bbox[2] < MIN_BLANK_WIDTH:
+            return True
+    return page_width - bbox[2] < MIN_BLANK_WIDTH
+
+
+def layout_fields(spans, page_number, page_width, used, prefix):
+    """
+    Fields inferred from printed labels, for spans not already claimed
+
+    Returns:
+        tuple: (fields, indexes of label-like spans left unresolved)
+    """
+    fields = []
+    residue = []
+
+    def add(index, label, field_type, rect):
+        used.add(index)
+        fields.append(_make_field(f"{prefix}_{len(fields) + 1}", label, field_type, page_number, rect, "layout"))
+
+    # Fill lines and checkboxes first, so their labels are claimed before
+    # the "Label:" pass below looks for blank space
+    for index, span in enumerate(spans):
+        if index in used:
+            continue
+        text = span["text"].strip()
+        label = _clean_label(text)
+        if FILL_LINE.search(text):
+            if not label:
+                # Bare fill line: label is the span to its left or above
+                label_index = _label_for_rect(span["bbox"], spans, used | {index})
+                if label_index is None:
+                    continue
+                used.add(label_index)
+                label = _clean_label(spans[label_index]["text"])
+            add(index, label, _infer_text_type(label), span["bbox"])
+        elif text.startswith(CHECKBOX_GLYPHS) and label:
+            add(index, label, "checkbox", span["bbox"])
+
+    for index, span in enumerate(spans):
+        text = span["text"].strip()
+        if index in used or not text.endswith(":") or not _clean_label(text):
+            continue
+        if _has_span_right_of(span, spans, page_width):
+            # A value or more text follows; can't tell a field from a caption
+            residue.append(index)
+            continue
+        bbox = span["bbox"]
+        label = _clean_label(text)
+        add(index, label, _infer_text_type(label), (bbox[2], bbox[1], min(page_width, bbox[2] + 200), bbox[3]))
+
+    return fields, residue
+
+
+def detect_fields(pdf_path, structure=None):
+    """
+    Detect form fields without the LLM
+
+    Args:
+        pdf_path (str): Path to the PDF (widgets are read from it)
+        structure (list): Output of extract_pdf_structure, if already
+            extracted (e.g. from the PDF cache); otherwise pages are
+            extracted as they are read
+
+    Returns:
+        dict: fields, residue (unresolved label text, by page) and metadata
+    """
+    pages = structure if structure is not None else iter_pdf_structure(pdf_path)
+    fields = []
+    residue = []
+    section = None
+    document_chars = 0
+
+    with fitz.open(pdf_path) as doc:
+        for page_info in pages:
+            page_number = page_info["page_number"]
+            page = doc[page_number - 1]
+            spans = list(page_info["text_blocks"])
+            document_chars += sum(len(span["text"]) for span in spans)
+            used = set()
+
+            page_fields = widget_fields(page)
+            for field in page_fields:
+                if field["field_label"]:
+                    continue
+                label_index = _label_for_rect(field["rect"], spans, used)
+                if label_index is not None:
+                    used.add(label_index)
+                    field["field_label"] = _clean_label(spans[label_index]["text"])
+                else:
+                    field["field_label"] = field["field_id"]
+                field["legal_importance"] = _importance(field["field_label"], field["required"])
+                if field["field_type"] == "text":
+                    field["field_type"] = _infer_text_type(field["field_label"])
+
+            printed_fields, page_residue = layout_fields(
+                spans, page_number, page.rect.width, used, prefix=f"p{page_number}_field"
+            )
+            page_fields.extend(printed_fields)
+
+            # Assign each field the closest heading above it
+            headings = _headings(spans)
+            next_heading = 0
+            page_fields.sort(key=lambda field: (field["rect"][1], field["rect"][0]))
+            for field in page_fields:
+                while next_heading < len(headings) and headings[next_heading][0] <= field["rect"][1]:
+                    section = headings[next_heading][1]
+                    next_heading += 1
+                field["section"] = section
+            if headings:
+                section = headings[-1][1]  # carries over to the next page
+
+            fields.extend(page_fields)
+            if page_residue:
+                residue.append({
+                    "page": page_number,
+                    "lines": [spans[index]["text"].strip() for index in page_residue],
+                })
+
+    residue_chars = sum(len(line) for page in residue for line in page["lines"])
+    return {
+        "fields": fields,
+        "residue": residue,
+        "metadata": {
+            "total_fields": len(fields),
+            "required_fields": sum(field["required"] for field in fields),
+            "widget_fields": sum(field["source"] == "widget" for field in fields),
+            "layout_fields": sum(field["source"] == "layout" for field in fields),
+            "document_chars": document_chars,
+            "residue_chars": residue_chars,
+        },
+    }
+
+
+def residue_text(detection):
+    """
+    The unresolved part of a detection, as text for field_residue_prompt
+
+    Returns:
+        str: Residue lines grouped by page, or "" if nothing is left
+    """
+    return "\n\n".join(
+        f"[Page {page['page']}]\n" + "\n".join(page["lines"]) for page in detection["residue"]
+    )
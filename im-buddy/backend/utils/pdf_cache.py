@@ -0,0 +1,318 @@
+"""
+Content-addressed disk cache for parsed PDF structures.
+
+Entries are keyed by the SHA-256 of the PDF bytes plus PARSER_VERSION, so
+the same official form uploaded by different users is parsed once, and a
+parser change invalidates every entry. The LLM field-extraction result for
+a form can be cached alongside its structure.
+
+Entries are zlib-compressed pickles written atomically, one file each, in
+a directory that several worker processes may share. File mtimes record
+last use; when the directory grows past max_bytes the least recently used
+entries are deleted, along with temp files left by writes that never
+finished. Loading pickles is only safe because nothing else can
+write there: the directory (settings.PDF_CACHE_DIR) is created with mode 0700, and the cache refuses to use one that
+another user owns or that is group- or world-writable.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import zlib
+
+from django.conf import settings
+
+from .pdf_extraction import PARSER_VERSION, extract_pdf_structure
+from .tracing import start_span
+
+# Evict down to this fraction of max_bytes, so eviction doesn't run on every store
+LOW_WATER_MARK = 0.9
+
+ENTRY_SUFFIX = ".pkz"
+TEMP_SUFFIX = ".tmp"
+
+# Age after which a temp file is a write that died (crash, full disk), not
+# one in progress, and eviction deletes it
+STALE_TEMP_SECONDS = 3600
+
+# extract_fn arguments that don't change its output, left out of entry kinds
+OUTPUT_NEUTRAL_KWARGS = ("workers",)
+
+
+def pdf_digest(pdf):
+    """
+    SHA-256 of a PDF's bytes
+
+    Args:
+        pdf (str or bytes): Path to the PDF, or its contents
+    """
+    digest = hashlib.sha256()
+    if isinstance(pdf, (bytes, bytearray, memoryview)):
+        digest.update(pdf)
+    else:
+        with open(pdf, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PDFCacheStats:
+    """Per-process counters for the PDF cache"""
+
+    FIELDS = ("hits", "misses", "stores", "evictions", "errors")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = counters["hits"] / lookups if lookups else 0.0
+        return counters
+
+    def reset(self):
+        with self._lock:
+            self._counters = dict.fromkeys(self.FIELDS, 0)
+
+
+class PDFCache:
+    """
+    Disk cache of extracted structures and field-extraction results
+
+    Args:
+        directory (str): Cache directory, created (mode 0700) on first use
+        max_bytes (int): Size above which least recently used entries go
+        parser_version (str): Part of every key; bump to invalidate
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, parser_version=PARSER_VERSION):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.parser_version = parser_version
+        self.stats = PDFCacheStats()
+        self._lock = threading.Lock()
+        self._directory_checked = False
+        # Estimated size on disk: the last scan plus what this process wrote since
+        self._estimated_bytes = None
+
+    def key(self, pdf):
+        """
+        Cache key for a PDF
+
+        Args:
+            pdf (str or bytes): Path to the PDF, or its contents
+        """
+        return f"{pdf_digest(pdf)}-v{self.parser_version}"
+
+    def _check_directory(self):
+        """
+        Create the cache directory, private to this user, and make sure
+        nobody else can plant entries in it
+
+        Raises:
+            PermissionError: The directory is another user's, or group- or
+                world-writable
+        """
+        if self._directory_checked:
+            return
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        stat = os.stat(self.directory)
+        owner = os.geteuid() if hasattr(os, "geteuid") else stat.st_uid
+        if stat.st_uid != owner or stat.st_mode & 0o022:
+            raise PermissionError(
+                f"PDF cache directory {self.directory} must be owned by this user and not "
+                f"writable by others; its entries are unpickled"
+            )
+        self._directory_checked = True
+
+    def _path(self, key, kind):
+        return os.path.join(self.directory, key[:2], f"{key}.{kind}{ENTRY_SUFFIX}")
+
+    def get(self, key, kind="structure"):
+        """
+        Returns:
+            The cached value, or None on a miss
+        """
+        self._check_directory()
+        path = self._path(key, kind)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            self.stats.add("misses")
+            return None
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError) as e:
+            print(f"Discarding unreadable PDF cache entry {path}: {e}")
+            self.stats.add("errors")
+            self.stats.add("misses")
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        self.stats.add("hits")
+        return value
+
+    def set(self, key, value, kind="structure"):
+        path = self._path(key, kind)
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+        self._check_directory()
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            self._remove(tmp_path)
+            raise
+        self.stats.add("stores")
+        self._account(len(data))
+
+    def get_or_extract(self, pdf_path, extract_fn=extract_pdf_structure, **kwargs):
+        """
+        Return a PDF's structure from the cache, extracting it on a miss
+
+        Args:
+            pdf_path (str): Path to the PDF
+            extract_fn (callable): (pdf_path, **kwargs) -> structure
+            **kwargs: Passed to extract_fn; included in the cache entry kind,
+                except OUTPUT_NEUTRAL_KWARGS such as workers
+
+        Returns:
+            tuple: (cache key, structure)
+        """
+        with start_span("pdf.extract", {"pdf.path": pdf_path}) as span:
+            key = self.key(pdf_path)
+            kind = "structure" + "".join(
+                f"-{name}={kwargs[name]}" for name in sorted(kwargs) if name not in OUTPUT_NEUTRAL_KWARGS
+            )
+            structure = self.get(key, kind)
+            span.set_attribute("pdf.cache_hit", structure is not None)
+            if structure is None:
+                structure = extract_fn(pdf_path, **kwargs)
+                self.set(key, structure, kind)
+            span.set_attribute("pdf.pages", len(structure))
+            return key, structure
+
+    def get_fields(self, key, variant="default"):
+        """Cached field-extraction result for a PDF, or None"""
+        return self.get(key, f"fields-{variant}")
+
+    def set_fields(self, key, fields, variant="default"):
+        """
+        Cache the field-extraction result for a PDF
+
+        Args:
+            variant (str): Distinguishes results produced differently
+                (e.g. by prompt version)
+        """
+        self.set(key, fields, f"fields-{variant}")
+
+    def _account(self, written):
+        with self._lock:
+            if self._estimated_bytes is None:
+                # First write in this process: size the directory once (the
+                # scan already includes this write)
+                self._estimated_bytes = self._scan_total()
+            else:
+                self._estimated_bytes += written
+            if self._estimated_bytes <= self.max_bytes:
+                return
+            self._estimated_bytes = self._evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(ENTRY_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # evicted by another process
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _remove_stale_temp_files(self):
+        cutoff = time.time() - STALE_TEMP_SECONDS
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(TEMP_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        self._remove(path)
+                except FileNotFoundError:
+                    continue  # renamed into place or removed meanwhile
+
+    def _scan_total(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """
+        Delete least recently used entries until under the low water mark,
+        and stale temp files
+
+        Returns:
+            int: Bytes left in the cache
+        """
+        self._remove_stale_temp_files()
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * LOW_WATER_MARK
+        for _, size, path in entries:
+            if total <= target:
+                break
+            if self._remove(path):
+                self.stats.add("evictions")
+            total -= size
+        return total
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def size(self):
+        """Bytes currently stored on disk"""
+        return self._scan_total()
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
+        with self._lock:
+            self._estimated_bytes = 0
+
+
+_pdf_cache = None
+_pdf_cache_lock = threading.Lock()
+
+
+def get_pdf_cache():
+    """
+    Get the shared PDF cache for this process, configured from
+    settings.PDF_CACHE_DIR and settings.PDF_CACHE_MAX_BYTES
+    """
+    global _pdf_cache
+
+    with _pdf_cache_lock:
+        if _pdf_cache is None:
+            _pdf_cache = PDFCache(settings.PDF_CACHE_DIR, settings.PDF_CACHE_MAX_BYTES)
+    return _pdf_cache
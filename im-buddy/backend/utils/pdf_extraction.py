@@ -0,0 +1,171 @@
+"""
+Text and layout extraction from PDF forms with PyMuPDF.
+
+iter_pdf_structure() yields one page at a time, so callers can start on
+page 1 while later pages are still being parsed and only one page's spans
+are held in memory. extract_pdf_structure() returns the whole document as
+a list, optionally extracting page ranges in parallel worker processes.
+
+With compact=True, each page's text_blocks is a SpanTable (see
+pdf_spans.py) instead of a list of dicts, and the page reports its
+memory_bytes.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import fitz  # PyMuPDF
+
+from .pdf_spans import SpanTable
+
+# Bump whenever extraction output changes; cached structures are keyed on it
+PARSER_VERSION = "1"
+
+# Text extraction flags: the default "dict" flags without embedded image
+# data, which we never read but would otherwise hold in memory per page
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Costs measured with benchmarks/pdf_extraction.py (400 spans per page):
+# extracting a page takes about 6 ms, starting a spawned worker pool about
+# 0.65 s, and sending a page's spans back from a worker about 1.5 ms. A
+# pool only pays off for documents of hundreds of pages.
+PAGE_SECONDS = 0.006
+POOL_START_SECONDS = 0.65
+PAGE_TRANSFER_SECONDS = 0.0015
+
+# Page ranges per worker; more, smaller ranges even out pages of uneven density
+SHARDS_PER_WORKER = 4
+
+
+def page_structure(page, page_num, compact=False):
+    """
+    Extract the text spans of a single page
+
+    Args:
+        page (fitz.Page): Page to extract
+        page_num (int): Zero-based page index
+        compact (bool): Store spans in a SpanTable instead of dicts
+
+    Returns:
+        dict: page_number, page_size, text_blocks, images and formatting
+    """
+    blocks = page.get_text("dict", flags=TEXT_FLAGS)
+
+    page_info = {
+        "page_number": page_num + 1,
+        "page_size": page.rect,
+        "text_blocks": SpanTable() if compact else [],
+        "images": [],
+        "formatting": []
+    }
+
+    for block in blocks["blocks"]:
+        if "lines" in block:  # Text block
+            for line in block["lines"]:
+                for span in line["spans"]:
+                    if compact:
+                        page_info["text_blocks"].append(
+                            span["text"], span["bbox"], span["font"], span["size"], span["flags"]
+                        )
+                        continue
+                    page_info["text_blocks"].append({
+                        "text": span["text"],
+                        "bbox": span["bbox"],  # positioning
+                        "font": span["font"],
+                        "size": span["size"],
+                        "flags": span["flags"]  # bold, italic, etc.
+                    })
+
+    if compact:
+        page_info["memory_bytes"] = page_info["text_blocks"].freeze().nbytes()
+    return page_info
+
+
+def iter_pdf_structure(pdf_path, start=0, stop=None, compact=False):
+    """
+    Yield the structure of each page of a PDF, one page at a time
+
+    The document stays open until the generator is exhausted or closed.
+
+    Args:
+        pdf_path (str): Path to the PDF
+        start (int): First page index to extract
+        stop (int): Page index to stop before (default: end of document)
+        compact (bool): Store spans in a SpanTable instead of dicts
+
+    Yields:
+        dict: Page structure, see page_structure()
+    """
+    with fitz.open(pdf_path) as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        for page_num in range(start, stop):
+            yield page_structure(doc[page_num], page_num, compact=compact)
+
+
+def choose_worker_count(page_count, cpu_count=None):
+    """
+    Pick how many processes to extract a document with: the count with the
+    lowest estimated time, given the measured costs above
+
+    Returns:
+        int: 1 (serial) unless the pool's start-up and transfer costs are
+        outweighed, up to one worker per CPU
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    best, best_seconds = 1, page_count * PAGE_SECONDS
+    for workers in range(2, cpu_count + 1):
+        seconds = POOL_START_SECONDS + page_count * (PAGE_SECONDS / workers + PAGE_TRANSFER_SECONDS)
+        if seconds < best_seconds:
+            best, best_seconds = workers, seconds
+    return best
+
+
+def page_ranges(page_count, shards):
+    """
+    Split pages into contiguous (start, stop) ranges of near-equal size
+    """
+    shards = max(1, min(shards, page_count))
+    size, extra = divmod(page_count, shards)
+    ranges = []
+    start = 0
+    for shard in range(shards):
+        stop = start + size + (1 if shard < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def _extract_range(pdf_path, start, stop, compact):
+    # Runs in a worker process, which opens the document itself
+    return list(iter_pdf_structure(pdf_path, start, stop, compact=compact))
+
+
+def extract_pdf_structure(pdf_path, workers=1, compact=False):
+    """
+    Extract the structure of every page of a PDF
+
+    Args:
+        pdf_path (str): Path to the PDF
+        workers (int): Worker processes to shard pages across; None picks
+            a count from the page and CPU counts, 1 extracts serially
+        compact (bool): Store spans in a SpanTable instead of dicts
+
+    Returns:
+        list: Page structures in page order
+    """
+    if workers == 1:
+        return list(iter_pdf_structure(pdf_path, compact=compact))
+
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    if workers is None:
+        workers = choose_worker_count(page_count)
+    if workers <= 1 or page_count <= 1:
+        return list(iter_pdf_structure(pdf_path, compact=compact))
+
+    ranges = page_ranges(page_count, workers * SHARDS_PER_WORKER)
+    # spawn: MuPDF state and the caller's threads must not be forked
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as executor:
+        starts, stops = zip(*ranges)
+        shards = executor.map(_extract_range, [pdf_path] * len(ranges), starts, stops, [compact] * len(ranges))
+        return [page for shard in shards for page in shard]
@@ -0,0 +1,255 @@
+"""
+Layout-preserving output: write translations back into the original PDF.
+
+Instead of regenerating the document (rebuild_via_markdown: an extra LLM
+call, then Markdown -> HTML -> WeasyPrint), each span whose text changed is
+redacted and the translation is inserted into the same bbox, shrunk to fit.
+Form lines, boxes and images are left untouched, as is every span without
+a translation. Fillable fields can be filled through their widgets.
+
+Translations the base Helvetica family can render (Latin, Greek,
+Cyrillic) are written with one TextWriter per page: on the original
+baseline, shrunk to fit the bbox width, or else word-wrapped onto several
+smaller lines inside the bbox. Anything else (CJK, Arabic, Hebrew,
+Devanagari, ...) and all right-to-left text goes through insert_htmlbox,
+which falls back to bundled fonts and handles bidi layout - correct, but
+several times slower per span.
+
+Text never leaves its bbox, so it can't cover a neighbouring column. A
+translation that only fits below MIN_SCALE is still drawn inside the bbox,
+as small as it takes, and the full text is attached as a note annotation
+at the bbox's top-right corner; those spans are counted as overflowed.
+"""
+import html
+from typing import Dict, Optional
+
+import fitz  # PyMuPDF
+
+from .prompt_config import PromptConfig
+from .tracing import traced
+
+BOLD_FLAG = 16
+ITALIC_FLAG = 2
+
+# Base fonts by (bold, italic)
+BASE_FONTS = {
+    (False, False): "helv",
+    (True, False): "hebo",
+    (False, True): "heit",
+    (True, True): "hebi",
+}
+
+# Smallest scale a translation may be shrunk to, on one line or wrapped,
+# before it counts as overflowing and gets a note annotation
+MIN_SCALE = 0.5
+# Baseline-to-baseline distance of wrapped lines, in font sizes
+LINE_SPACING = 1.15
+# Most lines a translation is wrapped onto inside its bbox
+MAX_LINES = 4
+
+
+def _span_css(span, rtl):
+    rules = [f"font-size: {span['size']:.1f}pt", "line-height: 1", "margin: 0"]
+    if span["flags"] & BOLD_FLAG:
+        rules.append("font-weight: bold")
+    if span["flags"] & ITALIC_FLAG:
+        rules.append("font-style: italic")
+    if rtl:
+        rules.append("direction: rtl; text-align: right")
+    return "* {" + "; ".join(rules) + "}"
+
+
+def _redaction_rects(changed, unchanged):
+    """
+    Merge the bboxes of changed spans that sit side by side on one line
+
+    Each redaction annotation costs time linear in the number already on
+    the page, so a dense page is redacted line by line rather than span by
+    span. A merged rect never covers a span that is being kept.
+    """
+    kept = {}
+    for bbox in unchanged:
+        kept.setdefault(round(bbox[1]), []).append(fitz.Rect(bbox))
+
+    rects = []
+    line = None
+    for bbox in sorted(changed, key=lambda bbox: (round(bbox[1]), bbox[0])):
+        rect = fitz.Rect(bbox)
+        if line == round(bbox[1]) and rect.x0 >= rects[-1].x0:
+            merged = rects[-1] | rect
+            if not any(merged.intersects(other) for other in kept.get(line, ())):
+                rects[-1] = merged
+                continue
+        rects.append(rect)
+        line = round(bbox[1])
+    return rects
+
+
+def wrap_text(font, text, fontsize, width):
+    """
+    Greedy word wrap
+
+    Returns:
+        list: Lines; a single word wider than width gets a line of its own
+    """
+    lines = []
+    line = ""
+    for word in text.split():
+        candidate = f"{line} {word}" if line else word
+        if line and font.text_length(candidate, fontsize=fontsize) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    return lines + [line] if line else lines
+
+
+def fit_text(font, text, size, rect):
+    """
+    Largest layout of text inside rect: one line shrunk to the bbox width,
+    or up to MAX_LINES wrapped lines
+
+    Args:
+        font (fitz.Font): Font the text is written in
+        text (str): Text to fit
+        size (float): Original font size; never enlarged
+        rect (fitz.Rect): Bbox to fit in
+
+    Returns:
+        tuple: (font size, lines)
+    """
+    line_height = font.ascender - font.descender
+    best_size, best_lines = 0, [text]
+    for count in range(1, MAX_LINES + 1):
+        # Largest size at which count lines are as tall as the bbox
+        fontsize = min(size, rect.height / (line_height + (count - 1) * LINE_SPACING))
+        if fontsize <= best_size:
+            break
+        lines = [text] if count == 1 else wrap_text(font, text, fontsize, rect.width)
+        if len(lines) > count:
+            continue
+        widest = max(font.text_length(line, fontsize=fontsize) for line in lines)
+        if widest > rect.width:
+            fontsize *= rect.width / widest
+        if fontsize > best_size:
+            best_size, best_lines = fontsize, lines
+    return best_size, best_lines
+
+
+class _PageWriter:
+    """Writes the translations for one page, base-font text batched in a TextWriter"""
+
+    def __init__(self, page, fonts, rtl):
+        self.page = page
+        self.fonts = fonts
+        self.rtl = rtl
+        self.writer = fitz.TextWriter(page.rect)
+
+    def _font(self, flags):
+        name = BASE_FONTS[(bool(flags & BOLD_FLAG), bool(flags & ITALIC_FLAG))]
+        if name not in self.fonts:
+            self.fonts[name] = fitz.Font(name)
+        return self.fonts[name]
+
+    def add(self, span, text):
+        """
+        Returns:
+            bool: True if the text fit its bbox at MIN_SCALE or above
+        """
+        rect = fitz.Rect(span["bbox"])
+        font = self._font(span["flags"])
+        if self.rtl or not all(font.has_glyph(ord(char)) for char in text):
+            fits = self._add_html(span, rect, text)
+        else:
+            size, lines = fit_text(font, text, span["size"], rect)
+            if len(lines) == 1:
+                # Keep the original baseline
+                baselines = [rect.y1 + font.descender * span["size"]]
+            else:
+                first = rect.y0 + font.ascender * size
+                baselines = [first + number * size * LINE_SPACING for number in range(len(lines))]
+            for line, baseline in zip(lines, baselines):
+                self.writer.append((rect.x0, baseline), line, font=font, fontsize=size)
+            fits = size >= span["size"] * MIN_SCALE
+        if not fits:
+            self._annotate(rect, text)
+        return fits
+
+    def _add_html(self, span, rect, text):
+        css = _span_css(span, self.rtl)
+        spare_height, _ = self.page.insert_htmlbox(rect, html.escape(text), css=css, scale_low=MIN_SCALE)
+        if spare_height >= 0:
+            return True
+        self.page.insert_htmlbox(rect, html.escape(text), css=css, scale_low=0)
+        return False
+
+    def _annotate(self, rect, text):
+        annot = self.page.add_text_annot(rect.tr, text, icon="Comment")
+        annot.set_info(title="Translation")
+        annot.update()
+
+    def finish(self):
+        self.writer.write_text(self.page)
+
+
+@traced("pdf.overlay")
+def overlay_translations(pdf_path, structure, translations: Dict[str, str], output_path,
+                         target_language: str = "English", field_values: Optional[Dict[str, str]] = None):
+    """
+    Write translated text over the original spans of a PDF
+
+    Args:
+        pdf_path (str): Original PDF
+        structure (list): Output of extract_pdf_structure for pdf_path
+        translations (dict): Original span text (stripped) -> translation;
+            spans without an entry, or with an identical one, are untouched
+        output_path (str): Where to save the translated PDF
+        target_language (str): PromptConfig language name, for RTL layout
+        field_values (dict): Widget field name -> value to fill in
+
+    Returns:
+        dict: spans_replaced, spans_overflowed, fields_filled
+    """
+    rtl = PromptConfig.is_rtl_language(target_language)
+    field_values = field_values or {}
+    stats = {"spans_replaced": 0, "spans_overflowed": 0, "fields_filled": 0}
+    fonts = {}
+
+    with fitz.open(pdf_path) as doc:
+        for page_info in structure:
+            page = doc[page_info["page_number"] - 1]
+
+            changes = []
+            unchanged = []
+            for span in page_info["text_blocks"]:
+                original = span["text"].strip()
+                translated = translations.get(original)
+                if translated and translated != original:
+                    changes.append((span, translated))
+                else:
+                    unchanged.append(span["bbox"])
+
+            if changes:
+                for rect in _redaction_rects([span["bbox"] for span, _ in changes], unchanged):
+                    page.add_redact_annot(rect)
+                # Remove only the text: keep form lines, boxes and images
+                page.apply_redactions(
+                    images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_LINE_ART_NONE
+                )
+                writer = _PageWriter(page, fonts, rtl)
+                for span, translated in changes:
+                    if not writer.add(span, translated):
+                        stats["spans_overflowed"] += 1
+                writer.finish()
+                stats["spans_replaced"] += len(changes)
+
+            if field_values:
+                for widget in page.widgets():
+                    if widget.field_name in field_values:
+                        widget.field_value = field_values[widget.field_name]
+                        widget.update()
+                        stats["fields_filled"] += 1
+
+        doc.save(output_path, garbage=3, deflate=True)
+
+    return stats
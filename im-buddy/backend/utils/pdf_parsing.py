@@ -1,43 +1,15 @@
-import fitz  # PyMuPDF
 import json
 import markdown
-from weasyprint import HTML, CSS
-
-def extract_pdf_structure(pdf_path):
-    doc = fitz.open(pdf_path)
-    pages_data = []
-    
-    for page_num, page in enumerate(doc):
-        # Extract text blocks with positioning and formatting
-        blocks = page.get_text("dict")
-        
-        page_info = {
-            "page_number": page_num + 1,
-            "page_size": page.rect,
-            "text_blocks": [],
-            "images": [],
-            "formatting": []
-        }
-        
-        for block in blocks["blocks"]:
-            if "lines" in block:  # Text block
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        page_info["text_blocks"].append({
-                            "text": span["text"],
-                            "bbox": span["bbox"],  # positioning
-                            "font": span["font"],
-                            "size": span["size"],
-                            "flags": span["flags"]  # bold, italic, etc.
-                        })
-        
-        pages_data.append(page_info)
-    
-    return pages_data
 
+# Extraction and overlay output live in PyMuPDF-only modules; re-exported for callers
+from .pdf_extraction import extract_pdf_structure, iter_pdf_structure
+from .pdf_overlay import overlay_translations
+from .pdf_render import get_pdf_renderer
 
 
-def rebuild_via_markdown(translation_data, output_path):
+def rebuild_via_markdown(translation_data, output_path, target_language="English"):
+    # Full re-render, for documents with no usable layout; prefer
+    # overlay_translations, which keeps the original form and needs no LLM call
     # Get Markdown from LLM (easy to validate)
     markdown_content = get_markdown_from_llm(translation_data)
     
@@ -46,8 +18,8 @@ def rebuild_via_markdown(translation_data, output_path):
         # Convert markdown to HTML
         html = markdown.markdown(markdown_content)
         
-        # Convert to PDF
-        HTML(string=html).write_pdf(output_path)
+        # Convert to PDF in the warm render pool, styled for the target language
+        get_pdf_renderer().render(html, output_path, target_language)
 
 def get_markdown_from_llm(data):
     prompt = f"""
@@ -0,0 +1,276 @@
+"""
+HTML -> PDF rendering in a pool of warm WeasyPrint worker processes.
+
+A cold HTML(string=...).write_pdf() call pays for importing WeasyPrint,
+loading fonts through fontconfig and parsing the stylesheet before any
+layout happens, and does it in the request thread. Here each worker
+process does that once at startup: it creates one FontConfiguration,
+compiles the shared stylesheet for the languages in WARM_LANGUAGES, and
+renders a one-line document so fonts are loaded. Stylesheets for other
+languages are compiled on first use and kept for the worker's lifetime.
+
+Stylesheets differ by language only in direction (PromptConfig.is_rtl_language)
+and font stack (per script), so languages that share both share one CSS
+object.
+
+Submissions beyond max_pending wait up to queue_timeout for a slot and
+then raise RenderQueueFull, so a burst of renders can't grow an unbounded
+backlog behind the pool. Worker-side timings (stylesheet, layout, write)
+and queue wait are collected in render_stats.
+"""
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.conf import settings
+
+from .prompt_config import PromptConfig
+from .tracing import start_span
+
+# Stylesheets compiled when a worker starts
+WARM_LANGUAGES = ("English", "Spanish", "Arabic")
+
+BASE_CSS = """
+@page { size: A4; margin: 2cm; }
+body { font-family: %(fonts)s; font-size: 11pt; line-height: 1.4; direction: %(direction)s; }
+h1, h2, h3 { line-height: 1.2; margin: 1em 0 0.5em; }
+table { border-collapse: collapse; width: 100%%; }
+th, td { border: 1px solid #999; padding: 4pt; text-align: %(align)s; vertical-align: top; }
+ul, ol { padding-%(align)s: 1.5em; }
+"""
+
+DEFAULT_FONTS = '"DejaVu Sans", "Liberation Sans", Arial, sans-serif'
+
+# Font stacks for scripts the default fonts don't cover, by language code
+SCRIPT_FONTS = {
+    "ar": '"Noto Naskh Arabic", "Noto Sans Arabic", "DejaVu Sans", sans-serif',
+    "he": '"Noto Sans Hebrew", "DejaVu Sans", sans-serif',
+    "hi": '"Noto Sans Devanagari", "Lohit Devanagari", sans-serif',
+    "zh": '"Noto Sans CJK SC", "WenQuanYi Zen Hei", sans-serif',
+    "ja": '"Noto Sans CJK JP", "IPAGothic", sans-serif',
+    "ko": '"Noto Sans CJK KR", "NanumGothic", sans-serif',
+}
+
+
+class RenderQueueFull(Exception):
+    """Too many renders are already pending"""
+
+
+def stylesheet_key(language):
+    """
+    Languages with the same key share a compiled stylesheet
+
+    Returns:
+        tuple: (rtl, font stack)
+    """
+    code = PromptConfig.get_language_info(language).get("code")
+    return PromptConfig.is_rtl_language(language), SCRIPT_FONTS.get(code, DEFAULT_FONTS)
+
+
+def stylesheet_source(key):
+    rtl, fonts = key
+    return BASE_CSS % {
+        "fonts": fonts,
+        "direction": "rtl" if rtl else "ltr",
+        "align": "right" if rtl else "left",
+    }
+
+
+# Worker process state, set up by _init_worker
+_font_config = None
+_stylesheets = {}
+_renders = 0
+
+
+def _stylesheet(key):
+    from weasyprint import CSS
+
+    if key not in _stylesheets:
+        _stylesheets[key] = CSS(string=stylesheet_source(key), font_config=_font_config)
+    return _stylesheets[key]
+
+
+def _init_worker(languages):
+    global _font_config
+
+    from weasyprint import HTML
+    from weasyprint.text.fonts import FontConfiguration
+
+    _font_config = FontConfiguration()
+    for language in languages:
+        _stylesheet(stylesheet_key(language))
+    # Load the default fonts now rather than on the first real render
+    HTML(string="<p>warm-up</p>").render(
+        stylesheets=[_stylesheet(stylesheet_key(languages[0]))], font_config=_font_config
+    )
+
+
+def _render(html, output_path, language):
+    # Runs in a worker process
+    global _renders
+
+    from weasyprint import HTML
+
+    started = time.perf_counter()
+    key = stylesheet_key(language)
+    cold_stylesheet = key not in _stylesheets
+    stylesheet = _stylesheet(key)
+    compiled = time.perf_counter()
+
+    document = HTML(string=html).render(stylesheets=[stylesheet], font_config=_font_config)
+    laid_out = time.perf_counter()
+    document.write_pdf(output_path)
+    written = time.perf_counter()
+
+    _renders += 1
+    return {
+        "pages": len(document.pages),
+        "stylesheet_ms": (compiled - started) * 1000,
+        "layout_ms": (laid_out - compiled) * 1000,
+        "write_ms": (written - laid_out) * 1000,
+        "cold_stylesheet": cold_stylesheet,
+        "worker_renders": _renders,
+        "pid": os.getpid(),
+    }
+
+
+class RenderStats:
+    """Per-process counters and timing totals for the render pool"""
+
+    FIELDS = ("renders", "failures", "rejected", "cold_stylesheets",
+              "queue_wait_ms", "stylesheet_ms", "layout_ms", "write_ms", "total_ms")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def record(self, timings, queue_wait_ms, total_ms):
+        with self._lock:
+            self._counters["renders"] += 1
+            self._counters["cold_stylesheets"] += timings["cold_stylesheet"]
+            self._counters["queue_wait_ms"] += queue_wait_ms
+            self._counters["total_ms"] += total_ms
+            for name in ("stylesheet_ms", "layout_ms", "write_ms"):
+                self._counters[name] += timings[name]
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+        renders = counters["renders"]
+        for name in ("queue_wait_ms", "stylesheet_ms", "layout_ms", "write_ms", "total_ms"):
+            counters[f"avg_{name}"] = counters[name] / renders if renders else 0.0
+        return counters
+
+    def reset(self):
+        with self._lock:
+            self._counters = dict.fromkeys(self.FIELDS, 0)
+
+
+render_stats = RenderStats()
+
+
+class PDFRenderer:
+    """
+    A pool of warm WeasyPrint worker processes
+
+    Args:
+        workers (int): Worker processes
+        max_pending (int): Renders queued or running before submit() blocks
+        queue_timeout (float): Seconds submit() waits for a free slot
+        timeout (float): Seconds render() waits for a result by default
+        warm_languages (tuple): Stylesheets each worker compiles at startup
+    """
+
+    def __init__(self, workers=2, max_pending=16, queue_timeout=5.0, timeout=60.0, warm_languages=WARM_LANGUAGES):
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # spawn: WeasyPrint's native libraries and the caller's threads must not be forked
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context("spawn"),
+            initializer=_init_worker, initargs=(tuple(warm_languages),),
+        )
+
+    def submit(self, html, output_path, language="English"):
+        """
+        Queue a render
+
+        Args:
+            html (str): Document to render
+            output_path (str): Where the worker writes the PDF
+            language (str): PromptConfig language name, selects the stylesheet
+
+        Returns:
+            concurrent.futures.Future: Resolves to the worker's timings
+
+        Raises:
+            RenderQueueFull: No slot freed up within queue_timeout
+        """
+        queued = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            render_stats.add("rejected")
+            raise RenderQueueFull(f"More than {self.max_pending} PDF renders pending")
+        queue_wait_ms = (time.perf_counter() - queued) * 1000
+
+        try:
+            future = self._executor.submit(_render, html, output_path, language)
+        except Exception:
+            self._slots.release()
+            raise
+
+        def done(future):
+            self._slots.release()
+            if future.cancelled() or future.exception() is not None:
+                render_stats.add("failures")
+                return
+            render_stats.record(future.result(), queue_wait_ms, (time.perf_counter() - queued) * 1000)
+
+        future.add_done_callback(done)
+        return future
+
+    def render(self, html, output_path, language="English", timeout=None):
+        """
+        Render and wait for the result, up to timeout seconds (default: the
+        pool's timeout)
+
+        Returns:
+            dict: Worker timings (pages, stylesheet_ms, layout_ms, write_ms, ...)
+        """
+        with start_span("pdf.render", {"pdf.language": language, "pdf.html_chars": len(html)}) as span:
+            timings = self.submit(html, output_path, language).result(
+                timeout=self.timeout if timeout is None else timeout
+            )
+            span.set_attributes({f"pdf.{name}": value for name, value in timings.items()})
+            return timings
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_pdf_renderer = None
+_pdf_renderer_lock = threading.Lock()
+
+
+def get_pdf_renderer():
+    """
+    Get the shared render pool for this process, configured from
+    settings.PDF_RENDER_WORKERS, PDF_RENDER_MAX_PENDING,
+    PDF_RENDER_QUEUE_TIMEOUT and PDF_RENDER_TIMEOUT
+    """
+    global _pdf_renderer
+
+    with _pdf_renderer_lock:
+        if _pdf_renderer is None:
+            _pdf_renderer = PDFRenderer(
+                workers=settings.PDF_RENDER_WORKERS,
+                max_pending=settings.PDF_RENDER_MAX_PENDING,
+                queue_timeout=settings.PDF_RENDER_QUEUE_TIMEOUT,
+                timeout=settings.PDF_RENDER_TIMEOUT,
+            )
+    return _pdf_renderer
@@ -0,0 +1,161 @@
+"""
+Compact, columnar storage for the text spans of a PDF page.
+
+A span stored as a dict (text, bbox tuple, font, size, flags) costs several
+hundred bytes across its Python objects. SpanTable keeps a page's spans in
+typed arrays instead: bboxes and sizes as float32, flags and font indexes
+as integers, font names interned in a small per-page table, and all span
+text in one string sliced by offsets. Indexing returns a read-only Span
+mapping, so code written against the dict form keeps working.
+
+Coordinates and sizes are rounded to float32 precision (well under 0.01pt
+for page-sized values).
+"""
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+
+SPAN_KEYS = ("text", "bbox", "font", "size", "flags")
+
+
+class Span(Mapping):
+    """Read-only dict-like view of one span in a SpanTable"""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key):
+        table, index = self._table, self._index
+        if key == "text":
+            return table.text_at(index)
+        if key == "bbox":
+            return tuple(table._bboxes[index * 4:index * 4 + 4])
+        if key == "font":
+            return table.fonts[table._font_ids[index]]
+        if key == "size":
+            return table._sizes[index]
+        if key == "flags":
+            return table._flags[index]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(SPAN_KEYS)
+
+    def __len__(self):
+        return len(SPAN_KEYS)
+
+    def __repr__(self):
+        return f"Span({dict(self)!r})"
+
+
+class SpanTable(Sequence):
+    """
+    The spans of one page in columnar form
+
+    Build with append() (or from_spans()), then call freeze() to join the
+    text buffer; reads before freeze() also work, just more slowly.
+    """
+
+    __slots__ = ("fonts", "_font_ids_by_name", "_bboxes", "_sizes", "_flags", "_font_ids",
+                 "_offsets", "_text", "_pending_text")
+
+    def __init__(self):
+        self.fonts = []
+        self._font_ids_by_name = {}
+        self._bboxes = array("f")
+        self._sizes = array("f")
+        self._flags = array("I")
+        self._font_ids = array("H")
+        self._offsets = array("I", [0])
+        self._text = ""
+        self._pending_text = []
+
+    @classmethod
+    def from_spans(cls, spans):
+        table = cls()
+        for span in spans:
+            table.append(span["text"], span["bbox"], span["font"], span["size"], span["flags"])
+        return table.freeze()
+
+    def append(self, text, bbox, font, size, flags):
+        font_id = self._font_ids_by_name.get(font)
+        if font_id is None:
+            font_id = self._font_ids_by_name[font] = len(self.fonts)
+            self.fonts.append(sys.intern(font))
+
+        self._bboxes.extend(bbox)
+        self._sizes.append(size)
+        self._flags.append(flags)
+        self._font_ids.append(font_id)
+        self._pending_text.append(text)
+        self._offsets.append(self._offsets[-1] + len(text))
+
+    def freeze(self):
+        """Join appended text into the single text buffer"""
+        if self._pending_text:
+            self._text += "".join(self._pending_text)
+            self._pending_text = []
+        return self
+
+    def text_at(self, index):
+        self.freeze()
+        return self._text[self._offsets[index]:self._offsets[index + 1]]
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("span index out of range")
+        return Span(self, index)
+
+    def to_dicts(self):
+        """Spans as plain dicts, e.g. for JSON serialization"""
+        return [dict(span) for span in self]
+
+    def nbytes(self):
+        """
+        Approximate memory held by this table
+
+        Returns:
+            int: Bytes used by the arrays, text buffer and font table
+        """
+        self.freeze()
+        arrays = (self._bboxes, self._sizes, self._flags, self._font_ids, self._offsets)
+        total = sum(sys.getsizeof(column) for column in arrays)
+        total += sys.getsizeof(self._text) + sys.getsizeof(self.fonts)
+        total += sum(sys.getsizeof(font) for font in self.fonts)
+        return total
+
+    def __getstate__(self):
+        self.freeze()
+        return {slot: getattr(self, slot) for slot in self.__slots__ if slot != "_font_ids_by_name"}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self._font_ids_by_name = {font: font_id for font_id, font in enumerate(self.fonts)}
+
+
+def dict_spans_nbytes(spans):
+    """
+    Approximate memory held by spans in the dict form, for comparison
+
+    Returns:
+        int: Bytes used by the list, dicts and their values
+    """
+    total = sys.getsizeof(spans)
+    for span in spans:
+        total += sys.getsizeof(span)
+        total += sys.getsizeof(span["text"]) + sys.getsizeof(span["size"]) + sys.getsizeof(span["flags"])
+        total += sys.getsizeof(span["bbox"]) + sum(sys.getsizeof(value) for value in span["bbox"])
+        # Font names repeat; PyMuPDF returns a new string per span
+        total += sys.getsizeof(span["font"])
+    return total
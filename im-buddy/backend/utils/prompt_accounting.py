@@ -0,0 +1,136 @@
+"""
+Per-phase accounting of LLM prompt calls: counts, tokens, latency, errors.
+
+Calls are keyed by the settings names PromptConfig.get_settings uses
+("phase1_translation", "language_detection", ...), so phases that share
+settings are counted together. Token counts are the provider's reported
+usage when the response includes it and local estimates otherwise
+(reported_calls says how many were reported). Latency goes into a fixed
+bucket histogram, from which p50/p95 are read.
+
+The counters are rows of apps.metrics.models.PromptCallStats, one per
+phase and latency bucket, incremented in the database by each call; every
+worker process adds to the same rows, so the totals are the deployment's
+and outlive restarts.
+
+PromptManager records into prompt_accounting; GET /api/prompts/stats
+(admin only) returns its snapshot.
+"""
+from bisect import bisect_left
+
+from django.db import DatabaseError
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .prompt_config import PromptConfig
+
+# Upper bounds of the latency histogram buckets, in milliseconds; one more
+# bucket counts everything slower
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+COUNTERS = ("calls", "errors", "input_tokens", "output_tokens", "reported_calls")
+
+
+def _stats_model():
+    # Imported on use: utils is loaded by scripts and before the app registry
+    from apps.metrics.models import PromptCallStats
+    return PromptCallStats
+
+
+class PromptAccounting:
+    """Per-phase counters for prompt calls, shared by all workers through the database"""
+
+    def _new_phase(self):
+        return {
+            "calls": 0,
+            "errors": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "reported_calls": 0,
+            "latency_total_ms": 0.0,
+            "latency_max_ms": 0.0,
+            "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+        }
+
+    def record(self, phase, input_tokens, output_tokens, latency_ms, reported=False, error=False):
+        """
+        Record one prompt call
+
+        Args:
+            phase (str): Phase name; mapped to its PromptConfig settings key
+            input_tokens (int): Prompt tokens
+            output_tokens (int): Response tokens (0 for a failed call)
+            latency_ms (float): Wall time of the API call
+            reported (bool): Token counts came from the provider
+            error (bool): The call failed
+        """
+        model = _stats_model()
+        key = PromptConfig.settings_key(phase)
+        bucket = bisect_left(LATENCY_BUCKETS_MS, latency_ms)
+        changes = {
+            "calls": F("calls") + 1,
+            "errors": F("errors") + int(error),
+            "input_tokens": F("input_tokens") + input_tokens,
+            "output_tokens": F("output_tokens") + output_tokens,
+            "reported_calls": F("reported_calls") + int(reported),
+            "latency_total_ms": F("latency_total_ms") + latency_ms,
+            "latency_max_ms": Greatest("latency_max_ms", Value(float(latency_ms))),
+        }
+        rows = model.objects.filter(phase=key, bucket=bucket)
+        try:
+            # One UPDATE per call, so concurrent workers never lose a count
+            if not rows.update(**changes):
+                model.objects.get_or_create(phase=key, bucket=bucket)
+                rows.update(**changes)
+        except DatabaseError as e:
+            # Accounting must not fail the prompt call it accounts for
+            print(f"Error recording prompt stats for {key}: {e}")
+
+    @staticmethod
+    def _percentile(histogram, calls, fraction, latency_max_ms):
+        # Upper bound of the bucket holding the given rank
+        rank, seen = fraction * calls, 0
+        for index, count in enumerate(histogram):
+            seen += count
+            if count and seen >= rank:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else latency_max_ms
+        return 0.0
+
+    def snapshot(self):
+        phases = {}
+        for row in _stats_model().objects.all():
+            stats = phases.setdefault(row.phase, self._new_phase())
+            for counter in COUNTERS:
+                stats[counter] += getattr(row, counter)
+            stats["latency_total_ms"] += row.latency_total_ms
+            stats["latency_max_ms"] = max(stats["latency_max_ms"], row.latency_max_ms)
+            if row.bucket < len(stats["histogram"]):
+                stats["histogram"][row.bucket] += row.calls
+
+        result = {}
+        for key, stats in sorted(phases.items()):
+            calls = stats["calls"]
+            labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+            result[key] = {
+                "calls": calls,
+                "errors": stats["errors"],
+                "error_rate": stats["errors"] / calls if calls else 0.0,
+                "input_tokens": stats["input_tokens"],
+                "output_tokens": stats["output_tokens"],
+                "reported_calls": stats["reported_calls"],
+                "latency_ms": {
+                    "total": round(stats["latency_total_ms"], 1),
+                    "mean": round(stats["latency_total_ms"] / calls, 1) if calls else 0.0,
+                    "max": round(stats["latency_max_ms"], 1),
+                    "p50": self._percentile(stats["histogram"], calls, 0.5, stats["latency_max_ms"]),
+                    "p95": self._percentile(stats["histogram"], calls, 0.95, stats["latency_max_ms"]),
+                    "histogram": dict(zip(labels, stats["histogram"])),
+                },
+            }
+        return result
+
+    def reset(self):
+        _stats_model().objects.all().delete()
+
+
+prompt_accounting = PromptAccounting()
@@ -4,6 +4,8 @@ Configuration and settings for prompt management
 from typing import List
 from typing import Dict, Any
 
+from django.conf import settings
+
 class PromptConfig:
     """Configuration settings for Llama 4 prompts"""
 
@@ -23,6 +25,13 @@ class PromptConfig:
             "frequency_penalty": 0.1,
             "presence_penalty": 0.0
         },
+        "glossary": {
+            "temperature": 0.1,  # Same terms, same translations
+            "max_tokens": 2000,
+            "top_p": 0.7,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0
+        },
         "language_detection": {
             "temperature": 0.1,  # Very low for consistency
             "max_tokens": 500,
@@ -37,6 +46,13 @@ class PromptConfig:
             "frequency_penalty": 0.0,
             "presence_penalty": 0.0
         },
+        "field_residue": {
+            "temperature": 0.2,
+            "max_tokens": 1500,
+            "top_p": 0.8,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0
+        },
         "input_extraction": {
             "temperature": 0.2,
             "max_tokens": 3000,
@@ -54,6 +70,14 @@ class PromptConfig:
     }
 
     # Supported languages with their characteristics
+    # How each phase embeds structured data (see prompt_encoding.py);
+    # override one with e.g. PROMPT_ENCODING_PHASE1=pretty (settings.PROMPT_ENCODINGS)
+    PAYLOAD_ENCODINGS = {
+        "phase1": "table",             # form_fields: one row per field
+        "phase2": "table",             # form structure fields as rows, user inputs compact
+        "input_extraction": "table",   # original_fields
+    }
+
     SUPPORTED_LANGUAGES = {
         "English": {"code": "en", "rtl": False, "date_format": "MM/DD/YYYY"},
         "Spanish": {"code": "es", "rtl": False, "date_format": "DD/MM/YYYY"},
@@ -129,21 +153,34 @@ class PromptConfig:
         }
     }
 
+    # Map phase names to settings
+    PHASE_SETTINGS = {
+        "phase1": "phase1_translation",
+        "phase2": "phase2_translation",
+        "glossary": "glossary",
+        "language_detection": "language_detection",
+        "field_extraction": "field_extraction",
+        "field_residue": "field_residue",
+        "input_extraction": "input_extraction",
+        "quality_check": "quality_check"
+    }
+
+    @classmethod
+    def settings_key(cls, prompt_type: str) -> str:
+        """Get the PROMPT_SETTINGS name a prompt type uses"""
+        return cls.PHASE_SETTINGS.get(prompt_type, prompt_type)
+
     @classmethod
     def get_settings(cls, prompt_type: str) -> Dict[str, Any]:
         """Get settings for a specific prompt type"""
-        # Map phase names to settings
-        phase_mapping = {
-            "phase1": "phase1_translation",
-            "phase2": "phase2_translation",
-            "language_detection": "language_detection",
-            "field_extraction": "field_extraction",
-            "input_extraction": "input_extraction",
-            "quality_check": "quality_check"
-        }
+        return cls.PROMPT_SETTINGS.get(cls.settings_key(prompt_type), cls.PROMPT_SETTINGS["phase1_translation"])
 
-        settings_key = phase_mapping.get(prompt_type, prompt_type)
-        return cls.PROMPT_SETTINGS.get(settings_key, cls.PROMPT_SETTINGS["phase1_translation"])
+    @classmethod
+    def get_payload_encoding(cls, phase: str) -> str:
+        """Get the encoding a phase uses for structured data in its prompt"""
+        # Outside Django (benchmarks, scripts) the defaults apply
+        encodings = settings.PROMPT_ENCODINGS if settings.configured else cls.PAYLOAD_ENCODINGS
+        return encodings.get(phase, "compact")
 
     @classmethod
     def get_language_info(cls, language: str) -> Dict[str, Any]:
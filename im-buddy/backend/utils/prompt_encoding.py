@@ -0,0 +1,108 @@
+"""
+Encodings for the structured data embedded in prompts.
+
+The prompt builders in prompts.py embed field lists, form structures and
+user inputs as JSON. Indented JSON repeats every key for every field and
+spends a large share of the input tokens on whitespace, so each phase
+picks one of three encodings (PromptConfig.PAYLOAD_ENCODINGS):
+
+    pretty   json.dumps(indent=2), the original format
+    compact  minified JSON, non-ASCII text left unescaped
+    table    lists of objects as a header line plus one "|"-separated row
+             per object, columns that are empty in every row left out;
+             objects holding such lists get one table per list; anything
+             else is encoded as compact
+
+    field_id|field_label|field_type|required|page
+    f1|Family Name|text|true|1
+"""
+import json
+
+from .prompt_config import PromptConfig
+
+ENCODING_PRETTY = "pretty"
+ENCODING_COMPACT = "compact"
+ENCODING_TABLE = "table"
+ENCODINGS = (ENCODING_PRETTY, ENCODING_COMPACT, ENCODING_TABLE)
+
+TABLE_NOTE = "(table: first line names the columns, one row per item, cells separated by |)"
+
+
+def _compact(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _is_empty(value):
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _cell(value):
+    if value is None or value == [] or value == {}:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        # Quote anything that would break the row or read as another type
+        if value == "" or "|" in value or "\n" in value or value != value.strip() or value in ("true", "false"):
+            return _compact(value)
+        return value
+    return _compact(list(value) if isinstance(value, tuple) else value)
+
+
+def is_table(value):
+    """Whether value can be encoded as a table: a non-empty list of objects"""
+    return isinstance(value, (list, tuple)) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def encode_table(rows):
+    """
+    Encode a list of objects as a header line plus one row per object
+
+    Args:
+        rows (list): Dicts; a key missing from a row is an empty cell
+
+    Returns:
+        str: The table, without TABLE_NOTE
+    """
+    columns = []
+    for row in rows:
+        columns.extend(key for key in row if key not in columns)
+    columns = [column for column in columns if not all(_is_empty(row.get(column)) for row in rows)]
+    lines = ["|".join(columns)]
+    lines.extend("|".join(_cell(row.get(column)) for column in columns) for row in rows)
+    return "\n".join(lines)
+
+
+def encode_payload(value, encoding=ENCODING_PRETTY):
+    """
+    Encode structured prompt data
+
+    Args:
+        value: JSON-serializable data
+        encoding (str): One of ENCODINGS
+
+    Returns:
+        str: The encoded data
+    """
+    if encoding == ENCODING_PRETTY:
+        return json.dumps(value, indent=2)
+    if encoding == ENCODING_COMPACT:
+        return _compact(value)
+    if encoding == ENCODING_TABLE:
+        if is_table(value):
+            return f"{TABLE_NOTE}\n{encode_table(value)}"
+        if isinstance(value, dict) and any(is_table(item) for item in value.values()):
+            # One section per key, so nested field lists still get tables
+            return "\n".join(
+                f"{key}:\n{encode_table(item)}" if is_table(item) else f"{key}: {_compact(item)}"
+                for key, item in value.items()
+            ) + f"\n{TABLE_NOTE}"
+        return _compact(value)
+    raise ValueError(f"Unknown prompt encoding: {encoding}. Available: {list(ENCODINGS)}")
+
+
+def encoding_for(phase, encoding=None):
+    """The encoding to use for a phase: the one given, else PromptConfig's"""
+    return encoding or PromptConfig.get_payload_encoding(phase)
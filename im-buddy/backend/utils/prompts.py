@@ -2,63 +2,47 @@
 Llama 4 Prompt Templates for Immigration Form Translation System
 """
 
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
 import json
 import logging
 from datetime import datetime
 
-class ImmigrationFormPrompts:
-    """
-    Centralized prompt management for immigration form translation
-    """
+from .prompt_accounting import prompt_accounting
+from .prompt_encoding import encode_payload, encoding_for
+from .tokens import estimate_tokens
 
-    @staticmethod
-    def phase1_translation_prompt(
-            form_content: str,
-            form_fields: List[Dict[str, Any]],
-            form_metadata: Dict[str, Any],
-            target_language: str,
-            original_language: Optional[str] = None
-    ) -> str:
-        """
-        Phase 1: Translate foreign immigration form to user's language
-        """
-
-        language_context = f"from {original_language} " if original_language else ""
 
-        return f"""
+# Static instruction blocks, one per phase. A prompt is its phase's block,
+# formatted for the request's language, followed by the request's data, so
+# every request for the same (phase, language) starts with byte-identical
+# text that provider-side prompt caching can reuse. Keep request-specific
+# values out of the blocks; they belong in the data section.
+INSTRUCTIONS = {
+    "phase1": """
 IMMIGRATION FORM TRANSLATION - PHASE 1
-{language_context}to {target_language}
-
-=== ORIGINAL FORM CONTENT ===
-{form_content}
-
-=== FORM STRUCTURE ===
-Total Pages: {form_metadata.get('total_pages', 'Unknown')}
-Document Title: {form_metadata.get('title', 'Immigration Form')}
-
-Form Fields Detected:
-{json.dumps(form_fields, indent=2)}
+Translate an immigration form to {language}
 
 === TRANSLATION REQUIREMENTS ===
 
-TARGET LANGUAGE: {target_language}
+TARGET LANGUAGE: {language}
 
 CRITICAL INSTRUCTIONS:
-1. **COMPLETE TRANSLATION**: Translate ALL text content to {target_language}
+1. **COMPLETE TRANSLATION**: Translate ALL text content to {language}
 2. **PRESERVE STRUCTURE**: Maintain exact formatting, spacing, and layout
 3. **FIELD INTEGRITY**: Keep field names/IDs unchanged for technical compatibility
-4. **LEGAL ACCURACY**: Use official immigration terminology in {target_language}
-5. **CULTURAL ADAPTATION**: Use appropriate date formats and conventions for {target_language}
+4. **LEGAL ACCURACY**: Use official immigration terminology in {language}
+5. **CULTURAL ADAPTATION**: Use appropriate date formats and conventions for {language}
 
 SPECIFIC TRANSLATION GUIDELINES:
 - Form titles and headers: Translate completely
 - Field labels and descriptions: Translate with legal precision
-- Instructions and help text: Make clear and understandable in {target_language}
+- Instructions and help text: Make clear and understandable in {language}
 - Legal disclaimers: Use official legal language
-- Country/place names: Use standard {target_language} conventions
-- Dates: Show both original format and {target_language} format explanation
-- Numbers: Use appropriate decimal/thousand separators for {target_language}
+- Country/place names: Use standard {language} conventions
+- Dates: Show both original format and {language} format explanation
+- Numbers: Use appropriate decimal/thousand separators for {language}
+- Glossary terms (if a glossary is given): Use exactly the glossary translation
 
 TECHNICAL REQUIREMENTS:
 - Preserve all form field positioning and structure
@@ -82,42 +66,19 @@ Original Field Label → Translated Label (Technical Field Name)
 TRANSLATION NOTES:
 - Any complex terms that needed special consideration
 - Cultural adaptations made
-- Format changes for {target_language} conventions
-"""
+- Format changes for {language} conventions
+""",
 
-    @staticmethod
-    def phase2_reverse_translation_prompt(
-            original_form_structure: Dict[str, Any],
-            user_inputs: Dict[str, Any],
-            user_language: str,
-            target_country: Optional[str] = None
-    ) -> str:
-        """
-        Phase 2: Translate user inputs back to original form language
-        """
-
-        country_context = f" for {target_country}" if target_country else ""
-
-        return f"""
+    "phase2": """
 IMMIGRATION FORM TRANSLATION - PHASE 2
-Reverse Translation: {user_language} → Original Language{country_context}
-
-=== ORIGINAL FORM STRUCTURE ===
-{json.dumps(original_form_structure, indent=2)}
-
-=== USER INPUT DATA (in {user_language}) ===
-{json.dumps(user_inputs, indent=2)}
-
-Form Completion Status: {user_inputs.get('completion_percentage', 'Unknown')}%
-Filled Fields: {len(user_inputs.get('filled_fields', {}))}
-Empty Fields: {user_inputs.get('empty_fields', [])}
+Reverse Translation: {language} → Original Language
 
 === REVERSE TRANSLATION REQUIREMENTS ===
 
 CRITICAL OBJECTIVES:
 1. **PERFECT MAPPING**: Map each user input to correct original form field
 2. **LINGUISTIC ACCURACY**: Translate user data to original form language
-3. **LEGAL COMPLIANCE**: Ensure translations meet official standards{country_context}
+3. **LEGAL COMPLIANCE**: Ensure translations meet official standards of the destination country
 4. **DATA INTEGRITY**: Preserve all user information accurately
 5. **FORMAT COMPLIANCE**: Match original country's data formats
 
@@ -148,7 +109,7 @@ VALIDATION REQUIREMENTS:
 - Validate data formats match original form requirements
 - Check conditional logic is satisfied
 
-COUNTRY-SPECIFIC FORMATTING{country_context}:
+COUNTRY-SPECIFIC FORMATTING (destination country, if given below):
 - Date formats: Use standard format for destination country
 - Address formats: Follow postal conventions
 - Phone formats: Use national numbering conventions
@@ -168,20 +129,23 @@ OUTPUT REQUIREMENTS:
 4. Recommendations for any missing information
 
 FINAL FORM: Return the completed immigration form in the original language, ready for official submission.
-"""
+""",
 
-    @staticmethod
-    def language_detection_prompt(text_sample: str) -> str:
-        """
-        Detect the language of a document
-        """
-        return f"""
-LANGUAGE DETECTION FOR IMMIGRATION DOCUMENT
+    "glossary": """
+IMMIGRATION FORM GLOSSARY
+Translate to {language}
 
-TEXT SAMPLE:
-{text_sample}
+TASK: The terms below are labels, headings and phrases that recur throughout one immigration
+form. Translate each into {language} using official immigration terminology. The form is
+translated in several parts, and every part will use exactly these translations.
 
-TASK: Identify the primary language of this immigration document.
+OUTPUT: A JSON object mapping each term, unchanged, to its translation. Nothing else.
+""",
+
+    "language_detection": """
+LANGUAGE DETECTION FOR IMMIGRATION DOCUMENT
+
+TASK: Identify the primary language of the immigration document sampled below.
 
 INSTRUCTIONS:
 1. Analyze the text sample for language patterns
@@ -196,20 +160,12 @@ Secondary Languages: [If any detected]
 Country Context: [If identifiable from legal terminology]
 
 Focus on immigration and legal document context for accurate identification.
-"""
+""",
 
-    @staticmethod
-    def field_extraction_prompt(form_content: str) -> str:
-        """
-        Extract and analyze form fields from document
-        """
-        return f"""
+    "field_extraction": """
 IMMIGRATION FORM FIELD ANALYSIS
 
-DOCUMENT CONTENT:
-{form_content}
-
-ANALYSIS TASK: Extract and categorize all form fields from this immigration document.
+ANALYSIS TASK: Extract and categorize all form fields from the immigration document below.
 
 EXTRACTION REQUIREMENTS:
 1. **IDENTIFY ALL FIELDS**: Find every input field, checkbox, dropdown, text area
@@ -250,27 +206,27 @@ COMPLEXITY ASSESSMENT:
 - Difficulty level (1-10)
 
 OUTPUT: Structured JSON with complete field analysis and form metadata.
-"""
+""",
 
-    @staticmethod
-    def user_input_extraction_prompt(
-            original_fields: List[Dict[str, Any]],
-            filled_form_content: str,
-            user_language: str
-    ) -> str:
-        """
-        Extract user inputs from filled form
-        """
-        return f"""
-USER INPUT EXTRACTION FROM FILLED FORM
+    "field_residue": """
+IMMIGRATION FORM FIELD ANALYSIS - UNRESOLVED LINES
 
-ORIGINAL FORM FIELDS:
-{json.dumps(original_fields, indent=2)}
+TASK: Each unresolved line below is a label from an immigration form that may or may not
+introduce an input field. For each line that is a field, provide:
+- field_label: the label text
+- field_type: text/number/date/select/checkbox/radio/textarea
+- required: true/false
+- section: which part of the form it belongs to, if evident
 
-FILLED FORM CONTENT (in {user_language}):
-{filled_form_content}
+Skip lines that are captions, instructions or pre-filled values, and fields already detected.
+
+OUTPUT: JSON array of field objects only.
+""",
 
-EXTRACTION TASK: Extract all user-provided data from the filled form.
+    "input_extraction": """
+USER INPUT EXTRACTION FROM FILLED FORM
+
+EXTRACTION TASK: Extract all user-provided data from the filled form below.
 
 EXTRACTION REQUIREMENTS:
 1. **MAP TO ORIGINAL FIELDS**: Match user inputs to original field structure
@@ -314,28 +270,12 @@ VALIDATION CHECKS:
 - Phone number format validation
 - Document number format validation
 - Conditional field logic satisfaction
-"""
+""",
 
-    @staticmethod
-    def translation_quality_check_prompt(
-            original_text: str,
-            translated_text: str,
-            source_language: str,
-            target_language: str
-    ) -> str:
-        """
-        Quality check for translations
-        """
-        return f"""
+    "quality_check": """
 TRANSLATION QUALITY ASSESSMENT
 
-SOURCE ({source_language}):
-{original_text}
-
-TRANSLATION ({target_language}):
-{translated_text}
-
-QUALITY ASSESSMENT TASK: Evaluate the translation quality for immigration document standards.
+QUALITY ASSESSMENT TASK: Evaluate the quality of the translation below for immigration document standards.
 
 ASSESSMENT CRITERIA:
 1. **ACCURACY**: Meaning preservation and correctness
@@ -384,6 +324,188 @@ ASSESSMENT OUTPUT:
 }}
 
 RECOMMENDATION: Provide overall assessment and improvement suggestions.
+""",
+}
+
+
+@lru_cache(maxsize=None)
+def static_prefix(phase: str, language: str = "") -> str:
+    """
+    The fixed instruction block a phase's prompts start with, rendered once
+    per (phase, language) and memoized
+    """
+    if phase not in INSTRUCTIONS:
+        raise ValueError(f"Unknown phase: {phase}. Available: {list(INSTRUCTIONS.keys())}")
+    return INSTRUCTIONS[phase].format(language=language)
+
+
+class ImmigrationFormPrompts:
+    """
+    Centralized prompt management for immigration form translation
+
+    Every builder returns static_prefix(phase, language) followed by the
+    request's data under "=== ... ===" headings.
+    """
+
+    @staticmethod
+    def phase1_translation_prompt(
+            form_content: str,
+            form_fields: List[Dict[str, Any]],
+            form_metadata: Dict[str, Any],
+            target_language: str,
+            original_language: Optional[str] = None,
+            glossary: Optional[Dict[str, str]] = None,
+            encoding: Optional[str] = None
+    ) -> str:
+        """
+        Phase 1: Translate foreign immigration form to user's language
+
+        A long form is translated in chunks (see utils.chunking); then
+        form_metadata["chunk"] says which part this is, and glossary gives
+        the translations every chunk must use. encoding overrides the
+        phase's PromptConfig payload encoding.
+        """
+
+        chunk_context = f"\nThis is {form_metadata['chunk']} of the form; translate only this part." \
+            if form_metadata.get('chunk') else ""
+        glossary_section = (
+            "\n=== GLOSSARY ===\n"
+            + "\n".join(f"{term} → {translation}" for term, translation in glossary.items())
+            + "\n"
+        ) if glossary else ""
+
+        return static_prefix("phase1", target_language) + f"""
+=== FORM STRUCTURE ===
+Original Language: {original_language or 'Unknown'}
+Total Pages: {form_metadata.get('total_pages', 'Unknown')}
+Document Title: {form_metadata.get('title', 'Immigration Form')}{chunk_context}
+
+Form Fields Detected:
+{encode_payload(form_fields, encoding_for("phase1", encoding))}
+{glossary_section}
+=== ORIGINAL FORM CONTENT ===
+{form_content}
+"""
+
+    @staticmethod
+    def phase2_reverse_translation_prompt(
+            original_form_structure: Dict[str, Any],
+            user_inputs: Dict[str, Any],
+            user_language: str,
+            target_country: Optional[str] = None,
+            encoding: Optional[str] = None
+    ) -> str:
+        """
+        Phase 2: Translate user inputs back to original form language
+        """
+
+        encoding = encoding_for("phase2", encoding)
+        # Completion and empty fields are stated below; don't send them twice
+        user_data = {
+            key: value for key, value in user_inputs.items()
+            if key not in ("completion_percentage", "empty_fields")
+        }
+
+        return static_prefix("phase2", user_language) + f"""
+=== DESTINATION COUNTRY ===
+{target_country or 'Not specified'}
+
+=== ORIGINAL FORM STRUCTURE ===
+{encode_payload(original_form_structure, encoding)}
+
+=== USER INPUT DATA (in {user_language}) ===
+{encode_payload(user_data, encoding)}
+
+Form Completion Status: {user_inputs.get('completion_percentage', 'Unknown')}%
+Filled Fields: {len(user_inputs.get('filled_fields', {}))}
+Empty Fields: {user_inputs.get('empty_fields', [])}
+"""
+
+    @staticmethod
+    def glossary_prompt(
+            terms: List[str],
+            target_language: str,
+            original_language: Optional[str] = None
+    ) -> str:
+        """
+        Translate a form's recurring terms once, before its chunks are translated
+        """
+        term_list = "\n".join(f"- {term}" for term in terms)
+        return static_prefix("glossary", target_language) + f"""
+=== TERMS ({original_language or 'original language'}) ===
+{term_list}
+"""
+
+    @staticmethod
+    def language_detection_prompt(text_sample: str) -> str:
+        """
+        Detect the language of a document
+        """
+        return static_prefix("language_detection") + f"""
+=== TEXT SAMPLE ===
+{text_sample}
+"""
+
+    @staticmethod
+    def field_extraction_prompt(form_content: str) -> str:
+        """
+        Extract and analyze form fields from document
+        """
+        return static_prefix("field_extraction") + f"""
+=== DOCUMENT CONTENT ===
+{form_content}
+"""
+
+    @staticmethod
+    def field_residue_prompt(residue_text: str, detected_fields: List[Dict[str, Any]]) -> str:
+        """
+        Classify only the form lines local field detection could not resolve
+        """
+        known_labels = "\n".join(
+            f"- {field['field_label']} ({field['field_type']})" for field in detected_fields
+        )
+        return static_prefix("field_residue") + f"""
+=== FIELDS ALREADY DETECTED (do not repeat) ===
+{known_labels or "- none"}
+
+=== UNRESOLVED LINES ===
+{residue_text}
+"""
+
+    @staticmethod
+    def user_input_extraction_prompt(
+            original_fields: List[Dict[str, Any]],
+            filled_form_content: str,
+            user_language: str,
+            encoding: Optional[str] = None
+    ) -> str:
+        """
+        Extract user inputs from filled form
+        """
+        return static_prefix("input_extraction") + f"""
+=== ORIGINAL FORM FIELDS ===
+{encode_payload(original_fields, encoding_for("input_extraction", encoding))}
+
+=== FILLED FORM CONTENT (in {user_language}) ===
+{filled_form_content}
+"""
+
+    @staticmethod
+    def translation_quality_check_prompt(
+            original_text: str,
+            translated_text: str,
+            source_language: str,
+            target_language: str
+    ) -> str:
+        """
+        Quality check for translations
+        """
+        return static_prefix("quality_check") + f"""
+=== SOURCE ({source_language}) ===
+{original_text}
+
+=== TRANSLATION ({target_language}) ===
+{translated_text}
 """
 
     @staticmethod
@@ -397,8 +519,10 @@ RECOMMENDATION: Provide overall assessment and improvement suggestions.
         prompt_map = {
             "phase1": ImmigrationFormPrompts.phase1_translation_prompt,
             "phase2": ImmigrationFormPrompts.phase2_reverse_translation_prompt,
+            "glossary": ImmigrationFormPrompts.glossary_prompt,
             "language_detection": ImmigrationFormPrompts.language_detection_prompt,
             "field_extraction": ImmigrationFormPrompts.field_extraction_prompt,
+            "field_residue": ImmigrationFormPrompts.field_residue_prompt,
             "input_extraction": ImmigrationFormPrompts.user_input_extraction_prompt,
             "quality_check": ImmigrationFormPrompts.translation_quality_check_prompt
         }
@@ -470,18 +594,37 @@ class PromptManager:
             prompt_package: Dict[str, Any],
             response: str,
             execution_time: float,
-            token_usage: Optional[int] = None
+            token_usage: Optional[Dict[str, Optional[int]]] = None
     ):
         """
-        Log prompt execution for analysis and optimization
+        Record a prompt execution in the per-phase accounting and log it
+
+        Args:
+            prompt_package: Output of prepare_prompt
+            response: The model's reply
+            execution_time: Seconds the API call took
+            token_usage: input_tokens/output_tokens as reported by the
+                provider (see tokens.usage_from_response); counts it
+                doesn't report are estimated locally
         """
+        token_usage = token_usage or {}
+        input_tokens = token_usage.get("input_tokens")
+        output_tokens = token_usage.get("output_tokens")
+        prompt_accounting.record(
+            prompt_package["phase"],
+            input_tokens if input_tokens is not None else estimate_tokens(prompt_package["prompt"]),
+            output_tokens if output_tokens is not None else estimate_tokens(response),
+            execution_time * 1000,
+            reported=input_tokens is not None and output_tokens is not None,
+        )
+
         if not self.log_prompts:
             return
 
         log_entry = {
             "phase": prompt_package["phase"],
             "execution_time": execution_time,
-            "token_usage": token_usage,
+            "token_usage": token_usage or None,
             "response_length": len(response),
             "timestamp": datetime.now().isoformat(),
             "success": True
@@ -489,6 +632,21 @@ class PromptManager:
 
         self.logger.info(f"Prompt executed: {json.dumps(log_entry)}")
 
+    def log_prompt_failure(
+            self,
+            prompt_package: Dict[str, Any],
+            error: Exception,
+            execution_time: float
+    ):
+        """
+        Record a failed prompt execution in the per-phase accounting and log it
+        """
+        prompt_accounting.record(
+            prompt_package["phase"], estimate_tokens(prompt_package["prompt"]), 0, execution_time * 1000, error=True
+        )
+        if self.log_prompts:
+            self.logger.error(f"Prompt failed for phase {prompt_package['phase']}: {error}")
+
     def optimize_prompt_for_language(
             self,
             prompt_text: str,
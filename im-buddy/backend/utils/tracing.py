@@ -0,0 +1,268 @@
+"""
+Lightweight span tracing, OpenTelemetry-compatible on the wire.
+
+A trace is started per HTTP request (im_buddy.tracing.TracingMiddleware)
+and spans are opened around the slow parts underneath it - LLM calls,
+Supabase queries, database queries, PDF parsing and rendering - with
+start_span() or the @traced decorator. The current span lives in a
+context variable, so nesting follows the call stack; work handed to a
+thread pool keeps its parent if submitted through in_current_context().
+
+Trace and span IDs, and the traceparent header read from and written to
+requests, follow W3C Trace Context. Finished spans are exported as one
+JSON object per line in the OTLP/JSON span shape (traceId, spanId,
+parentSpanId, name, startTimeUnixNano, endTimeUnixNano, attributes,
+status), so a collector's file receiver or a script can ingest them:
+
+    TRACE_EXPORTER=console   log spans to the "im_buddy.tracing" logger
+    TRACE_EXPORTER=file      append spans to TRACE_FILE
+    TRACE_EXPORTER=none      drop them
+
+TRACE_SAMPLE_RATE (0.0 - 1.0) is the fraction of new traces recorded; an
+incoming traceparent's sampled flag is honored instead. Unsampled traces
+cost a context variable lookup per span and still carry a request ID for
+logs.
+
+These are Django settings (im_buddy/settings.py); the tracer is built
+from them on first use, so .env values apply. Outside Django (scripts,
+benchmarks without django.setup()) nothing is exported.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+EXPORTERS = ("console", "file", "none")
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+STATUS_OK = "STATUS_CODE_OK"
+STATUS_ERROR = "STATUS_CODE_ERROR"
+
+logger = logging.getLogger("im_buddy.tracing")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _random_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    """
+    One timed operation in a trace
+
+    Only spans of sampled traces are exported; unsampled ones still carry
+    their trace and request IDs but record nothing.
+    """
+
+    def __init__(self, tracer, name, trace_id, parent_id=None, sampled=True, attributes=None,
+                 request_id=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.request_id = request_id or trace_id
+        self.span_id = _random_id(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_OK
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        if self.sampled:
+            self.attributes.update(attributes)
+
+    def record_exception(self, error):
+        self.status = STATUS_ERROR
+        self.status_message = str(error)
+        self.set_attributes({"exception.type": type(error).__name__, "exception.message": str(error)})
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.sampled:
+                self.tracer.export(self)
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": self.status},
+            "resource": {"service.name": self.tracer.service_name},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class Tracer:
+    """
+    Args:
+        sample_rate (float): Fraction of new traces recorded
+        exporter (str): "console", "file" or "none"
+        path (str): Output file of the file exporter
+        service_name (str): resource service.name of every span
+    """
+
+    def __init__(self, sample_rate=0.0, exporter="console", path="traces.jsonl", service_name="im-buddy"):
+        if exporter not in EXPORTERS:
+            raise ValueError(f"Unknown trace exporter: {exporter}")
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.path = path
+        self.service_name = service_name
+        self._file_lock = threading.Lock()
+
+    def export(self, span):
+        if self.exporter == "none":
+            return
+        line = json.dumps(span.to_dict(), default=str)
+        if self.exporter == "console":
+            logger.info(line, extra={"request_id": span.request_id})
+            return
+        with self._file_lock:
+            with open(self.path, "a", encoding="utf-8") as output:
+                output.write(line + "\n")
+
+    def new_span(self, name, attributes=None, traceparent=None, request_id=None):
+        """
+        Create a span under the current one, or start a trace
+
+        Args:
+            name (str): Span name
+            attributes (dict): Initial attributes
+            traceparent (str): Incoming W3C traceparent header, used when
+                there is no current span
+            request_id (str): Request ID of a new trace (default: its trace ID)
+
+        Returns:
+            Span: Started span; not current until activated (see start_span)
+        """
+        parent = _current_span.get()
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id, parent.sampled, attributes,
+                        parent.request_id)
+
+        match = TRACEPARENT.match((traceparent or "").strip().lower())
+        if match:
+            trace_id, parent_id, flags = match.groups()
+            return Span(self, name, trace_id, parent_id, bool(int(flags, 16) & 1), attributes, request_id)
+        return Span(self, name, _random_id(128), sampled=random.random() < self.sample_rate,
+                    attributes=attributes, request_id=request_id)
+
+
+def _tracer_from_settings():
+    if not settings.configured:
+        return Tracer(exporter="none")
+    return Tracer(settings.TRACE_SAMPLE_RATE, settings.TRACE_EXPORTER, settings.TRACE_FILE,
+                  settings.TRACE_SERVICE_NAME)
+
+
+# Built on first use: this module is imported while settings are loading
+tracer = SimpleLazyObject(_tracer_from_settings)
+
+
+def current_span():
+    """The active span, or None outside any trace"""
+    return _current_span.get()
+
+
+def current_request_id():
+    """The request ID of the active trace, or None"""
+    span = _current_span.get()
+    return span.request_id if span else None
+
+
+@contextmanager
+def activate(span):
+    """Make span current for the block and end it afterwards, recording any exception"""
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def start_span(name, attributes=None, traceparent=None, request_id=None):
+    """
+    Context manager: run the block in a new span
+
+        with start_span("supabase.fetch", {"db.table": table_name}) as span:
+            ...
+            span.set_attribute("db.rows", len(rows))
+    """
+    return activate(tracer.new_span(name, attributes, traceparent, request_id))
+
+
+def traced(name=None, **attributes):
+    """
+    Decorator: run each call of the function (sync or async) in a span
+    named name, or the function's qualified name
+    """
+
+    def decorate(fn):
+        span_name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(span_name, attributes):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name, attributes):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def in_current_context(fn):
+    """
+    Wrap fn to run in a copy of the caller's context, so spans it opens on
+    another thread (thread pools, on_commit callbacks) keep their parent
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, fn)
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current request ID as record.request_id ("-" outside a request)"""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = current_request_id() or "-"
+        return True
@@ -13,6 +13,8 @@ interface UploadProgress {
 }
 
 interface FileMetadata {
+    jobId: string
+    totalFiles: number
     chunkIndex: number
     totalChunks: number
     fileName: string
@@ -20,6 +22,27 @@ interface FileMetadata {
     compressedSize: number
 }
 
+const API_URL = "http://localhost:8000/api"
+
+function getCookie(name: string): string | null {
+  const match = document.cookie.match(new RegExp(`(?:^|; )${name}=([^;]*)`))
+  return match ? decodeURIComponent(match[1]) : null
+}
+
+// Uploads are authenticated by the session cookie, so Django requires the
+// csrftoken cookie echoed in X-CSRFToken. Any upload-chunk response sets the
+// cookie; a resume check is enough to get one before the first POST.
+async function getCsrfToken(jobId: string, fileName: string): Promise<string> {
+  let token = getCookie("csrftoken")
+  if (!token) {
+    const params = new URLSearchParams({ jobId, fileName })
+    await fetch(`${API_URL}/upload-chunk?${params}`, { credentials: "include" })
+    token = getCookie("csrftoken")
+  }
+  if (!token) throw new Error("Upload failed: no CSRF token")
+  return token
+}
+
 export function useUploadDocument() {
   const [uploadState, setUploadState] = React.useState({
     status: "idle",
@@ -32,7 +55,7 @@ export function useUploadDocument() {
       compressionRatio: 0,
       uploadSpeed: 0,
     },
-    jobId: null,
+    jobId: null as string | null,
     error: null,
   })
 
@@ -48,9 +71,11 @@ export function useUploadDocument() {
       formData.append("chunk", new Blob([chunk]))
       formData.append("metadata", JSON.stringify(metadata))
 
-      const response = await fetch("http://localhost:8000/api/upload-chunk", {
+      const response = await fetch(`${API_URL}/upload-chunk`, {
         method: "POST",
         body: formData,
+        credentials: "include",
+        headers: { "X-CSRFToken": await getCsrfToken(metadata.jobId, metadata.fileName) },
       })
       if (!response.ok) throw new Error("Upload failed")
       return response.json()
@@ -66,7 +91,12 @@ export function useUploadDocument() {
 
  
 
-  async function uploadWithMetrics(file: File, onProgress: (progress: Partial<UploadProgress>) => void) {
+  async function uploadWithMetrics(
+    file: File,
+    jobId: string,
+    totalFiles: number,
+    onProgress: (progress: Partial<UploadProgress>) => void,
+  ) {
     const chunkSize = 5 * 1024 * 1024 //5mb
     const totalChunks = Math.ceil(file.size / chunkSize)
     let totalOriginalSize = 0
@@ -90,6 +120,8 @@ export function useUploadDocument() {
       await uploadChunkMutation.mutateAsync({
         chunk: compressedChunk,
         metadata: {
+          jobId,
+          totalFiles,
           chunkIndex: i + 1,
           totalChunks,
           fileName: file.name,
@@ -119,13 +151,14 @@ export function useUploadDocument() {
       ...prev,
       status: "pending",
       progress: { ...prev.progress, totalFiles: files.length },
+      jobId,
     }))
 
     try {
       for (let fileIndex = 0; fileIndex < files.length; fileIndex++) {
         const file = files[fileIndex]
 
-        await uploadWithMetrics(file, (progress) => {
+        await uploadWithMetrics(file, jobId, files.length, (progress) => {
           setUploadState((prev) => ({
             ...prev,
             progress: {
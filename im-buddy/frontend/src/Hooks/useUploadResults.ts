@@ -1,21 +1,55 @@
-import {useQuery} from "@tanstack/react-query"
+import React from "react"
+import {useQuery, useQueryClient} from "@tanstack/react-query"
 
-//This hook will re-fetch the upload results every 2 seconds until the upload is complete or fails
-//It will also refetch in the background if the user navigates away from the page
-//It will retry up to 3 times with an exponential backoff
+function isFinished(data: any) {
+    return data?.status === 'complete' || data?.status === 'error'
+}
+
+//This hook follows an upload job through the server-sent events stream at /api/upload/<jobId>/events,
+//writing each status event into the query cache as it arrives
+//While the stream is not connected (unsupported, or reconnecting) it falls back to polling every 2 seconds,
+//also in the background if the user navigates away from the page
+//Fetches retry up to 3 times with an exponential backoff
 export function useUploadResults( jobId: string, enabled: boolean = false) {
+    const queryClient = useQueryClient()
+    const [streaming, setStreaming] = React.useState(false)
+
+    React.useEffect(() => {
+        if (!enabled || !jobId || typeof EventSource === 'undefined') {
+            return
+        }
+        const source = new EventSource(`/api/upload/${jobId}/events`, {withCredentials: true})
+        source.onopen = () => setStreaming(true)
+        //EventSource reconnects by itself (resuming from the last event id); poll until it does
+        source.onerror = () => setStreaming(false)
+        source.addEventListener('status', (event) => {
+            const state = JSON.parse((event as MessageEvent).data)
+            queryClient.setQueryData(['upload', jobId], (previous: any) => ({...previous, ...state}))
+            if (isFinished(state)) {
+                source.close()
+                setStreaming(false)
+                //One last fetch for the parsed documents
+                queryClient.invalidateQueries({queryKey: ['upload', jobId]})
+            }
+        })
+        return () => {
+            source.close()
+            setStreaming(false)
+        }
+    }, [jobId, enabled, queryClient])
+
     const uploadQuery = useQuery({
         queryKey: ['upload', jobId],
         queryFn: async () => {
-            const response = await fetch(`/api/upload/${jobId}`);
+            const response = await fetch(`/api/upload/${jobId}`, {credentials: 'include'});
             if (!response.ok){
                 throw new Error('Failed to fetch upload results');
             }
             return response.json();
         },
         enabled: enabled && !!jobId,
-        refetchInterval: (data: any) => {
-            if (data?.status === 'complete' || data?.status === 'error'){
+        refetchInterval: (query: any) => {
+            if (streaming || isFinished(query.state.data)){
                 return false;
             }
             return 2000;
@@ -26,4 +60,4 @@ export function useUploadResults( jobId: string, enabled: boolean = false) {
     })
 
     return uploadQuery
-}
\ No newline at end of file
+}